@@ -1,12 +1,29 @@
-from flask import Flask, request, jsonify, session, send_file
+from flask import Flask, request, jsonify, session, send_file, g, has_app_context, Response
 from flask_cors import CORS
 import sqlite3
 import hashlib
 import secrets
 import os
-import requests
-from datetime import datetime
+import db as dbpool
+import migrations
+import canvas_sync
+import changes
+import google_sync
+import microsoft_sync
+import ics
+import ics_import
+import event_records
+import freebusy
+import recurrence
+import search
+import sessions
+import metrics
+from datetime import datetime, timezone
 import hmac
+import base64
+import itertools
+import json
+import time
 
 # Setup Flask app
 # Resolve absolute path to the frontend public directory
@@ -19,12 +36,70 @@ CORS(app, supports_credentials=True, origins=['http://127.0.0.1:3001', 'http://l
 # Database file
 DATABASE = 'calendar.db'
 
+# Columns a client may ask for with ?fields= on the events endpoint
+EVENT_FIELDS = (
+    'id', 'user_id', 'title', 'description', 'due_date', 'source', 'course_name',
+    'canvas_course_id', 'completed', 'reminder_sent', 'external_id',
+    'end_date', 'rrule', 'recurrence_id'
+)
+
+# Largest page the events endpoint will return
+MAX_EVENTS_LIMIT = 1000
+
+# Largest number of items accepted in one batch request
+MAX_BATCH_ITEMS = 5000
+
+# Seconds a client is asked to wait when this process has no room for another change stream
+STREAM_RETRY_AFTER = 30
+
+# Sync state tables that must be reset when a source's events are cleared
+SYNC_STATE_TABLES = {
+    'Canvas': 'canvas_sync_state',
+    'Google': 'google_sync_state',
+    'Microsoft': 'microsoft_sync_state'
+}
+
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    """Get database connection
+
+    Connections come from a shared WAL-mode pool. Inside a request the same
+    connection is reused until it is closed, and anything still open when
+    the app context ends is returned to the pool automatically.
+    """
+    if not has_app_context():
+        return dbpool.get_pool(DATABASE).acquire()
+    conn = g.get('db')
+    if conn is None or conn.closed:
+        conn = g.db = dbpool.get_pool(DATABASE).acquire()
     return conn
 
+@app.teardown_appcontext
+def release_db(exception):
+    """Return the request's database connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+@app.before_request
+def start_timer():
+    """Note when the request started, for the route latency metric"""
+    if metrics.enabled():
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Record the request's latency by route, method and status
+
+    Streamed responses are timed up to their headers.
+    """
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(
+            (request.method, route, str(response.status_code)), time.perf_counter() - started
+        )
+    return response
+
 def init_db():
     """Initialize database tables if they don't exist"""
     db = get_db()
@@ -113,6 +188,9 @@ def init_db():
     ''')
     
     db.commit()
+    
+    # Bring the schema up to date (indexes, natural keys, ...)
+    migrations.migrate(db)
     db.close()
 
 def hash_password(password):
@@ -137,11 +215,101 @@ def generate_2fa_code(secret):
     code = int.from_bytes(hash_bytes[offset:offset+4], 'big') & 0x7FFFFFFF
     return str(code % 1000000).zfill(6)
 
+def start_session(cursor, user_id):
+    """Create a login session and record the login, as part of the caller's transaction"""
+    cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
+    return sessions.create(cursor, user_id, request.remote_addr)
+
+def session_user_id():
+    """User id of the request's login session, None if there is none or it expired
+
+    The token comes from the X-Session-Token header or the session cookie.
+    Lookups go through the session cache, so repeat requests only read the
+    revocation log. They use their own pooled connection, so they never
+    close the one the request is using.
+    """
+    if 'session_user_id' not in g:
+        token = request.headers.get('X-Session-Token') or session.get('sessionToken')
+        g.session_user_id = sessions.resolve(dbpool.get_pool(DATABASE).acquire, token)
+        if g.session_user_id is None and 'sessionToken' in session:
+            session.clear()
+    return g.session_user_id
+
+def get_data_version(user_id):
+    """Get (version, updated_at) of a user's data, (0, None) if never changed"""
+    db = get_db()
+    row = db.execute(
+        'SELECT version, updated_at FROM user_data_versions WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+    db.close()
+    return (row['version'], row['updated_at']) if row else (0, None)
+
+# the syncs bump it too, with every chunk they commit (see pipeline.ChunkWriter)
+bump_data_version = dbpool.bump_data_version
+
+def save_connected_account(cursor, user_id, account_type, access_token, synced_at):
+    """Store a provider token for a user, as part of the caller's transaction"""
+    cursor.execute(
+        'SELECT id FROM connected_accounts WHERE user_id = ? AND account_type = ?',
+        (user_id, account_type)
+    )
+    exists = cursor.fetchone()
+    
+    if exists:
+        cursor.execute(
+            '''UPDATE connected_accounts SET access_token = ?, last_synced_at = ?
+               WHERE user_id = ? AND account_type = ?''',
+            (access_token, synced_at, user_id, account_type)
+        )
+    else:
+        cursor.execute(
+            '''INSERT INTO connected_accounts (user_id, account_type, access_token, last_synced_at)
+               VALUES (?, ?, ?, ?)''',
+            (user_id, account_type, access_token, synced_at)
+        )
+
+def make_etag(kind, user_id, version):
+    """ETag for one representation of a user's data at a given version"""
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f'{kind}-{user_id}-{version}-{query}'
+
+def is_not_modified(etag, updated_at):
+    """Check the request's validators against the current ETag/Last-Modified"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and updated_at is not None:
+        return updated_at <= request.if_modified_since.timestamp()
+    return False
+
+def add_cache_headers(response, etag, updated_at):
+    """Attach validators so clients can revalidate with a conditional GET"""
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, updated_at):
+    """Empty 304 response carrying the current validators"""
+    return add_cache_headers(app.response_class(status=304), etag, updated_at)
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok', 'message': 'VT Calendar API is running'})
 
+# Request, SQL and outbound API timings in Prometheus text format
+# Collection is switched off with METRICS_ENABLED=0
+# Only answered for local requests, or with the METRICS_TOKEN bearer token
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.enabled():
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    if not metrics.allowed(request.remote_addr, request.headers.get('Authorization')):
+        return jsonify({'error': 'Not allowed to read metrics'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # User registration endpoint
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -193,14 +361,15 @@ def login():
         (email, password_hash)
     )
     user = cursor.fetchone()
-    db.close()
     
     # Check if user exists
     if not user:
+        db.close()
         return jsonify({'error': 'Invalid credentials'}), 401
     
     # Check if 2FA is enabled
     if user['two_factor_enabled']:
+        db.close()
         return jsonify({
             'success': True,
             'requires2FA': True,
@@ -209,17 +378,11 @@ def login():
         })
     
     # Create session
-    session_token = generate_session_token()
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute(
-        'UPDATE users SET session_token = ?, last_login = CURRENT_TIMESTAMP WHERE id = ?',
-        (session_token, user['id'])
-    )
+    session_token = start_session(cursor, user['id'])
     db.commit()
     db.close()
     
-    session['userId'] = user['id']
+    session['sessionToken'] = session_token
     session['email'] = user['vt_email']
     
     return jsonify({
@@ -256,15 +419,11 @@ def verify_2fa():
         db.close()
         return jsonify({'error': 'Invalid 2FA code'}), 401
     
-    session_token = generate_session_token()
-    cursor.execute(
-        'UPDATE users SET session_token = ?, last_login = CURRENT_TIMESTAMP WHERE id = ?',
-        (session_token, user_id)
-    )
+    session_token = start_session(cursor, user['id'])
     db.commit()
     db.close()
     
-    session['userId'] = user_id
+    session['sessionToken'] = session_token
     session['email'] = user['vt_email']
     
     return jsonify({
@@ -274,129 +433,781 @@ def verify_2fa():
         'email': user['vt_email']
     })
 
+# Log out, ending the login session everywhere it is used
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    data = request.get_json(silent=True) or {}
+    token = (request.headers.get('X-Session-Token') or data.get('sessionToken')
+             or session.get('sessionToken'))
+    
+    if token:
+        db = get_db()
+        sessions.revoke(db.cursor(), token)
+        db.commit()
+        db.close()
+    session.clear()
+    
+    return jsonify({'success': True})
+
 # Link Canvas account and import courses
+# Only courses and assignments that changed since the last sync are written,
+# pass "full": true to re-import everything
 @app.route('/api/canvas/link', methods=['POST'])
 def link_canvas():
     data = request.json
-    user_id = int(session.get('userId') or data.get('userId') or 0)
+    user_id = int(session_user_id() or data.get('userId') or 0)
     canvas_token = data.get('canvasToken')
     
     if not canvas_token:
         return jsonify({'error': 'Canvas token required'}), 400
     
     try:
-        # Fetch courses from Canvas
-        headers = {'Authorization': f'Bearer {canvas_token}'}
-        courses_response = requests.get(
-            'https://canvas.vt.edu/api/v1/courses?enrollment_type=student&enrollment_role=StudentEnrollment',
-            headers=headers
-        )
-        courses = courses_response.json()
-        
         db = get_db()
         cursor = db.cursor()
-        synced_count = 0
         
-        # Store each course
-        for course in courses:
-            cursor.execute(
-                '''INSERT OR REPLACE INTO canvas_courses 
-                   (user_id, course_id, course_name, course_code, enrolled_date)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (user_id, str(course.get('id')), course.get('name'), 
-                 course.get('course_code'), course.get('created_at'))
-            )
-            synced_count += 1
-            
-            # Get assignments for this course
-            try:
-                assignments_response = requests.get(
-                    f"https://canvas.vt.edu/api/v1/courses/{course.get('id')}/assignments",
-                    headers=headers,
-                    params={'bucket': 'upcoming', 'order_by': 'due_at'}
-                )
-                assignments = assignments_response.json()
-                
-                # Store assignments as calendar events
-                for assignment in assignments:
-                    if assignment.get('due_at'):
-                        cursor.execute(
-                            '''INSERT OR REPLACE INTO calendar_events 
-                               (user_id, title, description, due_date, source, course_name, canvas_course_id)
-                               VALUES (?, ?, ?, ?, 'Canvas', ?, ?)''',
-                            (user_id, assignment.get('name'), 
-                             assignment.get('description', ''),
-                             assignment.get('due_at'),
-                             course.get('name'), str(course.get('id')))
-                        )
-            except Exception as e:
-                print(f"Error fetching assignments for course {course.get('id')}: {e}")
+        # Import courses and assignments, then save the token with the last chunk of writes
+        stats = canvas_sync.sync_canvas(db, user_id, canvas_token, full=bool(data.get('full')))
         
         # Save Canvas token
-        cursor.execute(
-            'SELECT id FROM connected_accounts WHERE user_id = ? AND account_type = ?',
-            (user_id, 'Canvas')
-        )
-        exists = cursor.fetchone()
+        save_connected_account(cursor, user_id, 'Canvas', canvas_token, stats['syncedAt'])
         
-        if exists:
-            cursor.execute(
-                'UPDATE connected_accounts SET access_token = ? WHERE user_id = ? AND account_type = ?',
-                (canvas_token, user_id, 'Canvas')
-            )
-        else:
-            cursor.execute(
-                'INSERT INTO connected_accounts (user_id, account_type, access_token) VALUES (?, ?, ?)',
-                (user_id, 'Canvas', canvas_token)
-            )
+        version = None
+        if stats['coursesChanged'] or stats['assignmentsChanged']:
+            version = bump_data_version(cursor, user_id)
         db.commit()
         db.close()
+        changes.hub.publish(user_id, 'sync.finished', version, provider='Canvas',
+                            changed=version is not None)
         
-        return jsonify({'success': True, 'coursesLinked': len(courses), 'syncedCount': synced_count})
+        return jsonify({
+            'success': True,
+            'coursesLinked': stats['courses'],
+            'syncedCount': stats['courses'],
+            'coursesChanged': stats['coursesChanged'],
+            'coursesSkipped': stats['coursesSkipped'],
+            'assignmentsChanged': stats['assignmentsChanged']
+        })
     except Exception as e:
         print(f"Canvas link error: {e}")
         return jsonify({'error': 'Failed to link Canvas account'}), 500
 
-# Get all calendar events for a user
-@app.route('/api/calendar/events', methods=['GET'])
-def get_events():
-    user_id = int(request.args.get('userId') or session.get('userId') or 0)
+# Link Google account and import calendar events
+# After the first import only the changes since the stored sync token are
+# fetched, pass "full": true to re-import everything
+@app.route('/api/google/link', methods=['POST'])
+def link_google():
+    data = request.json
+    user_id = int(session_user_id() or data.get('userId') or 0)
+    google_token = data.get('googleToken')
+    
+    if not google_token:
+        return jsonify({'error': 'Google token required'}), 400
+    
+    try:
+        db = get_db()
+        cursor = db.cursor()
+        stats = google_sync.sync_google(db, user_id, google_token, full=bool(data.get('full')))
+        save_connected_account(cursor, user_id, 'Google', google_token, stats['syncedAt'])
+        version = bump_data_version(cursor, user_id) if stats['eventsChanged'] else None
+        db.commit()
+        db.close()
+        changes.hub.publish(user_id, 'sync.finished', version, provider='Google',
+                            changed=version is not None)
+        
+        return jsonify({
+            'success': True,
+            'calendarsLinked': stats['calendars'],
+            'eventsChanged': stats['eventsChanged'],
+            'fullSyncs': stats['fullSyncs']
+        })
+    except Exception as e:
+        print(f"Google link error: {e}")
+        return jsonify({'error': 'Failed to link Google account'}), 500
+
+# Sync Google Calendar with the bearer token sent by the web app, or the
+# token stored when the account was linked
+@app.route('/api/google/calendar', methods=['GET'])
+def sync_google_calendar():
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
     
     db = get_db()
     cursor = db.cursor()
+    google_token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not google_token:
+        cursor.execute(
+            'SELECT access_token FROM connected_accounts WHERE user_id = ? AND account_type = ?',
+            (user_id, 'Google')
+        )
+        account = cursor.fetchone()
+        google_token = account['access_token'] if account else None
+    
+    if not google_token:
+        db.close()
+        return jsonify({'error': 'Google account not linked'}), 400
+    
+    try:
+        stats = google_sync.sync_google(db, user_id, google_token)
+        save_connected_account(cursor, user_id, 'Google', google_token, stats['syncedAt'])
+        version = bump_data_version(cursor, user_id) if stats['eventsChanged'] else None
+        db.commit()
+        db.close()
+        changes.hub.publish(user_id, 'sync.finished', version, provider='Google',
+                            changed=version is not None)
+        return jsonify({'success': True, 'count': stats['eventsChanged']})
+    except Exception as e:
+        print(f"Google sync error: {e}")
+        return jsonify({'error': 'Failed to sync Google Calendar'}), 500
+
+# Link Microsoft account and import Outlook calendar events
+# After the first import only the changes since the stored delta links are
+# fetched, pass "full": true to re-import everything
+@app.route('/api/microsoft/link', methods=['POST'])
+def link_microsoft():
+    data = request.json
+    user_id = int(session_user_id() or data.get('userId') or 0)
+    microsoft_token = data.get('microsoftToken')
+    
+    if not microsoft_token:
+        return jsonify({'error': 'Microsoft token required'}), 400
+    
+    try:
+        db = get_db()
+        cursor = db.cursor()
+        stats = microsoft_sync.sync_microsoft(db, user_id, microsoft_token, full=bool(data.get('full')))
+        save_connected_account(cursor, user_id, 'Microsoft', microsoft_token, stats['syncedAt'])
+        version = bump_data_version(cursor, user_id) if stats['eventsChanged'] else None
+        db.commit()
+        db.close()
+        changes.hub.publish(user_id, 'sync.finished', version, provider='Microsoft',
+                            changed=version is not None)
+        
+        return jsonify({
+            'success': True,
+            'calendarsLinked': stats['calendars'],
+            'eventsChanged': stats['eventsChanged'],
+            'fullSyncs': stats['fullSyncs']
+        })
+    except Exception as e:
+        print(f"Microsoft link error: {e}")
+        return jsonify({'error': 'Failed to link Microsoft account'}), 500
+
+def encode_cursor(due_date, event_id):
+    """Encode the position after an event as an opaque page cursor"""
+    raw = json.dumps([due_date, event_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a page cursor back into (due_date, id)"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    due_date, event_id = json.loads(raw)
+    return due_date, int(event_id)
+
+def recurring_rows(cursor, user_id, columns, start, end):
+    """Instances of a user's recurring events with start <= due_date < end
+
+    Masters are expanded lazily (see recurrence.py) and overridden instances
+    replaced by their override rows. Only overrides of an instance in the
+    window, or moved into it, are read. Without a start or an end, instances
+    are listed from the recurrence lookback or up to its horizon.
+    """
+    start = start or recurrence.default_start()
+    end = end or recurrence.default_end()
+    select = ', '.join(dict.fromkeys(
+        columns + ['end_date', 'source', 'external_id', 'rrule', 'exdates', 'tzid']
+    ))
     cursor.execute(
-        'SELECT * FROM calendar_events WHERE user_id = ? ORDER BY due_date ASC',
-        (user_id,)
+        f'SELECT {select} FROM calendar_events WHERE user_id = ? AND rrule IS NOT NULL AND due_date < ?',
+        (user_id, end)
     )
+    masters = cursor.fetchall()
+    # columns include id, so UNION keeps every override once
+    select = ', '.join(dict.fromkeys(columns + ['source', 'master_id', 'recurrence_id']))
+    cursor.execute(
+        f'''SELECT {select} FROM calendar_events
+            WHERE user_id = ? AND master_id IS NOT NULL AND recurrence_id >= ? AND recurrence_id < ?
+            UNION
+            SELECT {select} FROM calendar_events
+            WHERE user_id = ? AND master_id IS NOT NULL AND due_date >= ? AND due_date < ?''',
+        (user_id, start, end, user_id, start, end)
+    )
+    overrides = cursor.fetchall()
+    
+    replaced = {(row['source'], row['master_id'], row['recurrence_id']) for row in overrides}
+    rows = []
+    for master in masters:
+        for instance in recurrence.expand(master['due_date'], master['rrule'], master['tzid'],
+                                          master['exdates'], start, end):
+            if (master['source'], master['external_id'], instance) in replaced:
+                continue
+            end_date = recurrence.instance_end(master['due_date'], master['end_date'], instance)
+            rows.append(dict(master, due_date=instance, end_date=end_date, recurrence_id=instance))
+    for row in overrides:
+        due_date = row['due_date']
+        if due_date and start <= due_date < end:
+            rows.append(dict(row))
+    return rows
+
+def event_sort_key(row):
+    """(due_date, id) order of the events query, NULL due dates first"""
+    return (row['due_date'] is not None, row['due_date'] or '', row['id'])
+
+# Stream the user's change notifications as Server-Sent Events
+# Clients refetch when one arrives instead of polling. A reconnect sends
+# Last-Event-ID (or ?lastEventId=) and gets the notifications it missed, or
+# a "reset" event when they can't be replayed
+@app.route('/api/changes/stream', methods=['GET'])
+def change_stream():
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    version, _ = get_data_version(user_id)
+    if not changes.hub.subscribe(user_id, version):
+        response = jsonify({'error': 'Too many open change streams'})
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response, 503
+    changes.start_poller(get_db)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    response = Response(changes.hub.stream(user_id, last_event_id), mimetype='text/event-stream')
+    response.call_on_close(lambda: changes.hub.unsubscribe(user_id))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the stream
+    return response
+
+# Get calendar events for a user
+# Optional query parameters:
+#   start, end  only events with start <= due_date < end
+#   limit       page size, a nextCursor is returned when more rows exist
+#   cursor      nextCursor from the previous page
+#   fields      comma separated columns to return, e.g. id,title,due_date,source
+@app.route('/api/calendar/events', methods=['GET'])
+def get_events():
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
+    start = request.args.get('start')
+    end = request.args.get('end')
+    limit = request.args.get('limit', type=int)
+    cursor_arg = request.args.get('cursor')
+    fields_arg = request.args.get('fields')
+    
+    # Nothing changed since the client's copy, skip the events table entirely
+    version, updated_at = get_data_version(user_id)
+    etag = make_etag('events', user_id, version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
+    
+    # Only select the requested columns (id and due_date are needed for paging)
+    fields = list(EVENT_FIELDS)
+    if fields_arg:
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in EVENT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    columns = list(dict.fromkeys(fields + ['id', 'due_date']))
+    
+    # Recurring masters and their overrides are expanded separately below
+    query = f"""SELECT {', '.join(columns)} FROM calendar_events
+                WHERE user_id = ? AND rrule IS NULL AND master_id IS NULL"""
+    params = [user_id]
+    if start:
+        query += ' AND due_date >= ?'
+        params.append(start)
+    if end:
+        query += ' AND due_date < ?'
+        params.append(end)
+    
+    # Keyset pagination on (due_date, id), NULL due dates sort first
+    after = None
+    if cursor_arg:
+        try:
+            after_date, after_id = decode_cursor(cursor_arg)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        after = (after_date is not None, after_date or '', after_id)
+        if after_date is None:
+            query += ' AND (due_date IS NOT NULL OR id > ?)'
+            params.append(after_id)
+        else:
+            query += ' AND (due_date > ? OR (due_date = ? AND id > ?))'
+            params.extend([after_date, after_date, after_id])
+    
+    query += ' ORDER BY due_date ASC, id ASC'
+    if limit is not None:
+        limit = max(1, min(limit, MAX_EVENTS_LIMIT))
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    
+    # Merge in the instances of recurring events, in the same order
+    instances = [r for r in recurring_rows(cursor, user_id, columns, start, end)
+                 if after is None or event_sort_key(r) > after]
+    db.close()
+    if instances:
+        rows = sorted(list(rows) + instances, key=event_sort_key)
+        if limit is not None:
+            rows = rows[:limit + 1]
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['due_date'], rows[-1]['id'])
+    
     # Convert rows to dictionaries
-    events = [dict(row) for row in cursor.fetchall()]
+    events = [{f: row[f] for f in fields} for row in rows]
+    
+    response = jsonify({'events': events, 'nextCursor': next_cursor})
+    return add_cache_headers(response, etag, updated_at)
+
+# Search a user's events by title, description and course name, best match first
+# Query parameters:
+#   q           search text, every word must match (required)
+#   prefix      0 to match whole words only, by default "proj" finds "Project"
+#   source      comma separated sources to search, e.g. Canvas,Google
+#   start, end  only events with start <= due_date < end
+#   limit       most results to return, at most search.MAX_LIMIT
+#   fields      comma separated columns to return, as for /api/calendar/events
+@app.route('/api/calendar/search', methods=['GET'])
+def search_calendar():
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
+    text = request.args.get('q', '')
+    fields_arg = request.args.get('fields')
+    sources = [s.strip() for s in request.args.get('source', '').split(',') if s.strip()]
+    limit = request.args.get('limit', 20, type=int)
+    prefix = request.args.get('prefix', '1') != '0'
+    
+    if search.match_expression(text) is None:
+        return jsonify({'error': 'Search text required'}), 400
+    fields = list(EVENT_FIELDS)
+    if fields_arg:
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in EVENT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    version, updated_at = get_data_version(user_id)
+    etag = make_etag('search', user_id, version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
+    
+    db = get_db()
+    rows = search.search_events(db.cursor(), user_id, text, fields, sources,
+                                request.args.get('start'), request.args.get('end'), limit, prefix)
     db.close()
     
-    return jsonify({'events': events})
+    response = jsonify({'events': [dict(row) for row in rows]})
+    return add_cache_headers(response, etag, updated_at)
+
+# Free/busy time and conflicting events from every source
+# Optional query parameters:
+#   start, end  window, defaults to the current hour and 30 days later
+#   hours       also find the first free slot of this many hours in the window
+#   before      deadline that slot must end by, defaults to end
+#   limit       most conflicts to return, moreConflicts is set when there are more
+@app.route('/api/calendar/freebusy', methods=['GET'])
+def free_busy():
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
+    default_start, default_end = freebusy.default_window()
+    before = request.args.get('before')
+    start = request.args.get('start') or default_start
+    end = request.args.get('end') or before or default_end
+    hours = request.args.get('hours', type=float)
+    limit = max(1, min(request.args.get('limit', MAX_EVENTS_LIMIT, type=int), MAX_EVENTS_LIMIT))
+    
+    window = (freebusy.to_epoch(start, dates=True), freebusy.to_epoch(end, dates=True))
+    deadline = freebusy.to_epoch(before, dates=True) if before else window[1]
+    if None in window or deadline is None or window[0] >= window[1]:
+        return jsonify({'error': 'start, end and before must be times, with start before end'}), 400
+    if hours is not None and hours <= 0:
+        return jsonify({'error': 'hours must be positive'}), 400
+    
+    # The default window moves every hour, so it is part of the ETag
+    version, updated_at = get_data_version(user_id)
+    etag = make_etag(f'freebusy-{start}', user_id, version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
+    
+    # events without an end take the default duration, so one that started
+    # up to that long before the window still runs into it
+    lower = freebusy.format_epoch(window[0])
+    lookback = freebusy.format_epoch(window[0] - freebusy.DEFAULT_MINUTES * 60)
+    upper = freebusy.format_epoch(window[1])
+    
+    def load_rows():
+        db = get_db()
+        cursor = db.cursor()
+        columns = ['id', 'title', 'due_date', 'end_date', 'source', 'course_name']
+        cursor.execute(
+            f"""SELECT {', '.join(columns)} FROM calendar_events
+                WHERE user_id = ? AND rrule IS NULL AND master_id IS NULL AND due_date < ?
+                  AND (end_date >= ? OR (end_date IS NULL AND due_date >= ?))""",
+            (user_id, upper, lower, lookback)
+        )
+        rows = cursor.fetchall() + recurring_rows(cursor, user_id, columns, lookback, upper)
+        db.close()
+        return rows
+    
+    index = freebusy.cache.get((user_id, version, start, end), load_rows)
+    
+    def event(row):
+        return {k: row[k] for k in ('id', 'title', 'due_date', 'end_date', 'source', 'course_name')}
+    
+    def span(pair):
+        return {'start': freebusy.format_epoch(pair[0]), 'end': freebusy.format_epoch(pair[1])}
+    
+    conflicts = list(itertools.islice(index.conflicts(), limit + 1))
+    result = {
+        'start': start,
+        'end': end,
+        'busy': [span(b) for b in index.busy(*window)],
+        'free': [span(f) for f in index.free(*window)],
+        'conflicts': [
+            {'events': [event(a), event(b)], **span((overlap_start, overlap_end))}
+            for a, b, overlap_start, overlap_end in conflicts[:limit]
+        ],
+        'moreConflicts': len(conflicts) > limit,
+    }
+    if hours is not None:
+        slot = index.first_free(hours * 3600, window[0], min(deadline, window[1]))
+        result['firstFree'] = span(slot) if slot else None
+    
+    return add_cache_headers(jsonify(result), etag, updated_at)
 
 # Add a manual event (not from Canvas/Google/etc)
+# Pass rrule (and timeZone) to make it repeat, e.g. "FREQ=WEEKLY;BYDAY=TU,TH"
 @app.route('/api/calendar/events', methods=['POST'])
 def add_event():
     data = request.json
-    user_id = int(data.get('userId') or session.get('userId') or 0)
+    user_id = int(data.get('userId') or session_user_id() or 0)
     
     db = get_db()
     cursor = db.cursor()
+    record = event_records.manual_event(data)
     cursor.execute(
-        '''INSERT INTO calendar_events (user_id, title, description, due_date, source)
-           VALUES (?, ?, ?, ?, 'Manual')''',
-        (user_id, data.get('title'), data.get('description'), data.get('dueDate'))
+        '''INSERT INTO calendar_events
+           (user_id, title, description, due_date, source, rrule, tzid, content_hash)
+           VALUES (?, ?, ?, ?, 'Manual', ?, ?, ?)''',
+        (user_id, record.title, record.description, record.due_date,
+         record.rrule, record.tzid, record.content_hash)
     )
-    db.commit()
     event_id = cursor.lastrowid
+    version = bump_data_version(cursor, user_id)
+    db.commit()
     db.close()
+    changes.hub.publish(user_id, 'event.added', version, ids=[event_id])
     
     return jsonify({'success': True, 'id': event_id})
 
+def owned_event_ids(cursor, user_id, ids):
+    """Subset of event ids that exist and belong to the user"""
+    owned = set()
+    ids = list(ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor.execute(
+            f'SELECT id FROM calendar_events WHERE user_id = ? AND id IN ({", ".join("?" * len(chunk))})',
+            [user_id] + chunk
+        )
+        owned.update(row['id'] for row in cursor.fetchall())
+    return owned
+
+def batch_error(data):
+    """Why a batch request body is malformed, None if it's well formed"""
+    if not isinstance(data, dict):
+        return 'Body must be a JSON object'
+    for key in ('create', 'update', 'delete', 'complete'):
+        if not isinstance(data.get(key) or [], list):
+            return f'{key} must be a list'
+    for key in ('create', 'update'):
+        if not all(isinstance(item, dict) for item in data.get(key) or []):
+            return f'{key} items must be objects'
+    updates = data.get('update') or []
+    completes = [c if isinstance(c, dict) else {'id': c} for c in data.get('complete') or []]
+    
+    # True would match event 1 and a list isn't hashable
+    ids = [item.get('id') for item in updates + completes] + (data.get('delete') or [])
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return 'Event ids must be integers'
+    
+    # "no" is truthy, so only real booleans mark events completed
+    flags = [u.get('completed') for u in updates if u.get('completed') is not None]
+    flags += [c['completed'] for c in completes if 'completed' in c]
+    if not all(isinstance(f, bool) for f in flags):
+        return 'completed must be true or false'
+    
+    sources = data.get('deleteSource')
+    if sources:
+        sources = sources if isinstance(sources, list) else [sources]
+        if not all(isinstance(s, str) and s for s in sources):
+            return 'deleteSource must be a source name or a list of them'
+    if not isinstance(data.get('deleteAll', False), bool):
+        return 'deleteAll must be true or false'
+    return None
+
+# Apply many event changes in one request and one transaction
+# Body keys (all optional):
+#   create        [{title, description, dueDate}]  new manual events
+#   update        [{id, title, description, dueDate, completed}]  missing keys keep their value
+#   delete        [id]
+#   complete      [id] or [{id, completed}]
+#   deleteSource  source name, list of names, or "*" for every synced source
+#   deleteAll     true to delete every event, including manual and imported ones
+@app.route('/api/calendar/events/batch', methods=['POST'])
+def batch_events():
+    data = request.json or {}
+    error = batch_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    user_id = int(data.get('userId') or session_user_id() or 0)
+    creates = data.get('create') or []
+    updates = data.get('update') or []
+    deletes = data.get('delete') or []
+    completes = [c if isinstance(c, dict) else {'id': c, 'completed': True}
+                 for c in data.get('complete') or []]
+    delete_source = data.get('deleteSource')
+    delete_all = data.get('deleteAll', False)
+    
+    if len(creates) + len(updates) + len(deletes) + len(completes) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+    
+    # Every id referenced by update/delete/complete, checked for ownership at once
+    referenced = [item['id'] for item in updates + completes] + deletes
+    
+    db = get_db()
+    cursor = db.cursor()
+    results = {}
+    
+    try:
+        owned = owned_event_ids(cursor, user_id, referenced)
+        
+        def outcome(event_id):
+            if event_id in owned:
+                return {'id': event_id, 'success': True}
+            return {'id': event_id, 'success': False, 'error': 'Event not found'}
+        
+        if delete_all:
+            cursor.execute('DELETE FROM calendar_events WHERE user_id = ?', (user_id,))
+            results['deleteAll'] = {'deleted': cursor.rowcount}
+            cleared = list(SYNC_STATE_TABLES)
+        elif delete_source:
+            sources = delete_source if isinstance(delete_source, list) else [delete_source]
+            if '*' in sources:
+                # Events added in the app or imported from files stay
+                sources = list(SYNC_STATE_TABLES)
+            cursor.execute(
+                f'DELETE FROM calendar_events WHERE user_id = ? AND source IN ({", ".join("?" * len(sources))})',
+                [user_id] + sources
+            )
+            results['deleteSource'] = {'sources': sources, 'deleted': cursor.rowcount}
+            cleared = sources
+        
+        if delete_all or delete_source:
+            # Forget sync watermarks so the next sync imports everything again
+            for source in cleared:
+                if source in SYNC_STATE_TABLES:
+                    cursor.execute(f'DELETE FROM {SYNC_STATE_TABLES[source]} WHERE user_id = ?', (user_id,))
+        
+        if deletes:
+            cursor.executemany(
+                'DELETE FROM calendar_events WHERE id = ? AND user_id = ?',
+                [(i, user_id) for i in deletes if i in owned]
+            )
+            results['delete'] = [outcome(i) for i in deletes]
+        
+        if updates:
+            # Due dates are stored normalized, like every other write path
+            due_dates = [event_records.timestamp(u.get('dueDate')) for u in updates]
+            cursor.executemany(
+                '''UPDATE calendar_events SET
+                       title = COALESCE(?, title),
+                       description = COALESCE(?, description),
+                       reminder_sent = CASE WHEN ? IS NULL OR ? IS due_date
+                                       THEN reminder_sent ELSE 0 END,
+                       due_date = COALESCE(?, due_date),
+                       completed = COALESCE(?, completed)
+                   WHERE id = ? AND user_id = ?''',
+                [(u.get('title'), u.get('description'), due, due, due, u.get('completed'),
+                  u['id'], user_id)
+                 for u, due in zip(updates, due_dates) if u.get('id') in owned]
+            )
+            results['update'] = [outcome(u.get('id')) for u in updates]
+        
+        if completes:
+            cursor.executemany(
+                'UPDATE calendar_events SET completed = ? WHERE id = ? AND user_id = ?',
+                [(bool(c.get('completed', True)), c['id'], user_id)
+                 for c in completes if c.get('id') in owned]
+            )
+            results['complete'] = [outcome(c.get('id')) for c in completes]
+        
+        if creates:
+            records = [event_records.manual_event(c) for c in creates]
+            cursor.executemany(
+                '''INSERT INTO calendar_events
+                   (user_id, title, description, due_date, source, rrule, tzid, content_hash)
+                   VALUES (?, ?, ?, ?, 'Manual', ?, ?, ?)''',
+                [(user_id, r.title, r.description, r.due_date, r.rrule, r.tzid, r.content_hash)
+                 for r in records]
+            )
+            # Ids are handed out consecutively inside the transaction
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            first_id = last_id - len(creates) + 1
+            results['create'] = [{'index': i, 'success': True, 'id': first_id + i}
+                                 for i in range(len(creates))]
+        
+        version = bump_data_version(cursor, user_id)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        db.close()
+        print(f"Batch update error: {e}")
+        return jsonify({'error': 'Failed to apply batch'}), 500
+    
+    db.close()
+    
+    # One notification per kind of change, with the ids that changed
+    def changed_ids(key):
+        return [r['id'] for r in results.get(key, []) if r['success']]
+    if creates:
+        changes.hub.publish(user_id, 'event.added', version, ids=changed_ids('create'))
+    if updates or completes:
+        changes.hub.publish(user_id, 'event.updated', version,
+                            ids=changed_ids('update') + changed_ids('complete'))
+    if deletes or delete_source or delete_all:
+        changes.hub.publish(user_id, 'event.deleted', version, ids=changed_ids('delete'),
+                            sources=results.get('deleteSource', {}).get('sources', []),
+                            all=delete_all)
+    return jsonify({'success': True, 'results': results})
+
+# Get (or create) the user's iCalendar subscription feed URL
+# POST issues a new token, which invalidates the old URL
+@app.route('/api/calendar/feed', methods=['GET', 'POST'])
+def calendar_feed():
+    data = request.json if request.method == 'POST' else request.args
+    user_id = int((data or {}).get('userId') or session_user_id() or 0)
+    
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('SELECT token FROM calendar_feeds WHERE user_id = ?', (user_id,))
+    feed = cursor.fetchone()
+    
+    if feed and request.method == 'GET':
+        token = feed['token']
+    else:
+        token = generate_session_token()
+        cursor.execute(
+            '''INSERT INTO calendar_feeds (user_id, token) VALUES (?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET token = excluded.token,
+                   created_at = CURRENT_TIMESTAMP''',
+            (user_id, token)
+        )
+        db.commit()
+    db.close()
+    
+    return jsonify({'success': True, 'url': f'{request.host_url}api/calendar/{token}.ics'})
+
+# iCalendar subscription feed, optionally limited with ?start=&end=
+# The document is streamed straight from the cursor, so memory use doesn't
+# grow with the size of the calendar
+@app.route('/api/calendar/<token>.ics', methods=['GET'])
+def calendar_ics(token):
+    db = get_db()
+    feed = db.execute(
+        '''SELECT f.user_id, v.version, v.updated_at FROM calendar_feeds f
+           LEFT JOIN user_data_versions v ON v.user_id = f.user_id
+           WHERE f.token = ?''',
+        (token,)
+    ).fetchone()
+    db.close()
+    if not feed:
+        return jsonify({'error': 'Feed not found'}), 404
+    
+    user_id = feed['user_id']
+    version, updated_at = feed['version'] or 0, feed['updated_at']
+    etag = make_etag('ics', user_id, version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
+    
+    # Recurring events are sent as their master with an RRULE plus override
+    # instances, which need the master's row id for their UID
+    query = '''SELECT e.id, e.title, e.description, e.due_date, e.source, e.course_name,
+                      e.rrule, e.exdates, e.tzid, e.recurrence_id, m.id AS master_row_id
+               FROM calendar_events e
+               LEFT JOIN calendar_events m ON e.master_id IS NOT NULL AND m.user_id = e.user_id
+                    AND m.source = e.source AND m.external_id = e.master_id
+               WHERE e.user_id = ?'''
+    params = [user_id]
+    if request.args.get('start'):
+        query += ' AND (COALESCE(e.due_date, e.recurrence_id) >= ? OR e.rrule IS NOT NULL)'
+        params.append(request.args['start'])
+    if request.args.get('end'):
+        query += ' AND COALESCE(e.due_date, e.recurrence_id) < ?'
+        params.append(request.args['end'])
+    query += ' ORDER BY e.due_date ASC'
+    
+    def generate():
+        # A connection of its own, the request's is released before streaming ends
+        conn = dbpool.get_pool(DATABASE).acquire()
+        try:
+            yield ics.calendar_header('VT Calendar')
+            stamp = ics.timestamp()
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(200)
+                if not rows:
+                    break
+                yield ''.join(ics.format_event(row, stamp) for row in rows)
+            yield ics.calendar_footer()
+        finally:
+            conn.close()
+    
+    response = Response(generate(), mimetype='text/calendar')
+    response.headers['Content-Disposition'] = 'inline; filename="vt-calendar.ics"'
+    return add_cache_headers(response, etag, updated_at)
+
+# Import an .ics file, sent as multipart field "file" or as the raw body
+# The file is parsed line by line and written in chunks, so large
+# department calendars import in bounded memory
+@app.route('/api/calendar/import', methods=['POST'])
+def import_calendar():
+    user_id = int(request.args.get('userId') or request.form.get('userId')
+                  or session_user_id() or 0)
+    source = request.args.get('source') or request.form.get('source') or 'Import'
+    
+    upload = request.files.get('file')
+    stream = ics_import.open_text(upload.stream if upload else request.stream)
+    
+    db = get_db()
+    try:
+        stats = ics_import.import_ics(db, user_id, stream, source)
+    except sqlite3.Error as e:
+        db.rollback()
+        db.close()
+        print(f"Calendar import error: {e}")
+        return jsonify({'error': 'Failed to import calendar'}), 500
+    
+    db.close()
+    
+    # import_ics bumped the data version with every chunk it changed
+    version = get_data_version(user_id)[0] if stats['changed'] or stats['deleted'] else None
+    changes.hub.publish(user_id, 'sync.finished', version, provider=source,
+                        changed=version is not None)
+    
+    return jsonify({'success': True, **stats})
+
 # Get user settings
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
-    user_id = int(request.args.get('userId') or session.get('userId') or 0)
+    user_id = int(request.args.get('userId') or session_user_id() or 0)
+    
+    version, updated_at = get_data_version(user_id)
+    etag = make_etag('settings', user_id, version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
     
     db = get_db()
     cursor = db.cursor()
@@ -411,13 +1222,14 @@ def get_settings():
         settings = cursor.fetchone()
     
     db.close()
-    return jsonify({'settings': dict(settings) if settings else {}})
+    response = jsonify({'settings': dict(settings) if settings else {}})
+    return add_cache_headers(response, etag, updated_at)
 
 # Update user settings
 @app.route('/api/settings', methods=['PUT'])
 def update_settings():
     data = request.json
-    user_id = int(data.get('userId') or session.get('userId') or 0)
+    user_id = int(data.get('userId') or session_user_id() or 0)
     
     db = get_db()
     cursor = db.cursor()
@@ -450,8 +1262,10 @@ def update_settings():
              data.get('reminder_before_hours'), data.get('reminder_before_minutes'),
              data.get('privacy_mode'), data.get('data_sharing'))
         )
+    version = bump_data_version(cursor, user_id)
     db.commit()
     db.close()
+    changes.hub.publish(user_id, 'settings.updated', version)
     
     return jsonify({'success': True})
 
@@ -476,6 +1290,9 @@ if __name__ == '__main__':
     # Initialize database tables
     init_db()
     
+    # Delete expired login sessions in the background
+    sessions.start_sweeper(get_db)
+    
     # Get port and host from environment or use defaults
     port = int(os.environ.get('PORT', 3001))
     host = os.environ.get('HOST', '127.0.0.1')
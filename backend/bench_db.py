@@ -0,0 +1,167 @@
+"""Benchmark read latency while Canvas-style syncs are writing.
+
+Runs the same workload twice against a scratch database: once the old way
+(a fresh `sqlite3.connect` per query with the default rollback journal) and
+once through the WAL connection pool in `db.py`. Writer threads repeatedly
+insert a batch of assignments in one transaction, the way `link_canvas`
+does, while reader threads run the events query from `get_events`.
+
+Usage:
+    python bench_db.py [--seconds 5] [--readers 8] [--writers 2] [--batch 200]
+
+Prints one JSON object per mode with read p50/p95/p99 in milliseconds.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db as dbpool
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS calendar_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        title TEXT,
+        description TEXT,
+        due_date DATETIME,
+        source TEXT,
+        course_name TEXT,
+        canvas_course_id TEXT,
+        completed BOOLEAN DEFAULT 0,
+        reminder_sent BOOLEAN DEFAULT 0
+    )
+'''
+
+USERS = 50
+
+
+def legacy_connect(path):
+    """Connection the way get_db() used to open it."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def run(mode, path, seconds, readers, writers, batch):
+    """Run one benchmark mode and return its summary."""
+    if mode == "pooled":
+        pool = dbpool.get_pool(path)
+        acquire = pool.acquire
+    else:
+        def acquire():
+            return legacy_connect(path)
+
+    stop = threading.Event()
+    latencies = []
+    errors = {"read": 0, "write": 0}
+    commits = [0]
+    lock = threading.Lock()
+
+    def reader(n):
+        local = []
+        user_id = n % USERS
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn = acquire()
+            try:
+                conn.execute(
+                    'SELECT * FROM calendar_events WHERE user_id = ? ORDER BY due_date ASC',
+                    (user_id,)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                with lock:
+                    errors["read"] += 1
+                continue
+            finally:
+                conn.close()
+            local.append((time.perf_counter() - start) * 1000)
+            user_id = (user_id + 1) % USERS
+        with lock:
+            latencies.extend(local)
+
+    def writer(n):
+        user_id = n
+        while not stop.is_set():
+            rows = [
+                (user_id, f"Assignment {i}", "x" * 500, f"2030-01-{i % 28 + 1:02d}T23:59:00Z",
+                 "Canvas", "Course", "1")
+                for i in range(batch)
+            ]
+            conn = acquire()
+            try:
+                cursor = conn.cursor()
+                for row in rows:
+                    cursor.execute(
+                        '''INSERT INTO calendar_events
+                           (user_id, title, description, due_date, source, course_name, canvas_course_id)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        row
+                    )
+                conn.commit()
+                with lock:
+                    commits[0] += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    errors["write"] += 1
+            finally:
+                # a failed write is rolled back, by the pool or by closing
+                conn.close()
+            user_id = (user_id + writers) % USERS
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "reads": len(latencies),
+        "sync_commits": commits[0],
+        "read_errors": errors["read"],
+        "write_errors": errors["write"],
+        "read_p50_ms": round(percentile(latencies, 50), 3),
+        "read_p95_ms": round(percentile(latencies, 95), 3),
+        "read_p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    for mode in ("legacy", "pooled"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            conn = legacy_connect(path)
+            conn.execute(SCHEMA)
+            conn.commit()
+            conn.close()
+            result = run(mode, path, args.seconds, args.readers, args.writers, args.batch)
+            if mode == "pooled":
+                dbpool.get_pool(path).close_all()
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Adaptive concurrency limits for Canvas API calls.
+
+Canvas throttles each access token with a leaky bucket. Every response
+carries `X-Request-Cost` and `X-Rate-Limit-Remaining`, every request that
+is still in flight holds back extra quota, and an empty bucket is answered
+with 403 "Rate Limit Exceeded". When many students sync at once (the
+scheduler at semester start, or a burst of `link_canvas` calls), fixed
+thread pools run straight into that.
+
+`CanvasLimiter` caps how many requests run at once, both per token and
+for the whole process, and resizes both caps AIMD-style from those
+headers:
+
+- every healthy response adds 1/limit, so a limit grows by about one per
+  round of requests
+- a response whose remaining quota, less `X-Request-Cost` for each request
+  of the token still in flight, is under LOW_WATER halves the token's
+  limit, before Canvas starts refusing
+- a throttled response halves the token's limit and the global one
+
+Each limit is halved at most once per DECREASE_INTERVAL, since the
+responses already in flight report the same congestion. A throttled
+request waits with backoff and is queued again, up to THROTTLE_RETRIES
+times, instead of failing the sync.
+
+Requests over a limit wait in a queue per token, and free slots go to
+those queues round-robin. A student with 12 courses can't starve one
+with 2, and one throttled token doesn't hold up the others.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import http_client
+import metrics
+
+# most Canvas requests in flight for the whole process, and for one token
+MAX_IN_FLIGHT = int(os.environ.get("CANVAS_MAX_IN_FLIGHT", 32))
+TOKEN_MAX_IN_FLIGHT = int(os.environ.get("CANVAS_TOKEN_MAX_IN_FLIGHT", 8))
+
+# limit a token starts at
+TOKEN_INITIAL = int(os.environ.get("CANVAS_TOKEN_INITIAL_IN_FLIGHT", 4))
+
+# quota left after the in-flight requests below which a token's limit is halved
+LOW_WATER = float(os.environ.get("CANVAS_LOW_WATER", 150))
+
+# times a throttled request is queued again before the 403 is returned
+THROTTLE_RETRIES = int(os.environ.get("CANVAS_THROTTLE_RETRIES", 5))
+
+# seconds between two decreases of the same limit
+DECREASE_INTERVAL = 1.0
+
+# idle token states kept, so a returning token keeps what it learned
+MAX_TOKENS = 10000
+
+
+class Window:
+    """AIMD limit and in-flight count of one token, or of the process."""
+
+    def __init__(self, limit, maximum):
+        self.limit = float(limit)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.waiters = deque()
+
+    def has_room(self):
+        return self.in_flight < max(1, int(self.limit))
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def decrease(self, now):
+        if now - self.last_decrease >= DECREASE_INTERVAL:
+            self.limit = max(1.0, self.limit / 2)
+            self.last_decrease = now
+
+
+def header_number(resp, name):
+    """Float value of a numeric response header, None if missing or malformed."""
+    try:
+        return float(resp.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_throttled(resp):
+    """Whether Canvas refused a request for going over the rate limit."""
+    return resp.status_code == 403 and "Rate Limit Exceeded" in resp.text
+
+
+class CanvasLimiter:
+    """Per-token and global AIMD concurrency limits with fair queueing."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, token_max=TOKEN_MAX_IN_FLIGHT,
+                 token_initial=TOKEN_INITIAL):
+        self.token_max = token_max
+        self.token_initial = min(token_initial, token_max)
+        self.total = Window(max_in_flight, max_in_flight)
+        self._tokens = OrderedDict()  # key -> Window, least recently used first
+        self._ready = OrderedDict()  # keys with waiters, in round-robin order
+        self._lock = threading.Lock()
+
+    def _window(self, key):
+        window = self._tokens.get(key)
+        if window is None:
+            window = self._tokens[key] = Window(self.token_initial, self.token_max)
+        self._tokens.move_to_end(key)
+        return window
+
+    def _start(self, window):
+        window.in_flight += 1
+        self.total.in_flight += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting tokens, round-robin. Called with the lock held."""
+        while self._ready and self.total.has_room():
+            for key in self._ready:
+                window = self._tokens[key]
+                if window.has_room():
+                    break
+            else:
+                return  # every waiting token is at its own limit
+            self._start(window)
+            window.waiters.popleft().set()
+            if window.waiters:
+                self._ready.move_to_end(key)
+            else:
+                del self._ready[key]
+
+    def acquire(self, key):
+        """Block until a request for `key` may start."""
+        with self._lock:
+            window = self._window(key)
+            if not window.waiters and window.has_room() and self.total.has_room():
+                self._start(window)
+                return
+            waiter = threading.Event()
+            window.waiters.append(waiter)
+            self._ready.setdefault(key, None)
+        started = time.perf_counter()
+        waiter.wait()
+        if metrics.enabled():
+            metrics.canvas_queue_seconds.observe((), time.perf_counter() - started)
+
+    def release(self, key, resp=None):
+        """Finish a request for `key`, adjusting the limits from its response."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._window(key)
+            window.in_flight -= 1
+            self.total.in_flight -= 1
+            if resp is not None:
+                remaining = header_number(resp, "X-Rate-Limit-Remaining")
+                cost = header_number(resp, "X-Request-Cost") or 0.0
+                if is_throttled(resp):
+                    window.decrease(now)
+                    self.total.decrease(now)
+                elif remaining is not None and remaining - window.in_flight * cost < LOW_WATER:
+                    window.decrease(now)
+                elif resp.status_code < 400:
+                    window.increase()
+                    self.total.increase()
+            self._dispatch()
+            self._evict()
+
+    def _evict(self):
+        while len(self._tokens) > MAX_TOKENS:
+            key, window = next(iter(self._tokens.items()))
+            if window.in_flight or window.waiters:
+                return
+            del self._tokens[key]
+
+    def get(self, url, headers=None, **kwargs):
+        """GET a Canvas URL through `http_client` within the token's limits.
+
+        The token is taken from the Authorization header. Throttled requests
+        are retried with backoff, re-entering the queue each time.
+        """
+        key = (headers or {}).get("Authorization", "")
+        attempt = 0
+        while True:
+            self.acquire(key)
+            resp = None
+            try:
+                resp = http_client.get(url, headers=headers, **kwargs)
+            finally:
+                self.release(key, resp)
+            if not is_throttled(resp):
+                return resp
+            if metrics.enabled():
+                metrics.canvas_throttled.inc()
+            if attempt >= THROTTLE_RETRIES:
+                return resp
+            resp.close()
+            time.sleep(http_client._backoff_delay(attempt))
+            attempt += 1
+
+
+limiter = CanvasLimiter()
@@ -0,0 +1,232 @@
+"""Incremental Canvas assignment sync.
+
+`sync_canvas` imports a user's Canvas courses and upcoming assignments into
+`calendar_events`. Rather than rewriting everything on every sync, it keeps
+per-course watermarks in `canvas_sync_state`:
+
+- the ETag and page count of the last assignments response. Single-page
+  courses are re-requested with `If-None-Match`, and a 304 skips the course.
+- the newest assignment `updated_at` seen. Only assignments updated after it
+  are written back to the database, and of those only the ones whose
+  content hash changed (see `event_records`).
+
+Courses are fetched in parallel, and each page of assignments is filtered,
+normalized and written as it arrives (see `pipeline`), so memory use
+doesn't grow with the number of courses or assignments. Every request goes
+through `canvas_limiter`, which keeps the number in flight per token and
+overall under what Canvas's rate limit allows.
+Pass `full=True` to ignore the watermarks and re-import everything.
+"""
+import os
+from datetime import datetime, timezone
+
+import db as dbpool
+import event_records
+import pipeline
+from canvas_limiter import limiter
+
+# define url of VT Canvas domain, overridable to point at a local fake
+BASE_URL = os.environ.get("CANVAS_BASE_URL", "https://canvas.vt.edu")
+
+# max number of courses fetched in parallel
+MAX_WORKERS = int(os.environ.get("CANVAS_MAX_WORKERS", 8))
+
+# page size requested from Canvas, large enough that most courses fit in one
+PER_PAGE = 100
+
+
+def fetch_pages(url, headers, params=None):
+    """Yield each page of a paginated Canvas endpoint, following `Link: rel=next`."""
+    while url:
+        resp = limiter.get(url, headers=headers, params=params)
+        resp.raise_for_status()
+        yield resp.json()
+        url = resp.links.get("next", {}).get("url")
+        params = None  # the next link already carries the query string
+
+
+def fetch_courses(headers):
+    """Yield the courses the user is enrolled in as a student."""
+    url = f"{BASE_URL}/api/v1/courses"
+    params = {
+        "enrollment_type": "student",
+        "enrollment_role": "StudentEnrollment",
+        "per_page": PER_PAGE,
+    }
+    for page in fetch_pages(url, headers, params):
+        yield from page
+
+
+def fetch_course_assignments(course_id, headers, state=None):
+    """Yield a course's upcoming assignments a page at a time, as (assignments, etag).
+
+    Yields nothing when Canvas reports the course unchanged since `state`.
+    The ETag is the first page's.
+    """
+    url = f"{BASE_URL}/api/v1/courses/{course_id}/assignments"
+    params = {"bucket": "upcoming", "order_by": "due_at", "per_page": PER_PAGE}
+
+    # a 304 on the first page only proves nothing changed if there is no second page
+    request_headers = dict(headers)
+    if state and state["etag"] and state["pages"] == 1:
+        request_headers["If-None-Match"] = state["etag"]
+
+    resp = limiter.get(url, headers=request_headers, params=params)
+    if resp.status_code == 304:
+        return
+    resp.raise_for_status()
+
+    etag = resp.headers.get("ETag")
+    while True:
+        yield resp.json(), etag
+        next_url = resp.links.get("next", {}).get("url")
+        if not next_url:
+            return
+        resp = limiter.get(next_url, headers=headers)
+        resp.raise_for_status()
+
+
+def load_state(cursor, user_id):
+    """Per-course watermarks for a user, keyed by Canvas course id."""
+    cursor.execute(
+        'SELECT course_id, etag, pages, max_updated_at FROM canvas_sync_state WHERE user_id = ?',
+        (user_id,)
+    )
+    return {row["course_id"]: dict(row) for row in cursor.fetchall()}
+
+
+SAVE_COURSE = '''
+    INSERT INTO canvas_courses
+    (user_id, course_id, course_name, course_code, enrolled_date)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, course_id) DO UPDATE SET
+        course_name = excluded.course_name,
+        course_code = excluded.course_code,
+        enrolled_date = excluded.enrolled_date
+    WHERE course_name IS NOT excluded.course_name
+       OR course_code IS NOT excluded.course_code
+       OR enrolled_date IS NOT excluded.enrolled_date
+'''
+
+# adopt a row stored before assignment ids were recorded
+ADOPT_ASSIGNMENT = '''
+    UPDATE OR IGNORE calendar_events SET external_id = ?
+    WHERE user_id = ? AND source = 'Canvas' AND external_id IS NULL
+      AND canvas_course_id = ? AND title = ? AND due_date = ?
+'''
+
+SAVE_STATE = '''
+    INSERT INTO canvas_sync_state
+    (user_id, course_id, etag, pages, max_updated_at, last_synced_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, course_id) DO UPDATE SET
+        etag = excluded.etag,
+        pages = excluded.pages,
+        max_updated_at = excluded.max_updated_at,
+        last_synced_at = excluded.last_synced_at
+'''
+
+TOUCH_STATE = 'UPDATE canvas_sync_state SET last_synced_at = ? WHERE user_id = ? AND course_id = ?'
+
+
+def save_course(writer, user_id, course):
+    """Queue the upsert of a course row, counted under "courses" when it changes."""
+    writer.add(SAVE_COURSE, (user_id, str(course.get("id")), course.get("name"),
+                             course.get("course_code"), course.get("created_at")), "courses")
+
+
+def normalize_assignment(course, assignment):
+    """EventRecord of a Canvas assignment."""
+    return event_records.EventRecord(
+        "Canvas", str(assignment.get("id")),
+        title=assignment.get("name"),
+        description=assignment.get("description", ""),
+        due_date=event_records.timestamp(assignment.get("due_at")),
+        course_name=course.get("name"),
+        canvas_course_id=str(course.get("id")),
+    )
+
+
+def save_assignments(writer, user_id, records):
+    """Queue the upserts of a page of assignments, counted under "assignments"."""
+    for record in records:
+        writer.add(ADOPT_ASSIGNMENT, (record.external_id, user_id, record.canvas_course_id,
+                                      record.title, record.due_date))
+    for record in records:
+        writer.add(event_records.UPSERT, record.row(user_id), "assignments")
+
+
+def save_state(writer, user_id, course_id, etag, pages, max_updated_at, synced_at):
+    """Queue a course's watermarks after a successful fetch."""
+    writer.add(SAVE_STATE, (user_id, course_id, etag, pages, max_updated_at, synced_at))
+
+
+def sync_canvas(db, user_id, canvas_token, full=False):
+    """Sync a user's Canvas courses and assignments into the database.
+
+    Assignments stream from the fetching threads to a `pipeline.ChunkWriter`
+    on `db` a page at a time. Full chunks are committed as they fill, the
+    last one is left for the caller to commit. Returns counts of what was
+    fetched and changed, plus the sync time for the caller to record on the
+    connected account.
+    """
+    headers = {"Authorization": f"Bearer {canvas_token}"}
+    state = {} if full else load_state(db.cursor(), user_id)
+
+    # runs on the fetching threads, ends with one "fetched", "unchanged" or
+    # "failed" message per course
+    def produce(course):
+        previous = state.get(str(course.get("id")))
+        # only write assignments updated since the last sync of this course
+        watermark = previous["max_updated_at"] if previous else None
+        max_updated_at, etag, pages = watermark, None, 0
+        try:
+            for assignments, etag in fetch_course_assignments(course.get("id"), headers, previous):
+                pages += 1
+                records = []
+                for assignment in assignments:
+                    updated_at = assignment.get("updated_at") or ""
+                    if max_updated_at is None or updated_at > max_updated_at:
+                        max_updated_at = updated_at
+                    if not assignment.get("due_at"):
+                        continue
+                    if watermark is not None and updated_at and updated_at <= watermark:
+                        continue
+                    records.append(normalize_assignment(course, assignment))
+                yield "assignments", course, records
+        except Exception as e:
+            print(f"Error fetching assignments for course {course.get('id')}: {e}")
+            yield "failed", course, None
+            return
+        if pages:
+            yield "fetched", course, (etag, pages, max_updated_at)
+        else:
+            yield "unchanged", course, None
+
+    writer = pipeline.ChunkWriter(
+        db, on_commit=lambda cursor: dbpool.bump_data_version(cursor, user_id))
+    stats = {"courses": 0, "coursesChanged": 0, "coursesSkipped": 0, "assignmentsChanged": 0}
+    synced_at = datetime.now(timezone.utc).isoformat()
+
+    # courses are fetched in parallel, so a sync takes about as long as the
+    # slowest course instead of the sum of all of them
+    for kind, course, data in pipeline.fan_in(fetch_courses(headers), produce, MAX_WORKERS):
+        if kind == "assignments":
+            save_assignments(writer, user_id, data)
+            continue
+
+        course_id = str(course.get("id"))
+        stats["courses"] += 1
+        save_course(writer, user_id, course)
+        if kind == "unchanged":
+            # Canvas says nothing changed, only move the sync time forward
+            stats["coursesSkipped"] += 1
+            writer.add(TOUCH_STATE, (synced_at, user_id, course_id))
+        elif kind == "fetched":
+            save_state(writer, user_id, course_id, *data, synced_at)
+
+    writer.flush()
+    stats["coursesChanged"] = writer.count("courses")
+    stats["assignmentsChanged"] = writer.count("assignments")
+    stats["syncedAt"] = synced_at
+    return stats
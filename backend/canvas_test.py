@@ -14,7 +14,8 @@ Write code that iterates over the courses taken in the current semester
 and fetches upcoming assignments
 """
 from datetime import datetime, timezone
-import requests
+import event_records
+import http_client
 
 # define url of VT Canvas domain
 BASE_URL = "https://canvas.vt.edu"  
@@ -32,7 +33,7 @@ def get_current_courses(headers):
     # loop over paginated results, add json data objects (dict) to courses list
     courses = []
     while url:
-        resp = requests.get(url, headers=headers, params=params)
+        resp = http_client.get(url, headers=headers, params=params)
         resp.raise_for_status()
         data = resp.json()
         courses.extend(data)
@@ -48,7 +49,7 @@ def get_upcoming_assignments(course_id, headers):
 
     # loop over paginated results, add json objects to assignments list
     while url:
-        resp = requests.get(url, headers=headers)
+        resp = http_client.get(url, headers=headers)
         resp.raise_for_status()
         data = resp.json()
         assignments.extend(data)
@@ -58,7 +59,7 @@ def get_upcoming_assignments(course_id, headers):
     now = datetime.now(timezone.utc)
     upcoming = [
         a for a in assignments
-        if a.get("due_at") and datetime.fromisoformat(a["due_at"].replace("Z", "+00:00")) > now
+        if a.get("due_at") and event_records.as_datetime(a["due_at"]) > now
     ]
     return upcoming
 
@@ -77,7 +78,7 @@ def main(headers):
             for a in assignments:
                 due_date = a.get("due_at")
                 if due_date:
-                    due_date = datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+                    due_date = event_records.as_datetime(due_date)
                     due_date = due_date.astimezone().strftime("%Y-%m-%d %H:%M")
                 print(f"  • {a['name']} (due {due_date})")
             print()
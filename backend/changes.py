@@ -0,0 +1,232 @@
+"""Per-user change notifications, pushed to clients as Server-Sent Events.
+
+Routes that change a user's data call `publish` after they commit, e.g.
+"event.added", "event.updated", "event.deleted", "sync.finished" or
+"settings.updated", with the user's new data version. `/api/changes/stream`
+holds one `text/event-stream` response per open app or extension popup and
+writes each of the user's notifications to it as it's published, so
+clients refetch only when something changed instead of polling.
+
+Writes made in another process, the scheduler or another gunicorn worker,
+can't publish here. `start_poller` covers them: once every
+SSE_POLL_SECONDS one query over the indexed `user_data_versions.updated_at`
+finds users whose version moved past the last one announced, and
+subscribed users among them get a "changed" notification. That's one
+query per process, however many clients are connected.
+
+Each notification has an id "<process epoch>-<sequence>", and the last
+SSE_HISTORY of them are kept. A client reconnecting with `Last-Event-ID`
+gets what it missed replayed. When that's no longer possible (the id is
+from another process, or older than the history) it gets "reset" and
+refetches everything once.
+
+A stream sends a comment line every SSE_HEARTBEAT_SECONDS, so proxies keep
+the connection open and a vanished client is noticed, and ends after
+SSE_MAX_SECONDS so connections rebalance over workers. EventSource
+reconnects on its own. Waiting streams sleep on a condition variable of
+their user and cost no CPU. Under gunicorn's gthread workers every open
+stream still holds a thread, so `Hub.max_streams` is capped below the
+thread count (see `serve.py`).
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+MAX_SECONDS = float(os.environ.get("SSE_MAX_SECONDS", 300))
+MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", 1000))
+HISTORY = int(os.environ.get("SSE_HISTORY", 2048))
+POLL_INTERVAL = float(os.environ.get("SSE_POLL_SECONDS", 2))
+
+# milliseconds EventSource waits before reconnecting
+RETRY_MS = 3000
+
+# seconds of user_data_versions looked back over on every poll, so a
+# version bumped just before a slow commit isn't missed
+POLL_OVERLAP = 30
+
+
+def format_event(event_id, kind, data):
+    """One SSE message."""
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Hub:
+    """In-process pub/sub of per-user notifications with a replay history."""
+
+    def __init__(self, history=HISTORY, max_streams=MAX_STREAMS):
+        self.max_streams = max_streams
+        self._started = int(time.time() * 1000)
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)  # (sequence, user_id, kind, data)
+        self._sequence = 0
+        self._waiters = {}  # user_id -> [Condition, open streams]
+        self._versions = {}  # user_id -> last data version announced
+        self.streams = 0
+
+    @property
+    def epoch(self):
+        # gunicorn workers fork with the hub already created, but each has
+        # its own notifications
+        return f"{os.getpid():x}.{self._started:x}"
+
+    def event_id(self, sequence):
+        return f"{self.epoch}-{sequence}"
+
+    def publish(self, user_id, kind, version=None, **data):
+        """Notify a user's open streams, returns the notification's sequence.
+
+        A "changed" notice for a version that was already announced is
+        dropped and returns None.
+        """
+        with self._lock:
+            waiter = self._waiters.get(user_id)
+            if version is not None:
+                announced = self._versions.get(user_id, 0)
+                if kind == "changed" and version <= announced:
+                    return None
+                if waiter:
+                    self._versions[user_id] = max(version, announced)
+                data["version"] = version
+            self._sequence += 1
+            self._history.append((self._sequence, user_id, kind, data))
+            if waiter:
+                waiter[0].notify_all()
+            return self._sequence
+
+    def resume_point(self, last_event_id):
+        """Sequence to replay after, or None when the client must reset.
+
+        Without a Last-Event-ID the client has just loaded, and only new
+        notifications are sent.
+        """
+        with self._lock:
+            if not last_event_id:
+                return self._sequence
+            epoch, _, sequence = last_event_id.partition("-")
+            try:
+                sequence = int(sequence)
+            except ValueError:
+                return None
+            if epoch != self.epoch or sequence > self._sequence:
+                return None
+            oldest = self._history[0][0] if self._history else self._sequence + 1
+            return sequence if sequence >= oldest - 1 else None
+
+    def subscribe(self, user_id, version=None):
+        """Register an open stream, False when the process is at max_streams."""
+        with self._lock:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            waiter = self._waiters.get(user_id)
+            if waiter is None:
+                waiter = self._waiters[user_id] = [threading.Condition(self._lock), 0]
+            waiter[1] += 1
+            if version is not None and version > self._versions.get(user_id, 0):
+                self._versions[user_id] = version
+            return True
+
+    def unsubscribe(self, user_id):
+        """Drop a stream registered with `subscribe`."""
+        with self._lock:
+            self.streams -= 1
+            waiter = self._waiters[user_id]
+            waiter[1] -= 1
+            if not waiter[1]:
+                del self._waiters[user_id]
+                self._versions.pop(user_id, None)
+
+    def wait(self, user_id, after, timeout):
+        """A user's notifications after a sequence, waiting up to `timeout` for one."""
+        with self._lock:
+            pending = self._pending(user_id, after)
+            if not pending:
+                self._waiters[user_id][0].wait(timeout)
+                pending = self._pending(user_id, after)
+            return pending
+
+    def _pending(self, user_id, after):
+        if not self._history or self._history[-1][0] <= after:
+            return []
+        return [item for item in self._history if item[0] > after and item[1] == user_id]
+
+    def subscribed(self):
+        """Users with an open stream, with the last version announced to them."""
+        with self._lock:
+            return {user_id: self._versions.get(user_id, 0) for user_id in self._waiters}
+
+    def stream(self, user_id, last_event_id, heartbeat=HEARTBEAT, lifetime=MAX_SECONDS):
+        """SSE text of a subscribed user's notifications.
+
+        The caller unsubscribes once the response is closed, which also
+        covers a client gone before the first chunk.
+        """
+        yield f"retry: {RETRY_MS}\n\n"
+        after = self.resume_point(last_event_id)
+        if after is None:
+            with self._lock:
+                after = self._sequence
+            yield format_event(self.event_id(after), "reset", {})
+        deadline = time.monotonic() + lifetime
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            pending = self.wait(user_id, after, min(heartbeat, remaining))
+            for sequence, _, kind, data in pending:
+                after = sequence
+                yield format_event(self.event_id(sequence), kind, data)
+            if not pending:
+                yield ": ping\n\n"
+
+
+hub = Hub()
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def poll(db, since):
+    """Announce version changes since `since` to subscribed users, returns how many."""
+    subscribed = hub.subscribed()
+    if not subscribed:
+        return 0
+    rows = db.execute(
+        'SELECT user_id, version FROM user_data_versions WHERE updated_at >= ?',
+        (since,)
+    ).fetchall()
+    announced = 0
+    for row in rows:
+        if row["user_id"] in subscribed and row["version"] > subscribed[row["user_id"]]:
+            if hub.publish(row["user_id"], "changed", row["version"]) is not None:
+                announced += 1
+    return announced
+
+
+def start_poller(get_db, interval=POLL_INTERVAL):
+    """Poll for changes made by other processes on a daemon thread, once per process."""
+    global _poller
+    with _poller_lock:
+        if _poller is not None:
+            return _poller
+
+        def run():
+            last = time.time()
+            while True:
+                time.sleep(interval)
+                started = time.time()
+                db = get_db()
+                try:
+                    poll(db, last - POLL_OVERLAP)
+                except Exception as e:
+                    print(f"Change poll error: {e}")
+                finally:
+                    db.close()
+                last = started
+
+        _poller = threading.Thread(target=run, name="change-poller", daemon=True)
+        _poller.start()
+        return _poller
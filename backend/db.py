@@ -0,0 +1,230 @@
+"""SQLite connection management for the VT Calendar backend.
+
+Connections are expensive to open and the default rollback journal makes
+readers wait on writers, so the backend keeps a small pool of connections
+per database file instead of calling `sqlite3.connect` for every query.
+Each connection is opened once with tuned pragmas:
+
+- WAL journaling, so readers keep going while a Canvas sync commits
+- `synchronous=NORMAL`, which is safe under WAL and avoids an fsync per commit
+- a larger page cache and memory-mapped I/O
+- a busy timeout, so a writer waits for the lock instead of failing with
+  "database is locked"
+
+Each connection also gets the `strip_html` SQL function, which the search
+index triggers rely on.
+
+`app.get_db()` hands out `PooledConnection` objects. Calling `close()` on one
+returns the underlying connection to the pool rather than closing it. While
+metrics are enabled, their cursors time each statement and count its rows.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import ics
+import metrics
+
+# tunables, overridable from the environment
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 16384))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def connect(path):
+    """Open a new tuned connection to the database at `path`."""
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # used by the full-text index triggers, see migrations._event_search
+    conn.create_function("strip_html", 1, ics.strip_html, deterministic=True)
+    return conn
+
+
+def bump_data_version(cursor, user_id):
+    """Mark a user's data as changed, as part of the caller's transaction
+
+    Returns the new version, for the change notification sent after the commit.
+    """
+    cursor.execute(
+        '''INSERT INTO user_data_versions (user_id, version, updated_at) VALUES (?, 1, ?)
+           ON CONFLICT(user_id) DO UPDATE SET
+               version = version + 1,
+               updated_at = excluded.updated_at''',
+        (user_id, time.time())
+    )
+    cursor.execute('SELECT version FROM user_data_versions WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()[0]
+
+
+class TimedCursor:
+    """sqlite3 cursor that records statement time and row counts in `metrics`.
+
+    A query's time covers executing it up to its first row. The rows a
+    caller fetches, or that a write changed, are counted separately.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._label = None
+
+    def _run(self, method, sql, *args):
+        self._label = metrics.statement_label(sql)
+        started = time.perf_counter()
+        try:
+            method(sql, *args)
+        finally:
+            metrics.query_seconds.observe((self._label,), time.perf_counter() - started)
+        if self._cursor.rowcount > 0:
+            metrics.query_rows.inc((self._label,), self._cursor.rowcount)
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(self._cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(self._cursor.executescript, sql_script)
+
+    def _count(self, rows):
+        if rows and self._label is not None:
+            metrics.query_rows.inc((self._label,), rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(self._cursor.arraysize if size is None else size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __iter__(self):
+        rows = 0
+        try:
+            for row in self._cursor:
+                rows += 1
+                yield row
+        finally:
+            self._count(rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """Wrapper around a pooled sqlite3 connection.
+
+    Behaves like the wrapped connection, except that `close()` hands it
+    back to the pool. Anything left uncommitted is rolled back first.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        cursor = self.__getattr__("cursor")()  # raises once closed
+        return TimedCursor(cursor) if metrics.enabled() else cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of tuned connections to one database file."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        """Take an idle connection, opening a new one if none is free."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """Return the shared pool for the database at `path`."""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
@@ -0,0 +1,130 @@
+"""Normalized event records, the one shape every sync path writes.
+
+Each source turns its payloads into `EventRecord`s with its own normalizer
+(`canvas_sync.normalize_assignment`, `google_sync.normalize_event`,
+`microsoft_sync.normalize_event`, `ics_import.normalize_event`, and
+`manual_event` here for events added in the app). A normalizer parses each
+timestamp once with `timestamp`, so every source stores the same forms
+as `recurrence.normalize`: "YYYY-MM-DD" for all-day events, UTC
+"YYYY-MM-DDTHH:MM:SSZ" for zoned times, and naive "YYYY-MM-DDTHH:MM:SS"
+for floating ones.
+
+Records use `__slots__`, since a full sync builds one per event. Each
+carries `content_hash`, a digest of every column it writes, which is stored
+with the row. `upsert` only rewrites a row when the hash changed, so a
+re-sync that changes nothing writes nothing. It also leaves
+`reminder_sent` and the user's data version alone. The hash covers what
+the last sync wrote, so a local edit to a synced row stays until the
+source itself changes the event.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+import recurrence
+
+# content columns, in the order they're hashed and written
+COLUMNS = (
+    "title", "description", "due_date", "end_date", "course_name", "canvas_course_id",
+    "rrule", "exdates", "tzid", "master_id", "recurrence_id",
+)
+
+UPSERT = f'''
+    INSERT INTO calendar_events
+    (user_id, source, external_id, {", ".join(COLUMNS)}, content_hash)
+    VALUES ({", ".join("?" * (len(COLUMNS) + 4))})
+    ON CONFLICT(user_id, source, external_id) DO UPDATE SET
+        reminder_sent = CASE WHEN due_date IS excluded.due_date
+                        THEN reminder_sent ELSE 0 END,
+        {", ".join(f"{c} = excluded.{c}" for c in COLUMNS)},
+        content_hash = excluded.content_hash
+    WHERE content_hash IS NOT excluded.content_hash
+'''
+
+
+def timestamp(value):
+    """Stored form of a date or time string, None if empty.
+
+    Values that can't be parsed are kept as given rather than dropped.
+    """
+    if not value:
+        return None
+    return recurrence.normalize(value) or value
+
+
+def as_datetime(value):
+    """Aware datetime of a date or time string, for comparisons.
+
+    All-day dates are midnight UTC and floating times are taken as UTC.
+    """
+    parsed = recurrence.parse_value(value)
+    if not isinstance(parsed, datetime):
+        parsed = datetime(parsed.year, parsed.month, parsed.day)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class EventRecord:
+    """One normalized event, ready to be written to `calendar_events`."""
+
+    __slots__ = ("source", "external_id") + COLUMNS + ("content_hash",)
+
+    def __init__(self, source, external_id, title=None, description=None, due_date=None,
+                 end_date=None, course_name=None, canvas_course_id=None, rrule=None,
+                 exdates=None, tzid=None, master_id=None, recurrence_id=None):
+        self.source = source
+        self.external_id = external_id
+        self.title = title
+        self.description = description
+        self.due_date = due_date
+        self.end_date = end_date
+        self.course_name = course_name
+        self.canvas_course_id = canvas_course_id
+        self.rrule = rrule
+        self.exdates = exdates
+        self.tzid = tzid
+        self.master_id = master_id
+        self.recurrence_id = recurrence_id
+        self.content_hash = self.digest()
+
+    def values(self):
+        return tuple(getattr(self, c) for c in COLUMNS)
+
+    def digest(self):
+        """Stable hash of the content columns, the same in every process."""
+        text = "\x1f".join("\x00" if v is None else str(v) for v in self.values())
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def row(self, user_id):
+        """Parameters for `UPSERT`."""
+        return (user_id, self.source, self.external_id) + self.values() + (self.content_hash,)
+
+    def __repr__(self):
+        return f"EventRecord({self.source!r}, {self.external_id!r}, {self.title!r}, {self.due_date!r})"
+
+
+def upsert(cursor, user_id, record):
+    """Insert or update one record's row, returns True if the row changed."""
+    cursor.execute(UPSERT, record.row(user_id))
+    return cursor.rowcount > 0
+
+
+def upsert_many(cursor, user_id, records):
+    """Insert or update rows for many records, returns how many changed."""
+    cursor.executemany(UPSERT, [record.row(user_id) for record in records])
+    return max(cursor.rowcount, 0)
+
+
+def manual_event(data):
+    """Record of an event added in the app, from its JSON body.
+
+    Manual events have no external id, so they're inserted directly
+    rather than upserted.
+    """
+    rrule = data.get("rrule") or None
+    return EventRecord(
+        "Manual", None,
+        title=data.get("title"),
+        description=data.get("description"),
+        due_date=timestamp(data.get("dueDate")),
+        rrule=rrule,
+        tzid=data.get("timeZone") if rrule else None,
+    )
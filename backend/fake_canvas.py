@@ -0,0 +1,258 @@
+"""Local stand-in for the Canvas LMS API.
+
+Implements just enough of `GET /api/v1/courses` and
+`GET /api/v1/courses/:id/assignments` to exercise `canvas_sync` without a
+Canvas account: `per_page`/`page` pagination with `Link: rel="next"`
+headers, ETags with 304 Not Modified, and separate data per access token,
+so many synthetic students can sync against one server. It can also add a
+fixed delay to every response.
+
+With `rate_limit` set it throttles like Canvas: each token has a leaky
+bucket of that many units draining at `leak_rate` per second. A request
+holds back PREFLIGHT_COST units while it runs and is charged
+`request_cost` when it finishes. Responses carry `X-Request-Cost` and
+`X-Rate-Limit-Remaining`, and a request that doesn't fit is refused with
+403 "Rate Limit Exceeded".
+
+Use it from Python:
+
+    fake = FakeCanvas(latency=0.05)
+    fake.start()
+    fake.add_course("token-1", {"id": 101, "name": "CS 3114", "course_code": "CS3114"})
+    fake.put_assignment("token-1", 101, {"id": 1, "name": "Project 1",
+                                         "due_at": "2030-01-01T23:59:00Z"})
+    canvas_sync.BASE_URL = fake.url
+
+or run it standalone with seeded data and point the backend at it with
+CANVAS_BASE_URL:
+
+    python fake_canvas.py --port 8093 --users 20 --courses 6 --assignments 40 --rate-limit 700
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# units a request holds back while in flight, as Canvas does
+PREFLIGHT_COST = 50
+
+
+class FakeCanvas:
+    """In-memory Canvas API served over HTTP on localhost."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, page_size=None,
+                 rate_limit=None, leak_rate=10.0, request_cost=1.0):
+        self.latency = latency
+        self.page_size = page_size  # caps per_page to force pagination
+        self.rate_limit = rate_limit
+        self.leak_rate = leak_rate
+        self.request_cost = request_cost
+        self.accounts = {}  # token -> {course id -> {"course", "assignments": {id -> assignment}}}
+        self.buckets = {}  # token -> [units used, time of last leak]
+        self.requests = 0
+        self.not_modified = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # data setup
+
+    def add_course(self, token, course):
+        with self._lock:
+            courses = self.accounts.setdefault(token, {})
+            courses.setdefault(course["id"], {"course": course, "assignments": {}})
+
+    def put_assignment(self, token, course_id, assignment):
+        """Create or replace an assignment, stamping its updated_at."""
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        with self._lock:
+            course = self.accounts[token][course_id]
+            course["assignments"][assignment["id"]] = dict(assignment, updated_at=now)
+
+    # rate limiting
+
+    def _bucket(self, token):
+        """A token's bucket, drained up to now. Called with the lock held."""
+        now = time.monotonic()
+        bucket = self.buckets.setdefault(token, [0.0, now])
+        bucket[0] = max(0.0, bucket[0] - (now - bucket[1]) * self.leak_rate)
+        bucket[1] = now
+        return bucket
+
+    def _admit(self, token):
+        """Hold back the pre-flight units, False if they don't fit."""
+        with self._lock:
+            bucket = self._bucket(token)
+            if bucket[0] + PREFLIGHT_COST > self.rate_limit:
+                self.throttled += 1
+                return False
+            bucket[0] += PREFLIGHT_COST
+            return True
+
+    def _charge(self, token):
+        """Swap the pre-flight units for the request's cost, returns the units left."""
+        with self._lock:
+            bucket = self._bucket(token)
+            bucket[0] = max(0.0, bucket[0] + self.request_cost - PREFLIGHT_COST)
+            return self.rate_limit - bucket[0]
+
+    # request handling
+
+    def _route(self, token, path):
+        courses = self.accounts.get(token)
+        if courses is None:
+            return 401, {"errors": [{"message": "Invalid access token."}]}
+        parts = [p for p in path.split("/") if p]
+        if parts == ["api", "v1", "courses"]:
+            return 200, [c["course"] for c in courses.values()]
+        if len(parts) == 5 and parts[:3] == ["api", "v1", "courses"] and parts[4] == "assignments":
+            course = courses.get(int(parts[3])) if parts[3].isdigit() else None
+            if course is None:
+                return 404, {"errors": [{"message": "The specified resource does not exist."}]}
+            return 200, sorted(course["assignments"].values(), key=lambda a: a.get("due_at") or "")
+        return 404, {"errors": [{"message": "The specified resource does not exist."}]}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                token = self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+
+                headers = {}
+                if fake.rate_limit:
+                    if not fake._admit(token):
+                        with fake._lock:
+                            remaining = fake.rate_limit - fake._bucket(token)[0]
+                        self.send_text(403, "403 Forbidden (Rate Limit Exceeded)", {
+                            "X-Request-Cost": "0",
+                            "X-Rate-Limit-Remaining": f"{remaining:.3f}",
+                        })
+                        return
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake.rate_limit:
+                    headers["X-Request-Cost"] = f"{fake.request_cost:.3f}"
+                    headers["X-Rate-Limit-Remaining"] = f"{fake._charge(token):.3f}"
+
+                with fake._lock:
+                    fake.requests += 1
+                    status, body = fake._route(token, url.path)
+
+                if status == 200:
+                    per_page = int(query.get("per_page", 10))
+                    if fake.page_size:
+                        per_page = min(per_page, fake.page_size)
+                    page = int(query.get("page", 1))
+                    items = body
+                    body = items[(page - 1) * per_page:page * per_page]
+                    if page * per_page < len(items):
+                        next_query = dict(query, page=page + 1, per_page=per_page)
+                        link = f"{fake.url}{url.path}?" + "&".join(f"{k}={v}" for k, v in next_query.items())
+                        headers["Link"] = f'<{link}>; rel="next"'
+
+                data = json.dumps(body).encode()
+                etag = '"' + hashlib.md5(data).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    with fake._lock:
+                        fake.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_text(self, status, text, headers):
+                data = text.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def seed(fake, token, courses, assignments, first_id=1):
+    """Give a token `courses` courses with `assignments` upcoming assignments each."""
+    now = datetime.now(timezone.utc).replace(minute=59, second=0, microsecond=0)
+    for c in range(courses):
+        course_id = first_id + c
+        fake.add_course(token, {
+            "id": course_id,
+            "name": f"Course {course_id}",
+            "course_code": f"CS{1000 + course_id}",
+            "created_at": "2026-08-20T00:00:00Z",
+        })
+        for a in range(assignments):
+            due = now + timedelta(days=a * 2 + c, hours=c)
+            fake.put_assignment(token, course_id, {
+                "id": course_id * 100000 + a,
+                "name": f"Assignment {a}",
+                "description": "<p>Synthetic assignment</p>",
+                "due_at": due.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Canvas API")
+    parser.add_argument("--port", type=int, default=8093)
+    parser.add_argument("--users", type=int, default=5, help="tokens canvas-0 .. canvas-N")
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--assignments", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=None)
+    parser.add_argument("--rate-limit", type=float, default=None, help="bucket size per token, e.g. 700")
+    parser.add_argument("--leak-rate", type=float, default=10.0)
+    args = parser.parse_args()
+
+    fake = FakeCanvas(port=args.port, latency=args.latency, page_size=args.page_size,
+                      rate_limit=args.rate_limit, leak_rate=args.leak_rate)
+    for u in range(args.users):
+        seed(fake, f"canvas-{u}", args.courses, args.assignments, first_id=u * args.courses + 1)
+    print(f"Fake Canvas API on {fake.url} (CANVAS_BASE_URL={fake.url}), tokens canvas-0..canvas-{args.users - 1}")
+    fake._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Local stand-in for the Google Calendar API.
+
+Implements just enough of `calendarList.list` and `events.list` to exercise
+`google_sync` without a Google account: page tokens, `nextSyncToken`,
+incremental listings that include cancelled events, recurring masters and
+their exceptions, and 410 Gone for expired sync tokens. It can also add a
+fixed delay to every response.
+
+Use it from Python:
+
+    fake = FakeGoogleCalendar(latency=0.05)
+    fake.start()
+    fake.put_event("primary", {"id": "e1", "summary": "Lab",
+                               "start": {"dateTime": "2030-01-01T10:00:00Z"}})
+    google_calendar.BASE_URL = fake.url
+
+or run it standalone with seeded data and point the backend at it with
+GOOGLE_API_URL:
+
+    python fake_google.py --port 8091 --calendars 3 --events 200
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class FakeGoogleCalendar:
+    """In-memory Google Calendar API served over HTTP on localhost."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, page_size=None):
+        self.latency = latency
+        self.page_size = page_size  # caps maxResults to force pagination
+        self.calendars = {}  # calendar id -> {"summary", "events": {event id -> event}}
+        self.requests = 0
+        self._seq = 0  # bumped on every change, sync tokens are "s<seq>"
+        self._min_token = 0  # tokens older than this answer 410 Gone
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # data setup
+
+    def add_calendar(self, calendar_id, summary=None):
+        with self._lock:
+            self.calendars.setdefault(calendar_id, {"summary": summary or calendar_id, "events": {}})
+
+    def put_event(self, calendar_id, event):
+        """Create or replace an event."""
+        self.add_calendar(calendar_id)
+        with self._lock:
+            self._seq += 1
+            stored = dict(event, status=event.get("status", "confirmed"), _seq=self._seq)
+            self.calendars[calendar_id]["events"][event["id"]] = stored
+
+    def cancel_event(self, calendar_id, event_id):
+        """Delete an event, it shows up as cancelled in incremental listings."""
+        with self._lock:
+            self._seq += 1
+            event = self.calendars[calendar_id]["events"][event_id]
+            event.update(status="cancelled", _seq=self._seq)
+
+    def expire_tokens(self):
+        """Invalidate every sync token handed out so far."""
+        with self._lock:
+            # tokens issued from now on are newer than every expired one
+            self._seq += 1
+            self._min_token = self._seq
+
+    # request handling
+
+    def _list_calendars(self, query):
+        items = [{"id": cid, "summary": cal["summary"]} for cid, cal in self.calendars.items()]
+        return 200, self._page(items, query)
+
+    def _list_events(self, calendar_id, query):
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+        events = sorted(calendar["events"].values(), key=lambda e: e["_seq"])
+        sync_token = query.get("syncToken")
+        if sync_token:
+            since = int(sync_token[1:])
+            if since < self._min_token:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+            items = [e for e in events if e["_seq"] > since]
+        else:
+            # without singleEvents a recurring master is listed once, however
+            # old its first instance is, along with its cancelled instances
+            time_min = self._parse(query["timeMin"]) if query.get("timeMin") else None
+            expand = query.get("singleEvents") == "True"
+            items = [
+                e for e in events
+                if (e["status"] != "cancelled" or (e.get("recurringEventId") and not expand))
+                and (time_min is None or e.get("recurrence") or e["status"] == "cancelled"
+                     or self._parse(self._start(e)) >= time_min)
+            ]
+
+        body = self._page([{k: v for k, v in e.items() if k != "_seq"} for e in items], query)
+        if "nextPageToken" not in body:
+            body["nextSyncToken"] = f"s{self._seq}"
+        return 200, body
+
+    def _page(self, items, query):
+        size = int(query.get("maxResults", 250))
+        if self.page_size:
+            size = min(size, self.page_size)
+        offset = int(query.get("pageToken", 0))
+        body = {"items": items[offset:offset + size]}
+        if offset + size < len(items):
+            body["nextPageToken"] = str(offset + size)
+        return body
+
+    @staticmethod
+    def _parse(value):
+        if "T" not in value:
+            value += "T00:00:00+00:00"
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+    @staticmethod
+    def _start(event):
+        start = event.get("start", {})
+        return start.get("dateTime") or start.get("date") or ""
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                parts = [unquote(p) for p in url.path.split("/") if p]
+
+                with fake._lock:
+                    fake.requests += 1
+                    if parts[-3:] == ["users", "me", "calendarList"]:
+                        status, body = fake._list_calendars(query)
+                    elif len(parts) >= 3 and parts[-3] == "calendars" and parts[-1] == "events":
+                        status, body = fake._list_events(parts[-2], query)
+                    else:
+                        status, body = 404, {"error": {"code": 404, "message": "Not Found"}}
+
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def seed(fake, calendars, events):
+    """Fill the fake with one upcoming event per day per calendar."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    for c in range(calendars):
+        calendar_id = "primary" if c == 0 else f"calendar{c}@group.calendar.google.com"
+        fake.add_calendar(calendar_id, f"Calendar {c}")
+        for e in range(events):
+            start = now + timedelta(days=e, hours=c)
+            fake.put_event(calendar_id, {
+                "id": f"c{c}e{e}",
+                "summary": f"Event {e}",
+                "description": "Synthetic event",
+                "start": {"dateTime": start.isoformat().replace("+00:00", "Z")},
+                "end": {"dateTime": (start + timedelta(hours=1)).isoformat().replace("+00:00", "Z")},
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Google Calendar API")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--calendars", type=int, default=2)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeGoogleCalendar(port=args.port, latency=args.latency, page_size=args.page_size)
+    seed(fake, args.calendars, args.events)
+    print(f"Fake Google Calendar API on {fake.url} (GOOGLE_API_URL={fake.url})")
+    fake._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
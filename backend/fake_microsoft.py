@@ -0,0 +1,235 @@
+"""Local stand-in for the Microsoft Graph calendar API.
+
+Implements just enough of `/me/calendars` and `calendarView/delta` to
+exercise `microsoft_sync` without a Microsoft account: `odata.maxpagesize`
+paging through `@odata.nextLink`, a `@odata.deltaLink` on the last page,
+incremental listings that include `@removed` entries, and 410 Gone for
+expired delta links. It can also add a fixed delay to every response.
+
+Use it from Python:
+
+    fake = FakeMicrosoftGraph(latency=0.05)
+    fake.start()
+    fake.put_event("cal1", {"id": "e1", "subject": "Lab",
+                            "start": {"dateTime": "2030-01-01T10:00:00.0000000", "timeZone": "UTC"}})
+    microsoft_sync.BASE_URL = fake.url
+
+or run it standalone with seeded data and point the backend at it with
+MICROSOFT_GRAPH_URL:
+
+    python fake_microsoft.py --port 8092 --calendars 3 --events 200
+"""
+import argparse
+import json
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+_MAX_PAGE_SIZE = re.compile(r"odata\.maxpagesize=(\d+)")
+
+
+class FakeMicrosoftGraph:
+    """In-memory Microsoft Graph calendar API served over HTTP on localhost."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, page_size=None):
+        self.latency = latency
+        self.page_size = page_size  # caps odata.maxpagesize to force pagination
+        self.calendars = {}  # calendar id -> {"name", "events": {event id -> event}}
+        self.requests = 0
+        self._seq = 0  # bumped on every change
+        self._links = {}  # delta token -> (calendar id, start, end, seq)
+        self._pages = {}  # skip token -> (calendar id, remaining items, delta token)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # data setup
+
+    def add_calendar(self, calendar_id, name=None):
+        with self._lock:
+            self.calendars.setdefault(calendar_id, {"name": name or calendar_id, "events": {}})
+
+    def put_event(self, calendar_id, event):
+        """Create or replace an event."""
+        self.add_calendar(calendar_id)
+        with self._lock:
+            self._seq += 1
+            stored = dict(event, _seq=self._seq, _deleted=False)
+            self.calendars[calendar_id]["events"][event["id"]] = stored
+
+    def delete_event(self, calendar_id, event_id):
+        """Delete an event, it shows up as @removed in incremental listings."""
+        with self._lock:
+            self._seq += 1
+            event = self.calendars[calendar_id]["events"][event_id]
+            event.update(_deleted=True, _seq=self._seq)
+
+    def expire_links(self):
+        """Invalidate every delta link handed out so far."""
+        with self._lock:
+            self._links.clear()
+
+    # request handling
+
+    def _list_calendars(self):
+        items = [{"id": cid, "name": cal["name"]} for cid, cal in self.calendars.items()]
+        return 200, {"value": items}
+
+    def _delta(self, calendar_id, query, page_size):
+        if "$skiptoken" in query:
+            return self._next_page(query["$skiptoken"], page_size)
+
+        if "$deltatoken" in query:
+            link = self._links.get(query["$deltatoken"])
+            if link is None:
+                return 410, {"error": {"code": "syncStateNotFound",
+                                       "message": "The delta token is no longer valid"}}
+            calendar_id, start, end, since = link
+        else:
+            since = None
+            try:
+                start = self._parse(query["startDateTime"])
+                end = self._parse(query["endDateTime"])
+            except (KeyError, ValueError):
+                return 400, {"error": {"code": "ErrorInvalidParameter",
+                                       "message": "startDateTime and endDateTime are required"}}
+
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None:
+            return 404, {"error": {"code": "ErrorItemNotFound", "message": "Not Found"}}
+
+        items = []
+        for event in sorted(calendar["events"].values(), key=lambda e: e["_seq"]):
+            if since is not None and event["_seq"] <= since:
+                continue
+            in_window = start <= self._parse(event["start"]["dateTime"]) < end
+            if event["_deleted"] or not in_window:
+                if since is not None:
+                    items.append({"id": event["id"], "@removed": {"reason": "deleted"}})
+                continue
+            items.append({k: v for k, v in event.items() if not k.startswith("_")})
+
+        token = secrets.token_urlsafe(8)
+        self._links[token] = (calendar_id, start, end, self._seq)
+        return self._page(calendar_id, items, token, page_size)
+
+    def _next_page(self, skip_token, page_size):
+        pending = self._pages.pop(skip_token, None)
+        if pending is None:
+            return 410, {"error": {"code": "syncStateNotFound", "message": "Unknown skip token"}}
+        calendar_id, items, token = pending
+        return self._page(calendar_id, items, token, page_size)
+
+    def _page(self, calendar_id, items, token, page_size):
+        base = f"{self.url}/me/calendars/{quote(calendar_id, safe='')}/calendarView/delta"
+        body = {"value": items[:page_size]}
+        if len(items) > page_size:
+            skip = secrets.token_urlsafe(8)
+            self._pages[skip] = (calendar_id, items[page_size:], token)
+            body["@odata.nextLink"] = f"{base}?$skiptoken={skip}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken={token}"
+        return 200, body
+
+    @staticmethod
+    def _parse(value):
+        value = value.split(".")[0].replace("Z", "")
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                parts = [unquote(p) for p in url.path.split("/") if p]
+
+                page_size = 1000
+                match = _MAX_PAGE_SIZE.search(self.headers.get("Prefer", ""))
+                if match:
+                    page_size = int(match.group(1))
+                if fake.page_size:
+                    page_size = min(page_size, fake.page_size)
+
+                with fake._lock:
+                    fake.requests += 1
+                    if parts[-2:] == ["me", "calendars"]:
+                        status, body = fake._list_calendars()
+                    elif parts[-2:] == ["calendarView", "delta"] and len(parts) >= 4:
+                        status, body = fake._delta(parts[-3], query, page_size)
+                    else:
+                        status, body = 404, {"error": {"code": "ErrorItemNotFound", "message": "Not Found"}}
+
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def seed(fake, calendars, events):
+    """Fill the fake with one upcoming event per day per calendar."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    for c in range(calendars):
+        calendar_id = f"AAMkCal{c}"
+        fake.add_calendar(calendar_id, "Calendar" if c == 0 else f"Calendar {c}")
+        for e in range(events):
+            start = now + timedelta(days=e, hours=c)
+            fake.put_event(calendar_id, {
+                "id": f"c{c}e{e}",
+                "subject": f"Event {e}",
+                "bodyPreview": "Synthetic event",
+                "isAllDay": False,
+                "isCancelled": False,
+                "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+                "end": {"dateTime": (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.0000000"),
+                        "timeZone": "UTC"},
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Microsoft Graph calendar API")
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--calendars", type=int, default=2)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeMicrosoftGraph(port=args.port, latency=args.latency, page_size=args.page_size)
+    seed(fake, args.calendars, args.events)
+    print(f"Fake Microsoft Graph API on {fake.url} (MICROSOFT_GRAPH_URL={fake.url})")
+    fake._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Free/busy time and conflict detection over a user's events.
+
+Events from every source (Canvas, Google, Microsoft, Manual, imports) become
+intervals `[due_date, end_date)`. Events without an end take
+FREEBUSY_DEFAULT_MINUTES, and all-day events are left out, the same way
+calendar apps treat them as "free" by default.
+
+`FreeBusyIndex` sorts the intervals once and merges them into busy blocks,
+so for n events:
+
+- `conflicts` is a sweep over the sorted intervals with a heap of the
+  ones still running, O((n + k) log n) for k overlapping pairs
+- `busy` and `free` bisect into the merged blocks
+- `first_free` walks the blocks from a start time until it finds a gap of
+  the requested length that ends before a deadline
+
+Indexes are built from a user's events in a window and cached in a bounded
+LRU (FREEBUSY_CACHE_SIZE) keyed on the user's data version, so any write to
+their events makes the old index unreachable.
+"""
+import bisect
+import heapq
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+import recurrence
+
+DEFAULT_MINUTES = int(os.environ.get("FREEBUSY_DEFAULT_MINUTES", 60))
+CACHE_SIZE = int(os.environ.get("FREEBUSY_CACHE_SIZE", 256))
+
+Interval = namedtuple("Interval", "start end event")
+
+
+def to_epoch(value, dates=False):
+    """Epoch seconds of a stored timed value, None for dates or bad values.
+
+    Naive times are taken as UTC, and so are dates as their midnight with
+    `dates`, for window bounds.
+    """
+    if not value:
+        return None
+    try:
+        parsed = recurrence.parse_value(value)
+    except ValueError:
+        return None
+    if not isinstance(parsed, datetime):
+        if not dates:
+            return None
+        parsed = datetime(parsed.year, parsed.month, parsed.day)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_epoch(epoch):
+    """UTC "YYYY-MM-DDTHH:MM:SSZ" of epoch seconds."""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def interval(row):
+    """Interval an event occupies, None for all-day or undated events."""
+    start = to_epoch(row["due_date"])
+    if start is None:
+        return None
+    end = to_epoch(row["end_date"])
+    if end is None or end < start:
+        end = start + DEFAULT_MINUTES * 60
+    return Interval(start, end, row)
+
+
+class FreeBusyIndex:
+    """Sorted intervals and merged busy blocks of one user's events."""
+
+    def __init__(self, rows):
+        self.intervals = sorted(
+            (i for i in map(interval, rows) if i is not None),
+            key=lambda i: (i.start, i.end)
+        )
+        # merged, non-overlapping busy blocks as parallel start/end lists
+        self.starts, self.ends = [], []
+        for item in self.intervals:
+            if self.ends and item.start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], item.end)
+            else:
+                self.starts.append(item.start)
+                self.ends.append(item.end)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def conflicts(self):
+        """Yield every pair of overlapping events, as (first, second, overlap start, overlap end)."""
+        active = []  # (end, seq, interval) of intervals that haven't ended yet
+        for seq, item in enumerate(self.intervals):
+            while active and active[0][0] <= item.start:
+                heapq.heappop(active)
+            for end, _, other in active:
+                yield other.event, item.event, item.start, min(end, item.end)
+            heapq.heappush(active, (item.end, seq, item))
+
+    def busy(self, start, end):
+        """Busy blocks clipped to [start, end)."""
+        first = max(0, bisect.bisect_right(self.ends, start))
+        blocks = []
+        for i in range(first, len(self.starts)):
+            if self.starts[i] >= end:
+                break
+            blocks.append((max(self.starts[i], start), min(self.ends[i], end)))
+        return blocks
+
+    def free(self, start, end):
+        """Gaps between busy blocks within [start, end)."""
+        gaps = []
+        cursor = start
+        for block_start, block_end in self.busy(start, end):
+            if block_start > cursor:
+                gaps.append((cursor, block_start))
+            cursor = max(cursor, block_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def first_free(self, seconds, start, deadline):
+        """Earliest free slot of `seconds` starting at or after `start` that
+        ends by `deadline`, None if there is none."""
+        cursor = start
+        i = bisect.bisect_right(self.ends, start)
+        while cursor + seconds <= deadline:
+            if i >= len(self.starts) or self.starts[i] >= cursor + seconds:
+                return (cursor, cursor + seconds)
+            cursor = max(cursor, self.ends[i])
+            i += 1
+        return None
+
+
+class IndexCache:
+    """Thread-safe LRU of built indexes."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load_rows):
+        """Cached index for `key`, built from `load_rows()` on a miss."""
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+        index = FreeBusyIndex(load_rows())
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return index
+
+
+cache = IndexCache()
+
+
+def default_window(days=30):
+    """(start, end) from the current hour to `days` later, as stored strings."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return format_epoch(now.timestamp()), format_epoch((now + timedelta(days=days)).timestamp())
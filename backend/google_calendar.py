@@ -13,11 +13,13 @@ How can I use the Google Calendar API to pull a user's upcoming events?
 Give the implementation in python
 Write code that iterates over the user's calendars and fetches upcoming events
 """
+import os
 from datetime import datetime, timezone
-import requests
+import event_records
+import http_client
 
-# base URL of Google Calendar REST API
-BASE_URL = "https://www.googleapis.com/calendar/v3"
+# base URL of Google Calendar REST API, overridable to point at a local fake
+BASE_URL = os.environ.get("GOOGLE_API_URL", "https://www.googleapis.com/calendar/v3")
 
 
 def get_calendars(headers):
@@ -30,7 +32,7 @@ def get_calendars(headers):
     # loop over paginated results, add json data objects (dict) to calendars list
     calendars = []
     while url:
-        resp = requests.get(url, headers=headers, params=params)
+        resp = http_client.get(url, headers=headers, params=params)
         resp.raise_for_status()
         data = resp.json()
         calendars.extend(data.get("items", []))
@@ -62,7 +64,7 @@ def get_upcoming_events(calendar_id, headers, time_min=None):
     # loop over paginated results, add json objects to events list
     events = []
     while True:
-        resp = requests.get(url, headers=headers, params=params)
+        resp = http_client.get(url, headers=headers, params=params)
         resp.raise_for_status()
         data = resp.json()
         events.extend(data.get("items", []))
@@ -93,10 +95,7 @@ def main(headers):
             if not when:
                 continue
             # handle both timed and all-day events
-            if "T" in when:
-                dt = datetime.fromisoformat(when.replace("Z", "+00:00"))
-            else:
-                dt = datetime.fromisoformat(when + "T00:00:00+00:00")
+            dt = event_records.as_datetime(when)
             if dt >= now:
                 upcoming.append((dt, e))
 
@@ -0,0 +1,241 @@
+"""Incremental Google Calendar sync.
+
+`sync_google` imports events from every calendar in a user's calendar list
+into `calendar_events`. The first sync of a calendar is a full `events.list`
+of upcoming events. The `nextSyncToken` Google returns on its last page is
+stored per calendar in `google_sync_state`, and later syncs send only that
+token, so Google returns just the events that changed since. Deleted events
+come back with `status: "cancelled"` and are removed locally.
+
+When Google rejects a token with 410 Gone it has expired. The calendar is
+then re-imported with a full sync, and stored events missing from the full
+listing are removed.
+
+Recurring events are listed without `singleEvents`, so a weekly lecture is
+one master row with its RRULE rather than a row per meeting. Instances are
+expanded when they are read, see `recurrence`.
+
+Events are written as `event_records.EventRecord`s, so rows whose content hash
+didn't change are left alone. Rows are keyed on
+`external_id = "<calendar id>:<event id>"`. As in
+`canvas_sync`, calendars are fetched in parallel and each page is written
+as it arrives (see `pipeline`). Only the ids of a full listing are kept
+until its calendar is pruned.
+"""
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import db as dbpool
+import event_records
+import google_calendar
+import http_client
+import pipeline
+import recurrence
+
+# page size requested from Google
+MAX_RESULTS = 2500
+
+# max number of calendars fetched in parallel
+MAX_WORKERS = int(os.environ.get("GOOGLE_MAX_WORKERS", 4))
+
+DELETE_EVENT = "DELETE FROM calendar_events WHERE user_id = ? AND source = 'Google' AND external_id = ?"
+
+DELETE_SERIES = '''
+    DELETE FROM calendar_events WHERE user_id = ? AND source = 'Google'
+    AND (external_id = ? OR master_id = ?)
+'''
+
+SAVE_TOKEN = '''
+    INSERT INTO google_sync_state (user_id, calendar_id, sync_token, last_synced_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, calendar_id) DO UPDATE SET
+        sync_token = excluded.sync_token,
+        last_synced_at = excluded.last_synced_at
+'''
+
+
+class SyncTokenExpired(Exception):
+    """Google answered 410 Gone, the stored sync token can't be used."""
+
+
+def fetch_events(calendar_id, headers, sync_token=None):
+    """Yield a calendar's events a page at a time, incrementally when a sync token is given.
+
+    Each page is a list of (possibly cancelled) events and the next sync
+    token, which Google only sends with the last page.
+    """
+    url = f"{google_calendar.BASE_URL}/calendars/{quote(calendar_id, safe='')}/events"
+    if sync_token:
+        # a sync token can't be combined with timeMin/orderBy filters
+        params = {"syncToken": sync_token, "maxResults": MAX_RESULTS}
+    else:
+        # recurring events come back once, as their master and any
+        # changed or cancelled instances, instead of one item per instance
+        params = {
+            "timeMin": datetime.now(timezone.utc).isoformat(),
+            "maxResults": MAX_RESULTS,
+        }
+
+    while True:
+        resp = http_client.get(url, headers=headers, params=params)
+        if resp.status_code == 410:
+            raise SyncTokenExpired(calendar_id)
+        resp.raise_for_status()
+        data = resp.json()
+        page_token = data.get("nextPageToken")
+        yield data.get("items", []), None if page_token else data.get("nextSyncToken")
+        if not page_token:
+            return
+        params["pageToken"] = page_token
+
+
+def event_start(event):
+    """Start of an event, `dateTime` for timed events and `date` for all-day ones."""
+    start = event.get("start") or {}
+    return start.get("dateTime") or start.get("date")
+
+
+def event_end(event):
+    """End of an event, None if it has none."""
+    end = event.get("end") or {}
+    return end.get("dateTime") or end.get("date")
+
+
+def load_tokens(cursor, user_id):
+    """Stored sync tokens for a user, keyed by calendar id."""
+    cursor.execute(
+        'SELECT calendar_id, sync_token FROM google_sync_state WHERE user_id = ?',
+        (user_id,)
+    )
+    return {row["calendar_id"]: row["sync_token"] for row in cursor.fetchall()}
+
+
+def prune_calendar(writer, user_id, calendar_id, keep):
+    """Queue the removal of a calendar's stored events whose external id is not in `keep`."""
+    prefix = f"{calendar_id}:"
+    cursor = writer.db.execute(
+        '''SELECT external_id FROM calendar_events
+           WHERE user_id = ? AND source = 'Google' AND substr(external_id, 1, ?) = ?''',
+        (user_id, len(prefix), prefix)
+    )
+    for row in cursor.fetchall():
+        if row["external_id"] not in keep:
+            writer.add(DELETE_EVENT, (user_id, row["external_id"]), "events")
+
+
+def normalize_event(calendar, event):
+    """EventRecord of a Google event, None if it has no start.
+
+    A cancelled instance of a recurring event becomes an override without
+    a date, see `recurrence`.
+    """
+    master_id = recurrence_id = None
+    if event.get("recurringEventId"):
+        master_id = f"{calendar['id']}:{event['recurringEventId']}"
+        recurrence_id = event_records.timestamp(event_start({"start": event.get("originalStartTime")}))
+
+    external_id = f"{calendar['id']}:{event['id']}"
+    if event.get("status") == "cancelled":
+        return event_records.EventRecord("Google", external_id, course_name=calendar.get("summary"),
+                                  master_id=master_id, recurrence_id=recurrence_id)
+
+    due_date = event_records.timestamp(event_start(event))
+    if not due_date:
+        return None
+    rrule, exdates = recurrence.split_recurrence(event.get("recurrence"))
+    return event_records.EventRecord(
+        "Google", external_id,
+        title=event.get("summary", "(No title)"),
+        description=event.get("description", ""),
+        due_date=due_date,
+        end_date=event_records.timestamp(event_end(event)),
+        course_name=calendar.get("summary"),
+        rrule=rrule,
+        exdates=exdates,
+        tzid=(event.get("start") or {}).get("timeZone") if rrule else None,
+        master_id=master_id,
+        recurrence_id=recurrence_id,
+    )
+
+
+def apply_event(writer, user_id, calendar, event):
+    """Queue the writes of one event from a (full or delta) listing.
+
+    Recurring events are stored as one master row, and changed or cancelled
+    instances as override rows, see `recurrence`. Changed rows are counted
+    under "events".
+    """
+    if event.get("status") == "cancelled" and not event.get("recurringEventId"):
+        # a deleted series takes its overridden instances with it
+        external_id = f"{calendar['id']}:{event['id']}"
+        writer.add(DELETE_SERIES, (user_id, external_id, external_id), "events")
+        return
+
+    record = normalize_event(calendar, event)
+    if record is not None:
+        writer.add(event_records.UPSERT, record.row(user_id), "events")
+
+
+def save_token(writer, user_id, calendar_id, sync_token, synced_at):
+    """Queue a calendar's next sync token."""
+    writer.add(SAVE_TOKEN, (user_id, calendar_id, sync_token, synced_at))
+
+
+def sync_google(db, user_id, access_token, full=False):
+    """Sync a user's Google calendars into the database.
+
+    Events stream from the fetching threads to a `pipeline.ChunkWriter` on
+    `db` a page at a time. Full chunks are committed as they fill, the last
+    one is left for the caller to commit. Returns counts of what was
+    fetched and changed, plus the sync time for the caller to record.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    calendars = google_calendar.get_calendars(headers)
+    tokens = {} if full else load_tokens(db.cursor(), user_id)
+
+    # runs on the fetching threads, ends with a "done" message per calendar
+    # that was fetched in full
+    def produce(calendar):
+        token = tokens.get(calendar["id"])
+        # ids in a full listing, to prune what it no longer has
+        keep = None if token else set()
+        next_token = None
+        try:
+            try:
+                for events, next_token in fetch_events(calendar["id"], headers, token):
+                    yield "events", calendar, events
+                    if keep is not None:
+                        keep.update(f"{calendar['id']}:{event['id']}" for event in events)
+            except SyncTokenExpired:
+                keep = set()
+                for events, next_token in fetch_events(calendar["id"], headers):
+                    yield "events", calendar, events
+                    keep.update(f"{calendar['id']}:{event['id']}" for event in events)
+        except Exception as e:
+            print(f"Error fetching events for calendar {calendar['id']}: {e}")
+            return
+        yield "done", calendar, (next_token, keep)
+
+    writer = pipeline.ChunkWriter(
+        db, on_commit=lambda cursor: dbpool.bump_data_version(cursor, user_id))
+    stats = {"calendars": len(calendars), "eventsChanged": 0, "fullSyncs": 0}
+    synced_at = datetime.now(timezone.utc).isoformat()
+
+    for kind, calendar, data in pipeline.fan_in(calendars, produce, MAX_WORKERS):
+        if kind == "events":
+            for event in data:
+                apply_event(writer, user_id, calendar, event)
+            continue
+
+        next_token, keep = data
+        if keep is not None:
+            # a full listing replaces whatever was stored for the calendar
+            stats["fullSyncs"] += 1
+            prune_calendar(writer, user_id, calendar["id"], keep)
+        save_token(writer, user_id, calendar["id"], next_token, synced_at)
+
+    writer.flush()
+    stats["eventsChanged"] = writer.count("events")
+    stats["syncedAt"] = synced_at
+    return stats
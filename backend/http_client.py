@@ -0,0 +1,122 @@
+"""Shared HTTP client for outbound Canvas and Google API calls.
+
+Every fetcher in the backend goes through this module instead of calling
+`requests.get` directly. A single `requests.Session` keeps a pool of
+keep-alive connections per host, so paginated fetches reuse one TLS
+connection instead of opening a new one per page. Requests that fail with
+429 or a 5xx status (or a connection error) are retried with exponential
+backoff and jitter, honoring `Retry-After` when the server sends one.
+
+Both sync (`get`, `request`) and asyncio (`aget`, `arequest`) entry points are
+provided. The async variants run the pooled sync call on a worker thread so
+they share the same connection pool and retry behavior.
+
+Each attempt is timed per host and status in `metrics`, and retries are
+counted, while metrics are enabled.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# statuses that are worth retrying, everything else is returned to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# tunables, overridable from the environment
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", 30))
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _backoff_delay(attempt, resp=None):
+    """Seconds to wait before the given retry attempt."""
+
+    # prefer the server's own hint when it gives one in seconds
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+
+    # exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _record(host, method, status, started, attempt):
+    """Record one attempt's latency, and count it as a retry after the first."""
+    if not metrics.enabled():
+        return
+    metrics.outbound_seconds.observe((host, method, str(status)), time.perf_counter() - started)
+    if attempt:
+        metrics.outbound_retries.inc((host,))
+
+
+def request(method, url, max_retries=None, **kwargs):
+    """Send a request through the shared session, retrying on 429/5xx."""
+    if max_retries is None:
+        max_retries = MAX_RETRIES
+    kwargs.setdefault("timeout", TIMEOUT)
+    session = get_session()
+
+    host = urlsplit(url).netloc
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(host, method, "error", started, attempt)
+            if attempt >= max_retries:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+            continue
+        _record(host, method, resp.status_code, started, attempt)
+
+        if resp.status_code not in RETRY_STATUSES or attempt >= max_retries:
+            return resp
+
+        # release the connection back to the pool before sleeping
+        resp.close()
+        time.sleep(_backoff_delay(attempt, resp))
+        attempt += 1
+
+
+def get(url, **kwargs):
+    """GET through the shared session, see `request`."""
+    return request("GET", url, **kwargs)
+
+
+async def arequest(method, url, **kwargs):
+    """Asyncio variant of `request`."""
+    return await asyncio.to_thread(request, method, url, **kwargs)
+
+
+async def aget(url, **kwargs):
+    """Asyncio variant of `get`."""
+    return await arequest("GET", url, **kwargs)
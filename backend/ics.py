@@ -0,0 +1,246 @@
+"""iCalendar (RFC 5545) helpers for calendar feeds and imports.
+
+Only the small subset the backend needs: turning `calendar_events` rows
+into VEVENT text with correct escaping and 75-octet line folding, and
+reading VEVENTs back out of a file one line at a time.
+"""
+import html
+import re
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+PRODID = "-//VT Calendar//VT Calendar Feed//EN"
+
+_TAGS = re.compile(r"<[^>]+>")
+_ESCAPED = re.compile(r"\\([\\;,nN])")
+
+
+def escape(text):
+    """Escape a TEXT property value."""
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def strip_html(text):
+    """Plain text of a Canvas HTML description."""
+    text = html.unescape(_TAGS.sub(" ", text or ""))
+    return "\n".join(" ".join(line.split()) for line in text.splitlines()).strip()
+
+
+def fold(line):
+    """Fold a content line into chunks of at most 75 octets."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    limit = 75
+    while encoded:
+        # don't split inside a multi-byte character
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74  # continuation lines start with a space
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_date(value, name="DTSTART", tzid=None):
+    """Date property for a stored due date, None if it can't be parsed.
+
+    Date-only values become all-day dates, naive times floating local times
+    and everything else a UTC time, or a local time in `tzid` when given.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if "T" not in value and " " not in value:
+        return f"{name};VALUE=DATE:{parsed.strftime('%Y%m%d')}"
+    if parsed.tzinfo is None:
+        return f"{name}:{parsed.strftime('%Y%m%dT%H%M%S')}"
+    if tzid:
+        try:
+            local = parsed.astimezone(ZoneInfo(tzid))
+            return f"{name};TZID={tzid}:{local.strftime('%Y%m%dT%H%M%S')}"
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return f"{name}:{parsed.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def calendar_header(name):
+    """Opening lines of a VCALENDAR."""
+    return "".join(fold(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape(name)}",
+    ))
+
+
+def calendar_footer():
+    """Closing line of a VCALENDAR."""
+    return "END:VCALENDAR\r\n"
+
+
+def format_event(row, stamp):
+    """VEVENT text for one `calendar_events` row, '' if it has no usable date.
+
+    Recurring masters carry their RRULE and EXDATEs. Overridden instances
+    share their master's UID and name the instance with RECURRENCE-ID, and
+    cancelled instances are sent as STATUS:CANCELLED.
+    """
+    keys = row.keys()
+    recurring = "rrule" in keys and row["rrule"]
+    master = row["master_row_id"] if "master_row_id" in keys else None
+    recurrence_id = row["recurrence_id"] if master else None
+
+    tzid = row["tzid"] if recurring else None
+    start = format_date(row["due_date"] or recurrence_id, tzid=tzid)
+    if start is None:
+        return ""
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{master or row['id']}@vt-calendar",
+        f"DTSTAMP:{stamp}",
+        start,
+    ]
+    if recurrence_id:
+        lines.append(format_date(recurrence_id, "RECURRENCE-ID"))
+        if not row["due_date"]:
+            lines.extend(["STATUS:CANCELLED", "END:VEVENT"])
+            return "".join(fold(line) for line in lines)
+    if recurring:
+        lines.append(f"RRULE:{row['rrule']}")
+        for exdate in (row["exdates"] or "").split(","):
+            if exdate:
+                lines.append(format_date(exdate, "EXDATE", tzid))
+    lines.append(f"SUMMARY:{escape(row['title'] or '')}")
+    description = strip_html(row["description"])
+    if description:
+        lines.append(f"DESCRIPTION:{escape(description)}")
+    categories = [c for c in (row["source"], row["course_name"]) if c]
+    if categories:
+        lines.append(f"CATEGORIES:{','.join(escape(c) for c in categories)}")
+    lines.append("END:VEVENT")
+    return "".join(fold(line) for line in lines if line)
+
+
+def timestamp(moment=None):
+    """UTC date-time in iCalendar form."""
+    return (moment or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+
+
+# parsing
+
+
+def unescape(text):
+    """Undo TEXT property escaping."""
+    return _ESCAPED.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+
+def iter_lines(stream):
+    """Unfolded content lines of an iCalendar text stream, read lazily."""
+    current = None
+    for raw in stream:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line):
+    """Split a content line into (NAME, {PARAM: value}, value)."""
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return line.upper(), {}, ""
+
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        key, _, val = param.partition("=")
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+
+RECURRENCE_PROPERTIES = ("RRULE", "EXDATE")
+
+
+def iter_events(stream):
+    """Yield (calendar properties, event properties) for each VEVENT.
+
+    Event properties map each name to its first (params, value). RRULE and
+    EXDATE lines, which may repeat, are also listed whole under
+    "RECURRENCE", in the form of Google's `recurrence` field (see
+    `recurrence.split_recurrence`). Nested components such as VALARM are
+    skipped, and only one event is held in memory at a time.
+    """
+    calendar = {}
+    event = None
+    nested = 0
+    for line in iter_lines(stream):
+        name, params, value = parse_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                event = {}
+            elif event is not None:
+                nested += 1
+        elif name == "END":
+            if nested:
+                nested -= 1
+            elif value.upper() == "VEVENT" and event is not None:
+                yield calendar, event
+                event = None
+        elif event is None:
+            calendar.setdefault(name, (params, value))
+        elif not nested:
+            event.setdefault(name, (params, value))
+            if name in RECURRENCE_PROPERTIES:
+                event.setdefault("RECURRENCE", []).append(line)
+
+
+def parse_date(params, value):
+    """Stored due date for a DTSTART/DUE value, None if it can't be parsed.
+
+    DATE values become "YYYY-MM-DD". UTC times and times with a known TZID
+    become UTC "YYYY-MM-DDTHH:MM:SSZ", and floating times stay naive.
+    """
+    value = value.strip()
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.strptime(value, "%Y%m%d").strftime("%Y-%m-%d")
+        parsed = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    except ValueError:
+        return None
+
+    if value.endswith("Z"):
+        return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if params.get("TZID"):
+        try:
+            zone = ZoneInfo(params["TZID"])
+        except (ZoneInfoNotFoundError, ValueError):
+            zone = None
+        if zone is not None:
+            utc = parsed.replace(tzinfo=zone).astimezone(timezone.utc)
+            return utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S")
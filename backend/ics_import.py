@@ -0,0 +1,180 @@
+"""Import iCalendar (.ics) files into `calendar_events`.
+
+Files are parsed one line at a time (see `ics.iter_events`), and events are
+written in chunks with `executemany`, so memory use stays bounded no matter
+how large the file is. Each chunk is committed on its own so a large import
+doesn't hold the write lock for its whole duration, and a chunk that
+changed anything bumps the user's data version in the same transaction, so
+clients never keep a cached copy of rows an import committed, even when it
+fails halfway.
+
+Events are keyed on their UID (plus RECURRENCE-ID for overridden instances)
+as `external_id`, so importing the same file again updates the existing rows
+instead of duplicating them, and rows whose content hash didn't change
+aren't rewritten (see `event_records`). Events marked STATUS:CANCELLED are
+removed.
+
+Recurring events are stored once, with their RRULE, EXDATEs and time zone,
+and expanded when they are read (see `recurrence`). An instance with a
+RECURRENCE-ID becomes an override of its master, and a cancelled one an
+override without a date, like Google's.
+
+Used by POST /api/calendar/import, and from the command line:
+
+    python ics_import.py department.ics --user 1 [--source Import]
+"""
+import argparse
+import io
+import os
+
+import db as dbpool
+import event_records
+import ics
+import recurrence
+
+# rows written per executemany/commit
+CHUNK_SIZE = int(os.environ.get("ICS_IMPORT_CHUNK_SIZE", 500))
+
+DELETE = 'DELETE FROM calendar_events WHERE user_id = ? AND source = ? AND external_id = ?'
+
+
+def event_key(event):
+    """Natural key of an event, None if it has no UID."""
+    uid = event.get("UID")
+    if not uid or not uid[1]:
+        return None
+    recurrence = event.get("RECURRENCE-ID")
+    return f"{uid[1]}:{recurrence[1]}" if recurrence else uid[1]
+
+
+def text(event, name):
+    """Unescaped TEXT value of a property, None if it's missing."""
+    prop = event.get(name)
+    return ics.unescape(prop[1]) if prop else None
+
+
+def override_of(event):
+    """(master_id, recurrence_id) of an overridden instance, (None, None) otherwise."""
+    instance = event.get("RECURRENCE-ID")
+    if not instance:
+        return None, None
+    recurrence_id = recurrence.normalize(ics.parse_date(*instance))
+    if recurrence_id is None:
+        return None, None
+    return event["UID"][1], recurrence_id
+
+
+def normalize_event(calendar, event, source, key):
+    """EventRecord of a VEVENT, None if it has no usable start."""
+    start = event.get("DTSTART") or event.get("DUE")
+    due_date = ics.parse_date(*start) if start else None
+    if due_date is None:
+        return None
+    end = event.get("DTEND")
+    master_id, recurrence_id = override_of(event)
+    rrule, exdates = recurrence.split_recurrence(event.get("RECURRENCE"))
+    return event_records.EventRecord(
+        source, key,
+        title=text(event, "SUMMARY") or "(No title)",
+        description=text(event, "DESCRIPTION") or "",
+        due_date=due_date,
+        end_date=ics.parse_date(*end) if end else None,
+        course_name=text(calendar, "X-WR-CALNAME"),
+        rrule=rrule,
+        exdates=exdates,
+        tzid=start[0].get("TZID") if rrule else None,
+        master_id=master_id,
+        recurrence_id=recurrence_id,
+    )
+
+
+def cancelled_instance(calendar, event, source, key):
+    """Dateless override of a cancelled instance, None if the event isn't one."""
+    master_id, recurrence_id = override_of(event)
+    if master_id is None:
+        return None
+    return event_records.EventRecord(source, key, course_name=text(calendar, "X-WR-CALNAME"),
+                                      master_id=master_id, recurrence_id=recurrence_id)
+
+
+def import_ics(db, user_id, stream, source="Import", chunk_size=CHUNK_SIZE):
+    """Import every VEVENT of a text stream for a user, returns counts.
+
+    Commits as it goes, bumping the user's data version with every chunk
+    that changed rows.
+    """
+    cursor = db.cursor()
+    stats = {"imported": 0, "changed": 0, "deleted": 0, "skipped": 0}
+    upserts, deletes = [], []
+
+    def flush():
+        changed = deleted = 0
+        if upserts:
+            changed = event_records.upsert_many(cursor, user_id, upserts)
+        if deletes:
+            cursor.executemany(DELETE, deletes)
+            deleted = cursor.rowcount
+        if changed or deleted:
+            dbpool.bump_data_version(cursor, user_id)
+        db.commit()
+        stats["changed"] += changed
+        stats["deleted"] += deleted
+        upserts.clear()
+        deletes.clear()
+
+    for calendar, event in ics.iter_events(stream):
+        key = event_key(event)
+        if key is None:
+            stats["skipped"] += 1
+            continue
+
+        status = event.get("STATUS")
+        if status and status[1].upper() == "CANCELLED":
+            record = cancelled_instance(calendar, event, source, key)
+            if record is None:
+                deletes.append((user_id, source, key))
+            else:
+                upserts.append(record)
+        else:
+            record = normalize_event(calendar, event, source, key)
+            if record is None:
+                stats["skipped"] += 1
+                continue
+            upserts.append(record)
+            stats["imported"] += 1
+
+        if len(upserts) + len(deletes) >= chunk_size:
+            flush()
+
+    flush()
+    return stats
+
+
+def open_text(binary):
+    """Wrap a binary stream for line-by-line reading."""
+    return io.TextIOWrapper(binary, encoding="utf-8", errors="replace", newline="")
+
+
+def main():
+    import app as web  # app imports this module, so only import it here
+
+    parser = argparse.ArgumentParser(description="Import an .ics file into VT Calendar")
+    parser.add_argument("path")
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--source", default="Import")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    web.init_db()
+    db = web.get_db()
+    try:
+        with open(args.path, "rb") as f:
+            stats = import_ics(db, args.user, open_text(f), args.source, args.chunk_size)
+    finally:
+        db.close()
+    print(f"Imported {stats['imported']} events ({stats['changed']} changed), "
+          f"removed {stats['deleted']}, skipped {stats['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Load test the backend against local fake Canvas and Google servers.
+
+Starts `fake_canvas` and `fake_google` with the given latency and page size,
+serves the app from a scratch database on a threaded local server, and
+registers synthetic students. Every student gets their own Canvas token
+with `--courses` courses of `--assignments` assignments each. The fake
+Google account is shared, with `--calendars` calendars of `--events` events.
+
+The run has two phases:
+
+- setup: every student logs in and links Canvas and Google, `--concurrency`
+  at a time, like the first sync after sign-up
+- load: `--concurrency` clients send a weighted mix of requests for
+  `--seconds`: listing events (with If-None-Match, like the frontend),
+  adding events, reading and saving settings, and re-linking Canvas after
+  an assignment changed upstream
+
+Usage:
+    python loadtest.py [--users 20] [--concurrency 8] [--seconds 10] [--latency 0.02]
+                       [--mix events=60,add_event=10,get_settings=15,put_settings=5,link_canvas=10]
+                       [--rate-limit 700] [--no-metrics] [--output results.json]
+
+Prints one JSON object with the configuration and, per operation, the
+request count, errors, requests per second and p50/p95/p99 in
+milliseconds, so two runs can be compared with any JSON diff.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from werkzeug.serving import make_server
+
+import app as web
+import canvas_sync
+import db as dbpool
+import fake_canvas
+import fake_google
+import google_calendar
+import metrics
+
+PASSWORD = "loadtest-password"
+
+DEFAULT_MIX = "events=60,add_event=10,get_settings=15,put_settings=5,link_canvas=10"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def parse_mix(text):
+    """{operation: weight} of a "name=weight,..." string."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Recorder:
+    """Latencies and errors per operation, shared by all clients."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.not_modified = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, started, status):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.samples.setdefault(op, []).append(elapsed)
+            if status is None or status >= 400:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            elif status == 304:
+                self.not_modified[op] = self.not_modified.get(op, 0) + 1
+
+    def summary(self, seconds):
+        ops = {}
+        for op, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            ops[op] = {
+                "count": len(samples),
+                "errors": self.errors.get(op, 0),
+                "not_modified": self.not_modified.get(op, 0),
+                "rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "p99_ms": round(percentile(samples, 99), 3),
+            }
+        return ops
+
+
+class Client:
+    """One simulated browser: a requests session and the ETags it has seen."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.http = requests.Session()
+        self.etags = {}  # (user id, path) -> ETag
+
+    def call(self, op, method, path, user, json_body=None, params=None, conditional=False):
+        headers = {"X-Session-Token": user["token"]} if user.get("token") else {}
+        key = (user.get("id"), path)
+        if conditional and key in self.etags:
+            headers["If-None-Match"] = self.etags[key]
+        started = time.perf_counter()
+        try:
+            resp = self.http.request(method, self.base_url + path, json=json_body,
+                                     params=params, headers=headers, timeout=60)
+        except requests.RequestException:
+            self.recorder.record(op, started, None)
+            return None
+        self.recorder.record(op, started, resp.status_code)
+        if conditional and resp.headers.get("ETag"):
+            self.etags[key] = resp.headers["ETag"]
+        return resp
+
+
+# operations of the load phase, each takes (client, user, fakes, rng)
+
+def op_events(client, user, fakes, rng):
+    client.call("events", "GET", "/api/calendar/events", user, conditional=True)
+
+
+def op_add_event(client, user, fakes, rng):
+    due = datetime.now(timezone.utc) + timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 23))
+    client.call("add_event", "POST", "/api/calendar/events", user, json_body={
+        "title": f"Study session {rng.randint(1, 10**6)}",
+        "description": "Added by loadtest",
+        "dueDate": due.strftime("%Y-%m-%dT%H:00:00Z"),
+    })
+
+
+def op_get_settings(client, user, fakes, rng):
+    client.call("get_settings", "GET", "/api/settings", user, conditional=True)
+
+
+def op_put_settings(client, user, fakes, rng):
+    client.call("put_settings", "PUT", "/api/settings", user, json_body={
+        "email_notifications": rng.random() < 0.5,
+        "push_notifications": rng.random() < 0.5,
+        "reminder_before_hours": rng.choice([1, 2, 24]),
+        "reminder_before_minutes": rng.choice([0, 15, 30]),
+        "privacy_mode": False,
+        "data_sharing": False,
+    })
+
+
+def op_link_canvas(client, user, fakes, rng):
+    # move one assignment so the incremental sync has something to write
+    canvas, courses, assignments = fakes["canvas"], fakes["courses"], fakes["assignments"]
+    if courses and assignments:
+        course_id = user["first_course"] + rng.randrange(courses)
+        due = datetime.now(timezone.utc) + timedelta(days=rng.randint(1, 90))
+        canvas.put_assignment(user["canvas_token"], course_id, {
+            "id": course_id * 100000 + rng.randrange(assignments),
+            "name": "Rescheduled assignment",
+            "description": "<p>Moved by loadtest</p>",
+            "due_at": due.strftime("%Y-%m-%dT23:59:00Z"),
+        })
+    client.call("link_canvas", "POST", "/api/canvas/link", user,
+                json_body={"canvasToken": user["canvas_token"]})
+
+
+OPERATIONS = {
+    "events": op_events,
+    "add_event": op_add_event,
+    "get_settings": op_get_settings,
+    "put_settings": op_put_settings,
+    "link_canvas": op_link_canvas,
+}
+
+
+def setup_users(base_url, recorder, canvas, args):
+    """Register, log in and link every synthetic student, returns the users."""
+    def setup(n):
+        client = Client(base_url, recorder)
+        user = {
+            "email": f"loadtest{n}@vt.edu",
+            "canvas_token": f"canvas-{n}",
+            "first_course": n * args.courses + 1,
+        }
+        fake_canvas.seed(canvas, user["canvas_token"], args.courses, args.assignments,
+                         first_id=user["first_course"])
+        client.call("register", "POST", "/api/auth/register", user,
+                    json_body={"email": user["email"], "password": PASSWORD})
+        resp = client.call("login", "POST", "/api/auth/login", user,
+                           json_body={"email": user["email"], "password": PASSWORD})
+        if resp is None or resp.status_code != 200:
+            return None
+        body = resp.json()
+        user["id"], user["token"] = body["userId"], body["sessionToken"]
+        client.call("link_canvas_initial", "POST", "/api/canvas/link", user,
+                    json_body={"canvasToken": user["canvas_token"]})
+        client.call("link_google_initial", "POST", "/api/google/link", user,
+                    json_body={"googleToken": "loadtest-google"})
+        return user
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        users = [u for u in pool.map(setup, range(args.users)) if u is not None]
+    return users
+
+
+def run_load(base_url, recorder, users, fakes, mix, args):
+    """Send the weighted request mix from `--concurrency` clients for `--seconds`."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stop = threading.Event()
+
+    def client_loop(n):
+        rng = random.Random(args.seed + n)
+        client = Client(base_url, recorder)
+        while not stop.is_set():
+            op = rng.choices(names, weights)[0]
+            OPERATIONS[op](client, rng.choice(users), fakes, rng)
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--courses", type=int, default=6, help="Canvas courses per user")
+    parser.add_argument("--assignments", type=int, default=30, help="assignments per course")
+    parser.add_argument("--calendars", type=int, default=2, help="Google calendars")
+    parser.add_argument("--events", type=int, default=100, help="events per Google calendar")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake API delay in seconds")
+    parser.add_argument("--page-size", type=int, default=50, help="fake API page size cap")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="fake Canvas rate limit bucket per token, e.g. 700")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-metrics", action="store_true", help="run with metrics collection off")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    metrics.set_enabled(not args.no_metrics)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    canvas = fake_canvas.FakeCanvas(latency=args.latency, page_size=args.page_size,
+                                    rate_limit=args.rate_limit).start()
+    google = fake_google.FakeGoogleCalendar(latency=args.latency, page_size=args.page_size).start()
+    fake_google.seed(google, args.calendars, args.events)
+    canvas_sync.BASE_URL = canvas.url
+    google_calendar.BASE_URL = google.url
+
+    with tempfile.TemporaryDirectory() as tmp:
+        web.DATABASE = os.path.join(tmp, "loadtest.db")
+        with contextlib.redirect_stdout(sys.stderr):  # keep stdout pure JSON
+            web.init_db()
+        server = make_server("127.0.0.1", 0, web.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        setup = Recorder()
+        started = time.perf_counter()
+        users = setup_users(base_url, setup, canvas, args)
+        setup_seconds = time.perf_counter() - started
+        if not users:
+            raise SystemExit("No user could log in, is the app working?")
+
+        load = Recorder()
+        fakes = {"canvas": canvas, "courses": args.courses, "assignments": args.assignments}
+        upstream_before = canvas.requests + google.requests
+        run_load(base_url, load, users, fakes, mix, args)
+
+        server.shutdown()
+        dbpool.get_pool(web.DATABASE).close_all()
+    canvas.stop()
+    google.stop()
+
+    operations = load.summary(args.seconds)
+    total = sum(op["count"] for op in operations.values())
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "setup": {
+            "users": len(users),
+            "seconds": round(setup_seconds, 3),
+            "operations": setup.summary(setup_seconds),
+        },
+        "load": {
+            "requests": total,
+            "errors": sum(op["errors"] for op in operations.values()),
+            "rps": round(total / args.seconds, 2),
+            "upstream_requests": canvas.requests + google.requests - upstream_before,
+            "canvas_throttled": canvas.throttled,
+            "operations": operations,
+        },
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""In-process metrics, served by `/api/metrics` in Prometheus text format.
+
+Four places record into the module-level registry:
+
+- `app.py` times every request per route, method and status
+- `db.py` times every SQL statement run through a pooled connection and
+  counts the rows it returned or changed, labelled by `statement_label`
+  (verb and table, e.g. "SELECT calendar_events")
+- `http_client.py` times every outbound attempt per host and status, and
+  counts retries
+- `canvas_limiter.py` times how long Canvas requests queue and counts
+  throttled responses
+
+Collection is on unless METRICS_ENABLED=0, and can be switched at runtime
+with `set_enabled`. While it's off, `enabled()` is the only cost: pooled
+connections hand out plain sqlite3 cursors and nothing takes a lock.
+
+Label values include table names, Canvas hosts and route patterns, so the
+endpoint isn't public. With METRICS_TOKEN set a scraper must send it as a
+bearer token, without one only requests from this host are answered.
+
+There's no dependency on prometheus_client. Counters and histograms are
+plain dicts keyed on label values, each guarded by its own lock.
+"""
+import bisect
+import hmac
+import os
+import re
+import threading
+from functools import lru_cache
+
+_enabled = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+TOKEN = os.environ.get("METRICS_TOKEN", "")
+LOCAL_ADDRS = {"127.0.0.1", "::1"}
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(flag):
+    """Turn collection on or off. Already collected values are kept."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def allowed(remote_addr, authorization):
+    """Whether a request may read the metrics, see the module docstring."""
+    if TOKEN:
+        return hmac.compare_digest((authorization or "").encode(), f"Bearer {TOKEN}".encode())
+    return remote_addr in LOCAL_ADDRS
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(counts), total) for labels, (counts, total) in self._values.items())
+        for labels, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                le = bound if bound == "+Inf" else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {running}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total!r}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {running}"
+
+
+_registry = []
+
+
+def counter(name, help, labelnames=()):
+    metric = Counter(name, help, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, help, labelnames=(), buckets=BUCKETS):
+    metric = Histogram(name, help, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+request_seconds = histogram(
+    "http_request_duration_seconds", "Time spent handling API requests.",
+    ("method", "route", "status")
+)
+query_seconds = histogram(
+    "db_query_duration_seconds", "Time to execute an SQL statement, to the first row for queries.",
+    ("statement",)
+)
+query_rows = counter(
+    "db_query_rows_total", "Rows fetched by queries or changed by writes.",
+    ("statement",)
+)
+outbound_seconds = histogram(
+    "http_client_request_duration_seconds", "Time of each outbound API attempt, retries included.",
+    ("host", "method", "status")
+)
+outbound_retries = counter(
+    "http_client_retries_total", "Outbound API attempts that were retried.",
+    ("host",)
+)
+canvas_queue_seconds = histogram(
+    "canvas_queue_wait_seconds", "Time Canvas requests waited for a concurrency slot."
+)
+canvas_throttled = counter(
+    "canvas_throttled_total", "Canvas requests answered 403 Rate Limit Exceeded."
+)
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|INDEX)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.I)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Short, low-cardinality label of an SQL statement: its verb and table."""
+    words = sql.split(None, 2)
+    if not words:
+        return "EMPTY"
+    verb = words[0].upper()
+    if verb == "PRAGMA":
+        return f"PRAGMA {words[1].split('=')[0].split('(')[0].lower()}" if len(words) > 1 else verb
+    match = _TABLE.search(sql)
+    return f"{verb} {match.group(1)}" if match else verb
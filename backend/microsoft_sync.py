@@ -0,0 +1,260 @@
+"""Incremental Microsoft 365 (Outlook) calendar sync.
+
+`sync_microsoft` imports events from every calendar of a user's Microsoft
+account into `calendar_events` with Microsoft Graph `calendarView/delta`.
+The first sync of a calendar lists every event instance in a window of
+WINDOW_DAYS starting today. The `@odata.deltaLink` Graph returns on its last
+page is stored per calendar in `microsoft_sync_state`. Later syncs follow
+only that link, so Graph returns just the events that changed since. Deleted
+events come back as `@removed` entries and are removed locally.
+
+A delta link stays bound to the window it was created for. Once less than
+half of that window is left, the calendar is re-imported with a fresh window.
+The same happens when Graph rejects a link with 410 Gone. After such a full
+sync, stored events missing from the listing are removed.
+
+Calendars are fetched in parallel. Pages of one calendar are followed in
+order, since each page links to the next, and each is written as it
+arrives (see `pipeline`). Events are written as `event_records.EventRecord`s,
+so unchanged rows are left alone. Rows are keyed on
+`external_id = "<calendar id>:<event id>"`.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import db as dbpool
+import event_records
+import http_client
+import pipeline
+
+# base URL of Microsoft Graph, overridable to point at a local fake
+BASE_URL = os.environ.get("MICROSOFT_GRAPH_URL", "https://graph.microsoft.com/v1.0")
+
+# max number of calendars fetched in parallel
+MAX_WORKERS = int(os.environ.get("MICROSOFT_MAX_WORKERS", 4))
+
+# days of events covered by a delta link, starting on the day it was created
+WINDOW_DAYS = int(os.environ.get("MICROSOFT_SYNC_DAYS", 180))
+
+# page size requested from Graph
+PAGE_SIZE = 200
+
+DELETE_EVENT = "DELETE FROM calendar_events WHERE user_id = ? AND source = 'Microsoft' AND external_id = ?"
+
+SAVE_STATE = '''
+    INSERT INTO microsoft_sync_state (user_id, calendar_id, delta_link, window_end, last_synced_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, calendar_id) DO UPDATE SET
+        delta_link = excluded.delta_link,
+        window_end = COALESCE(excluded.window_end, window_end),
+        last_synced_at = excluded.last_synced_at
+'''
+
+
+class DeltaLinkExpired(Exception):
+    """Graph answered 410 Gone, the stored delta link can't be used."""
+
+
+def graph_headers(access_token):
+    """Request headers for Graph calls, with times returned in UTC."""
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Prefer": f'outlook.timezone="UTC", odata.maxpagesize={PAGE_SIZE}',
+    }
+
+
+def get_calendars(headers):
+    """Fetch the current user's calendars."""
+    url = f"{BASE_URL}/me/calendars"
+    params = {"$select": "id,name"}
+    calendars = []
+    while url:
+        resp = http_client.get(url, headers=headers, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+        calendars.extend(data.get("value", []))
+        # next links already carry the query string
+        url, params = data.get("@odata.nextLink"), None
+    return calendars
+
+
+def fetch_delta(calendar_id, headers, delta_link=None, now=None):
+    """Yield a calendar's events a page at a time, incrementally when a delta link is given.
+
+    Each page is a list of (possibly removed) events, the next delta link,
+    which Graph only sends with the last page, and the end of the window
+    it covers (None when following a stored link).
+    """
+    end = None
+    if delta_link:
+        url, params = delta_link, None
+    else:
+        start = (now or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+        window_end = start + timedelta(days=WINDOW_DAYS)
+        end = window_end.isoformat()
+        url = f"{BASE_URL}/me/calendars/{quote(calendar_id, safe='')}/calendarView/delta"
+        params = {
+            "startDateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "endDateTime": window_end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    while True:
+        resp = http_client.get(url, headers=headers, params=params)
+        if resp.status_code == 410:
+            raise DeltaLinkExpired(calendar_id)
+        resp.raise_for_status()
+        data = resp.json()
+        next_link = data.get("@odata.nextLink")
+        yield data.get("value", []), None if next_link else data.get("@odata.deltaLink"), end
+        if not next_link:
+            return
+        url, params = next_link, None
+
+
+def graph_time(event, key="start"):
+    """Stored form of a Graph event's start or end, None if it's missing.
+
+    Times are requested in UTC, all-day events keep only their date.
+    """
+    moment = event.get(key) or {}
+    value = moment.get("dateTime")
+    if not value:
+        return None
+    # Graph sends seven fractional digits, which fromisoformat can't read
+    value = value.split(".")[0]
+    if event.get("isAllDay"):
+        return value[:10]
+    if moment.get("timeZone", "UTC").upper() == "UTC":
+        return value + "Z"
+    return value
+
+
+def load_state(cursor, user_id):
+    """Stored delta links and window ends for a user, keyed by calendar id."""
+    cursor.execute(
+        'SELECT calendar_id, delta_link, window_end FROM microsoft_sync_state WHERE user_id = ?',
+        (user_id,)
+    )
+    return {row["calendar_id"]: row for row in cursor.fetchall()}
+
+
+def window_expiring(state, now):
+    """Whether less than half of a stored delta link's window is left."""
+    if not state or not state["window_end"]:
+        return True
+    try:
+        window_end = datetime.fromisoformat(state["window_end"])
+    except ValueError:
+        return True
+    return window_end - now < timedelta(days=WINDOW_DAYS / 2)
+
+
+def prune_calendar(writer, user_id, calendar_id, keep):
+    """Queue the removal of a calendar's stored events whose external id is not in `keep`."""
+    prefix = f"{calendar_id}:"
+    cursor = writer.db.execute(
+        '''SELECT external_id FROM calendar_events
+           WHERE user_id = ? AND source = 'Microsoft' AND substr(external_id, 1, ?) = ?''',
+        (user_id, len(prefix), prefix)
+    )
+    for row in cursor.fetchall():
+        if row["external_id"] not in keep:
+            writer.add(DELETE_EVENT, (user_id, row["external_id"]), "events")
+
+
+def listed_ids(calendar, events):
+    """External ids of the events a page lists, leaving out removed ones."""
+    return (f"{calendar['id']}:{event['id']}" for event in events if "@removed" not in event)
+
+
+def normalize_event(calendar, event):
+    """EventRecord of a Graph event, None if it has no start."""
+    due_date = event_records.timestamp(graph_time(event, "start"))
+    if not due_date:
+        return None
+    return event_records.EventRecord(
+        "Microsoft", f"{calendar['id']}:{event['id']}",
+        title=event.get("subject") or "(No title)",
+        description=event.get("bodyPreview") or "",
+        due_date=due_date,
+        end_date=event_records.timestamp(graph_time(event, "end")),
+        course_name=calendar.get("name"),
+    )
+
+
+def apply_event(writer, user_id, calendar, event):
+    """Queue the writes of one event from a (full or delta) listing, changed rows count under "events"."""
+    if "@removed" in event or event.get("isCancelled"):
+        writer.add(DELETE_EVENT, (user_id, f"{calendar['id']}:{event['id']}"), "events")
+        return
+
+    record = normalize_event(calendar, event)
+    if record is not None:
+        writer.add(event_records.UPSERT, record.row(user_id), "events")
+
+
+def save_state(writer, user_id, calendar_id, delta_link, window_end, synced_at):
+    """Queue a calendar's next delta link, keeping the window end it was created with."""
+    writer.add(SAVE_STATE, (user_id, calendar_id, delta_link, window_end, synced_at))
+
+
+def sync_microsoft(db, user_id, access_token, full=False):
+    """Sync a user's Microsoft calendars into the database.
+
+    Events stream from the fetching threads to a `pipeline.ChunkWriter` on
+    `db` a page at a time. Full chunks are committed as they fill, the last
+    one is left for the caller to commit. Returns counts of what was
+    fetched and changed, plus the sync time for the caller to record.
+    """
+    headers = graph_headers(access_token)
+    calendars = get_calendars(headers)
+    state = {} if full else load_state(db.cursor(), user_id)
+    now = datetime.now(timezone.utc)
+
+    # runs on the fetching threads, ends with a "done" message per calendar
+    # that was fetched in full
+    def produce(calendar):
+        previous = state.get(calendar["id"])
+        link = None if window_expiring(previous, now) else previous["delta_link"]
+        # ids in a full listing, to prune what it no longer has
+        keep = None if link else set()
+        delta_link = window_end = None
+        try:
+            try:
+                for events, delta_link, window_end in fetch_delta(calendar["id"], headers, link, now):
+                    yield "events", calendar, events
+                    if keep is not None:
+                        keep.update(listed_ids(calendar, events))
+            except DeltaLinkExpired:
+                keep = set()
+                for events, delta_link, window_end in fetch_delta(calendar["id"], headers, None, now):
+                    yield "events", calendar, events
+                    keep.update(listed_ids(calendar, events))
+        except Exception as e:
+            print(f"Error fetching events for calendar {calendar['id']}: {e}")
+            return
+        yield "done", calendar, (delta_link, window_end, keep)
+
+    writer = pipeline.ChunkWriter(
+        db, on_commit=lambda cursor: dbpool.bump_data_version(cursor, user_id))
+    stats = {"calendars": len(calendars), "eventsChanged": 0, "fullSyncs": 0}
+    synced_at = now.isoformat()
+
+    for kind, calendar, data in pipeline.fan_in(calendars, produce, MAX_WORKERS):
+        if kind == "events":
+            for event in data:
+                apply_event(writer, user_id, calendar, event)
+            continue
+
+        delta_link, window_end, keep = data
+        if keep is not None:
+            # a full listing replaces whatever was stored for the calendar
+            stats["fullSyncs"] += 1
+            prune_calendar(writer, user_id, calendar["id"], keep)
+        save_state(writer, user_id, calendar["id"], delta_link, window_end, synced_at)
+
+    writer.flush()
+    stats["eventsChanged"] = writer.count("events")
+    stats["syncedAt"] = synced_at
+    return stats
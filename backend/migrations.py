@@ -0,0 +1,309 @@
+"""Versioned schema migrations for the VT Calendar database.
+
+`init_db()` creates the original tables, then `migrate()` brings the schema
+forward one version at a time. The current version is kept in SQLite's
+`PRAGMA user_version`, so each migration runs exactly once per database.
+Every migration runs in its own transaction together with the version bump,
+so a failure leaves the database at the previous version.
+
+To change the schema, append a new `(version, description, function)` entry
+to `MIGRATIONS`. Never edit a migration that has already shipped.
+"""
+
+
+def _natural_keys(cursor):
+    """Add external ids, unique natural keys and lookup indexes."""
+
+    # id of the assignment/event in the source system (Canvas, Google, ...)
+    cursor.execute('ALTER TABLE calendar_events ADD COLUMN external_id TEXT')
+
+    # every re-link used to insert all assignments again. Before collapsing
+    # the duplicates, carry the completed flag over to the row we keep.
+    cursor.execute('''
+        UPDATE calendar_events SET completed = 1
+        WHERE source != 'Manual' AND completed = 0 AND EXISTS (
+            SELECT 1 FROM calendar_events d
+            WHERE d.user_id = calendar_events.user_id
+              AND d.source = calendar_events.source
+              AND d.canvas_course_id IS calendar_events.canvas_course_id
+              AND d.title IS calendar_events.title
+              AND d.due_date IS calendar_events.due_date
+              AND d.completed = 1
+        )
+    ''')
+    cursor.execute('''
+        DELETE FROM calendar_events
+        WHERE source != 'Manual' AND id NOT IN (
+            SELECT MIN(id) FROM calendar_events
+            WHERE source != 'Manual'
+            GROUP BY user_id, source, canvas_course_id, title, due_date
+        )
+    ''')
+
+    # keep the most recently stored copy of each course
+    cursor.execute('''
+        DELETE FROM canvas_courses
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM canvas_courses GROUP BY user_id, course_id
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_events_natural_key
+        ON calendar_events (user_id, source, external_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_user_due
+        ON calendar_events (user_id, due_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_user_source
+        ON calendar_events (user_id, source)
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_courses_natural_key
+        ON canvas_courses (user_id, course_id)
+    ''')
+
+
+def _data_versions(cursor):
+    """Per-user data version, bumped on every change to a user's data."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _canvas_sync_state(cursor):
+    """Watermarks for incremental Canvas syncs."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS canvas_sync_state (
+            user_id INTEGER NOT NULL,
+            course_id TEXT NOT NULL,
+            etag TEXT,
+            pages INTEGER,
+            max_updated_at TEXT,
+            last_synced_at DATETIME,
+            PRIMARY KEY (user_id, course_id),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute('ALTER TABLE connected_accounts ADD COLUMN last_synced_at DATETIME')
+
+
+def _google_sync_state(cursor):
+    """Per-calendar sync tokens for incremental Google syncs."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS google_sync_state (
+            user_id INTEGER NOT NULL,
+            calendar_id TEXT NOT NULL,
+            sync_token TEXT,
+            last_synced_at DATETIME,
+            PRIMARY KEY (user_id, calendar_id),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _sync_jobs(cursor):
+    """Persistent schedule for the background sync worker."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            user_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            next_run_at REAL NOT NULL,
+            locked_until REAL,
+            last_run_at REAL,
+            last_error TEXT,
+            failures INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, provider),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sync_jobs_next_run
+        ON sync_jobs (next_run_at)
+    ''')
+
+
+def _reminder_indexes(cursor):
+    """Indexes for loading pending reminders and polling changed users."""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_pending_reminders
+        ON calendar_events (due_date)
+        WHERE completed = 0 AND reminder_sent < 2
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_data_versions_updated
+        ON user_data_versions (updated_at)
+    ''')
+
+
+def _calendar_feeds(cursor):
+    """Secret tokens for per-user iCalendar subscription feeds."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calendar_feeds (
+            user_id INTEGER PRIMARY KEY,
+            token TEXT UNIQUE NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _microsoft_sync_state(cursor):
+    """Per-calendar delta links for incremental Microsoft Graph syncs."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS microsoft_sync_state (
+            user_id INTEGER NOT NULL,
+            calendar_id TEXT NOT NULL,
+            delta_link TEXT,
+            window_end TEXT,
+            last_synced_at DATETIME,
+            PRIMARY KEY (user_id, calendar_id),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _session_indexes(cursor):
+    """Indexes for sweeping expired login sessions."""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_login_sessions_expires
+        ON login_sessions (expires_at)
+    ''')
+
+
+def _recurrence(cursor):
+    """Recurring masters and overridden instances, see recurrence.py."""
+    for column in ('rrule', 'exdates', 'tzid', 'master_id', 'recurrence_id'):
+        cursor.execute(f'ALTER TABLE calendar_events ADD COLUMN {column} TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_recurring_masters
+        ON calendar_events (user_id, due_date)
+        WHERE rrule IS NOT NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_overrides
+        ON calendar_events (user_id, master_id)
+        WHERE master_id IS NOT NULL
+    ''')
+
+
+def _end_dates(cursor):
+    """End times of events that have one, for free/busy queries."""
+    cursor.execute('ALTER TABLE calendar_events ADD COLUMN end_date TEXT')
+
+
+def _content_hash(cursor):
+    """Hash of each synced row's content, so unchanged events aren't rewritten."""
+    cursor.execute('ALTER TABLE calendar_events ADD COLUMN content_hash TEXT')
+
+
+def _event_search(cursor):
+    """Full-text index over event titles, descriptions and course names, see search.py.
+
+    The triggers call `strip_html`, which `db.connect` registers on every
+    connection, so rows must be written through the pool.
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS calendar_events_fts USING fts5(
+            owner, title, description, course_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+    ''')
+    indexed = "(rowid, owner, title, description, course_name)"
+    values = "(new.id, 'u' || new.user_id, new.title, strip_html(new.description), new.course_name)"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_insert
+        AFTER INSERT ON calendar_events BEGIN
+            INSERT INTO calendar_events_fts {indexed} VALUES {values};
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_delete
+        AFTER DELETE ON calendar_events BEGIN
+            DELETE FROM calendar_events_fts WHERE rowid = old.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_update
+        AFTER UPDATE OF user_id, title, description, course_name ON calendar_events BEGIN
+            DELETE FROM calendar_events_fts WHERE rowid = old.id;
+            INSERT INTO calendar_events_fts {indexed} VALUES {values};
+        END
+    ''')
+    cursor.execute(f'''
+        INSERT INTO calendar_events_fts {indexed}
+        SELECT id, 'u' || user_id, title, strip_html(description), course_name FROM calendar_events
+    ''')
+
+
+def _override_instances(cursor):
+    """Overrides by the instance they replace, for windowed event queries."""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_override_instances
+        ON calendar_events (user_id, recurrence_id)
+        WHERE master_id IS NOT NULL
+    ''')
+
+
+def _session_revocations(cursor):
+    """Log of ended sessions, so other processes drop them from their caches."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_revocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_token TEXT NOT NULL,
+            revoked_at REAL NOT NULL
+        )
+    ''')
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, 'natural keys and indexes for calendar_events and canvas_courses', _natural_keys),
+    (2, 'per-user data versions for conditional GETs', _data_versions),
+    (3, 'incremental Canvas sync state', _canvas_sync_state),
+    (4, 'Google Calendar sync tokens', _google_sync_state),
+    (5, 'background sync job table', _sync_jobs),
+    (6, 'pending reminder indexes', _reminder_indexes),
+    (7, 'iCalendar feed tokens', _calendar_feeds),
+    (8, 'Microsoft Graph delta links', _microsoft_sync_state),
+    (9, 'login session expiry index', _session_indexes),
+    (10, 'recurring event masters and overrides', _recurrence),
+    (11, 'event end times', _end_dates),
+    (12, 'event content hashes', _content_hash),
+    (13, 'full-text event search', _event_search),
+    (14, 'override instance index', _override_instances),
+    (15, 'login session revocation log', _session_revocations),
+]
+
+
+def current_version(db):
+    """Schema version the database is at."""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db):
+    """Apply every migration newer than the database's current version."""
+    version = current_version(db)
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        cursor = db.cursor()
+        cursor.execute('BEGIN')
+        try:
+            apply(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(target)}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        print(f'Applied migration {target}: {description}')
+        version = target
+    return version
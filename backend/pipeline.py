@@ -0,0 +1,150 @@
+"""Streaming fetch-to-database pipeline shared by the syncs.
+
+`canvas_sync`, `google_sync` and `microsoft_sync` don't collect a whole
+listing before writing it. Each runs the same pipeline:
+
+    paginated fetch -> filter -> normalize     worker threads, one source at a time
+        -> bounded queue                       backpressure
+        -> ChunkWriter                         calling thread, executemany per chunk
+
+`fan_in` runs a generator per source (a course or a calendar) on a few
+worker threads and yields what they produce in arrival order. Sources are
+taken from their iterable lazily, one per free worker, and the queue holds
+at most SYNC_QUEUE_SIZE batches, so workers stop fetching while the writer
+is behind.
+
+`ChunkWriter` buffers statements and, once SYNC_CHUNK_SIZE rows are
+waiting, runs each run of consecutive statements with the same SQL as one
+`executemany`, in the order they were added. Full chunks are committed
+right away, so the write lock is never held while a page is being fetched.
+A chunk that changed any counted rows runs the writer's `on_commit` hook
+first, in the same transaction: the syncs bump the user's data version
+there, so rows committed by a sync that later fails never hide behind an
+old ETag. The last, partial chunk runs the hook when it's flushed and is
+left for the caller to commit together with its own bookkeeping. Every
+write is an idempotent upsert or delete, and a source's watermark is
+written after its rows, so a sync that fails halfway leaves nothing the
+next sync won't redo.
+
+Peak memory is a page per worker, the queue and one chunk, however many
+events a user has.
+"""
+import os
+import queue
+import threading
+
+# rows written per executemany/commit
+CHUNK_SIZE = int(os.environ.get("SYNC_CHUNK_SIZE", 500))
+
+# batches buffered between the fetching workers and the writer
+QUEUE_SIZE = int(os.environ.get("SYNC_QUEUE_SIZE", 8))
+
+_DONE = object()
+
+
+class _Failure:
+    """An exception raised in a worker, handed to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def fan_in(sources, produce, workers, queue_size=QUEUE_SIZE):
+    """Yield every item of `produce(source)` for each source, produced on worker threads.
+
+    An exception escaping a producer (or the sources iterable) is raised
+    here. Closing the generator early makes the workers stop.
+    """
+    items = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    sources = iter(sources)
+    sources_lock = threading.Lock()
+
+    def put(item):
+        # wait for room while the consumer is behind, unless it went away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work():
+        try:
+            while not stop.is_set():
+                with sources_lock:
+                    source = next(sources, _DONE)
+                if source is _DONE:
+                    break
+                for item in produce(source):
+                    if not put(item):
+                        return
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            put(_DONE)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            item = items.get()
+            if item is _DONE:
+                running -= 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield item
+    finally:
+        stop.set()
+
+
+class ChunkWriter:
+    """Ordered, chunked `executemany` writes on one connection.
+
+    `on_commit(cursor)` runs once rows that changed a counter are written,
+    inside the transaction that will commit them. That includes the last
+    chunk, which `flush()` leaves for the caller to commit.
+    """
+
+    def __init__(self, db, chunk_size=CHUNK_SIZE, on_commit=None):
+        self.db = db
+        self.cursor = db.cursor()
+        self.chunk_size = max(1, chunk_size)
+        self.on_commit = on_commit
+        self.counts = {}  # counter name -> rows changed
+        self._runs = []  # (sql, counter, [params, ...]) in the order they were added
+        self._pending = 0
+        self._changed = 0  # counted rows changed since the last commit
+
+    def add(self, sql, params, counter=None):
+        """Queue one statement, adding the rows it changes to `counter`."""
+        if self._runs and self._runs[-1][0] == sql and self._runs[-1][1] == counter:
+            self._runs[-1][2].append(params)
+        else:
+            self._runs.append((sql, counter, [params]))
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self.flush(commit=True)
+
+    def flush(self, commit=False):
+        """Run every queued statement, then commit if asked."""
+        for sql, counter, rows in self._runs:
+            self.cursor.executemany(sql, rows)
+            if counter:
+                changed = max(self.cursor.rowcount, 0)
+                self.counts[counter] = self.counts.get(counter, 0) + changed
+                self._changed += changed
+        self._runs.clear()
+        self._pending = 0
+        if self._changed and self.on_commit:
+            self.on_commit(self.cursor)
+        self._changed = 0
+        if commit:
+            self.db.commit()
+
+    def count(self, counter):
+        return self.counts.get(counter, 0)
@@ -0,0 +1,372 @@
+"""Lazy expansion of recurring events.
+
+A recurring event is stored once, as a master row in `calendar_events`:
+
+- `due_date` is the start of the first instance
+- `rrule` is its RFC 5545 RRULE value, e.g. "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261211T045959Z"
+- `exdates` lists the starts of removed instances, comma separated
+- `tzid` is the time zone the instances repeat in, so a 10:00 lecture
+  stays at 10:00 local time across daylight saving changes
+
+An instance that was moved or edited is stored as an override row whose
+`master_id` is the master's `external_id` and whose `recurrence_id` is the
+start of the instance it replaces. A cancelled instance is an override with
+no `due_date`.
+
+Instances are never stored. `expand` generates the starts that fall inside
+a requested window, and results are kept in a bounded LRU cache
+(RECURRENCE_CACHE_SIZE) keyed on the master's columns and the window, so an
+edited master can never hit a stale entry. A query without a start lists
+instances from RECURRENCE_LOOKBACK_DAYS ago (`default_start`), so
+MAX_INSTANCES is never used up on years of past instances.
+
+Supported rules (see `RULE_PARTS`) are DAILY/WEEKLY/MONTHLY/YEARLY with
+INTERVAL, COUNT and UNTIL, and:
+
+- WEEKLY: BYDAY
+- MONTHLY: BYDAY, with ordinals like 2TU or -1FR, or BYMONTHDAY
+- YEARLY: BYMONTH, with BYDAY or BYMONTHDAY inside those months
+
+Any other rule expands to the first instance alone, rather than to a guess
+at the others. A rule that stops matching, like Feb 30, ends after
+MAX_EMPTY_PERIODS months or years without an instance.
+
+Instance starts are normalized like `normalize`: dates stay "YYYY-MM-DD",
+times with a zone become UTC "YYYY-MM-DDTHH:MM:SSZ", floating times stay
+naive. Overrides and EXDATEs are matched on that form.
+"""
+import calendar
+import os
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import ics
+
+CACHE_SIZE = int(os.environ.get("RECURRENCE_CACHE_SIZE", 4096))
+
+# most instances one expansion returns
+MAX_INSTANCES = int(os.environ.get("RECURRENCE_MAX_INSTANCES", 1000))
+
+# how far ahead instances are listed when a query has no end
+HORIZON_DAYS = int(os.environ.get("RECURRENCE_HORIZON_DAYS", 365))
+
+# how far back instances are listed when a query has no start
+LOOKBACK_DAYS = int(os.environ.get("RECURRENCE_LOOKBACK_DAYS", 365))
+
+# months or years in a row without an instance after which a rule is done
+MAX_EMPTY_PERIODS = 50
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+# RRULE parts each frequency is expanded with
+RULE_PARTS = {
+    "DAILY": {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST"},
+    "WEEKLY": {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST", "BYDAY"},
+    "MONTHLY": {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST", "BYDAY", "BYMONTHDAY"},
+    "YEARLY": {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST", "BYDAY", "BYMONTHDAY", "BYMONTH"},
+}
+
+
+def parse_value(value):
+    """datetime (aware or naive) or date of a stored or Google date string."""
+    value = value.strip()
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    if len(value) in (8, 15, 16) and "-" not in value:
+        # iCalendar basic form, 20261211 / 20261211T045959 / 20261211T045959Z
+        if len(value) == 8:
+            return datetime.strptime(value, "%Y%m%d").date()
+        parsed = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+        return parsed.replace(tzinfo=timezone.utc) if value.endswith("Z") else parsed
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def format_value(value):
+    """Normalized string form of a date, naive or aware datetime."""
+    if not isinstance(value, datetime):
+        return value.isoformat()
+    if value.tzinfo is None:
+        return value.strftime("%Y-%m-%dT%H:%M:%S")
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def normalize(value):
+    """Normalized form of a date string, None if it can't be parsed."""
+    if not value:
+        return None
+    try:
+        return format_value(parse_value(value))
+    except ValueError:
+        return None
+
+
+def parse_rule(text):
+    """RRULE value as a dict of upper-cased parts."""
+    rule = {}
+    for part in text.removeprefix("RRULE:").split(";"):
+        key, _, value = part.partition("=")
+        if key:
+            rule[key.strip().upper()] = value.strip().upper()
+    return rule
+
+
+def _numbers(value, low, high):
+    """Whether a comma separated list holds only integers with low <= |n| <= high."""
+    try:
+        return all(low <= abs(int(part)) <= high for part in value.split(","))
+    except ValueError:
+        return False
+
+
+def _weekdays(value, ordinals):
+    """Whether a BYDAY list is valid, with 1TU/-1FR style ordinals when allowed."""
+    for part in value.split(","):
+        if part[-2:] not in WEEKDAYS:
+            return False
+        if part[:-2] and not (ordinals and _numbers(part[:-2], 1, 5)):
+            return False
+    return True
+
+
+def supported(rule):
+    """Whether `expand` lists every instance of a parsed rule, see RULE_PARTS."""
+    freq = rule.get("FREQ")
+    if freq not in RULE_PARTS or not set(rule) <= RULE_PARTS[freq]:
+        return False
+    if not rule.get("INTERVAL", "1").isdigit() or rule.get("INTERVAL") == "0":
+        return False
+    if "COUNT" in rule and not rule["COUNT"].isdigit():
+        return False
+    # weeks start on Monday, which only matters for every other week and so on
+    if rule.get("WKST", "MO") != "MO" and freq == "WEEKLY" and rule.get("INTERVAL", "1") != "1":
+        return False
+    if "BYDAY" in rule and not _weekdays(rule["BYDAY"], ordinals=freq != "WEEKLY"):
+        return False
+    if "BYMONTHDAY" in rule and not _numbers(rule["BYMONTHDAY"], 1, 31):
+        return False
+    if "BYMONTH" in rule and not (_numbers(rule["BYMONTH"], 1, 12) and "-" not in rule["BYMONTH"]):
+        return False
+    if "BYDAY" in rule and "BYMONTHDAY" in rule:
+        return False  # the days matching both
+    if freq == "YEARLY" and ("BYDAY" in rule or "BYMONTHDAY" in rule) and "BYMONTH" not in rule:
+        return False  # days of the whole year
+    return True
+
+
+def _zone(tzid):
+    try:
+        return ZoneInfo(tzid) if tzid else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _add_months(year, month, months):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _month_days(year, month, rule, first):
+    """Days of a month an instance falls on, in order."""
+    days = []
+    last = calendar.monthrange(year, month)[1]
+    if "BYMONTHDAY" in rule:
+        for part in rule["BYMONTHDAY"].split(","):
+            day = int(part)
+            day = day if day > 0 else last + day + 1
+            if 1 <= day <= last:
+                days.append(day)
+    elif "BYDAY" in rule:
+        for part in rule["BYDAY"].split(","):
+            weekday = WEEKDAYS.get(part[-2:])
+            if weekday is None:
+                continue
+            matches = [d for d in range(1, last + 1) if date(year, month, d).weekday() == weekday]
+            ordinal = part[:-2]
+            if ordinal:
+                n = int(ordinal)
+                if -len(matches) <= n <= len(matches) and n != 0:
+                    days.append(matches[n - 1 if n > 0 else n])
+            else:
+                days.extend(matches)
+    elif first.day <= last:
+        days.append(first.day)
+    return sorted(set(days))
+
+
+def _candidates(first, rule, skip_to=None):
+    """Local start dates of each instance, in order, from the first one.
+
+    With `skip_to` (and no COUNT) whole periods before it are skipped.
+    """
+    freq = rule.get("FREQ", "DAILY")
+    interval = max(1, int(rule.get("INTERVAL", 1) or 1))
+
+    if freq == "DAILY":
+        k = 0
+        if skip_to is not None and skip_to > first:
+            k = (skip_to - first).days // interval
+        while True:
+            yield first + timedelta(days=k * interval)
+            k += 1
+
+    elif freq == "WEEKLY":
+        weekdays = sorted({WEEKDAYS[d[-2:]] for d in rule.get("BYDAY", "").split(",")
+                           if d[-2:] in WEEKDAYS} or {first.weekday()})
+        week = first - timedelta(days=first.weekday())
+        k = 0
+        if skip_to is not None and skip_to > first:
+            k = max(0, (skip_to - week).days // (7 * interval) - 1)
+        while True:
+            start = week + timedelta(weeks=k * interval)
+            for weekday in weekdays:
+                day = start + timedelta(days=weekday)
+                if day >= first:
+                    yield day
+            k += 1
+
+    elif freq == "MONTHLY":
+        k = empty = 0
+        while empty < MAX_EMPTY_PERIODS:
+            year, month = _add_months(first.year, first.month, k * interval)
+            if year > date.max.year:
+                return
+            days = _month_days(year, month, rule, first)
+            for day in days:
+                candidate = date(year, month, day)
+                if candidate >= first:
+                    yield candidate
+            empty = 0 if days else empty + 1
+            k += 1
+
+    elif freq == "YEARLY":
+        months = sorted(int(m) for m in rule.get("BYMONTH", "").split(",") if m) or [first.month]
+        k = empty = 0
+        while empty < MAX_EMPTY_PERIODS:
+            year = first.year + k * interval
+            if year > date.max.year:
+                return
+            found = False
+            for month in months:
+                for day in _month_days(year, month, rule, first):
+                    found = True
+                    candidate = date(year, month, day)
+                    if candidate >= first:
+                        yield candidate
+            empty = 0 if found else empty + 1
+            k += 1
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def expand(dtstart, rrule, tzid=None, exdates=None, window_start=None, window_end=None,
+           limit=MAX_INSTANCES):
+    """Normalized starts of the instances with window_start <= start < window_end.
+
+    Window bounds are compared as strings, like every other due date query.
+    A rule `supported` can't expand gives the first instance alone.
+    Returns a tuple so the result can be cached and shared.
+    """
+    try:
+        start = parse_value(dtstart)
+        rule = parse_rule(rrule)
+        until = parse_value(rule["UNTIL"]) if rule.get("UNTIL") else None
+    except (ValueError, KeyError):
+        return ()
+    excluded = {normalize(e) for e in (exdates or "").split(",") if e}
+    if not supported(rule):
+        text = format_value(start)
+        if text in excluded or (window_start and text < window_start) or (window_end and text >= window_end):
+            return ()
+        return (text,)
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+
+    # instances repeat on the wall clock of the master's zone
+    all_day = not isinstance(start, datetime)
+    zone = _zone(tzid) if not all_day and start.tzinfo is not None else None
+    if zone is not None:
+        start = start.astimezone(zone)
+    first = start if all_day else start.date()
+    clock = None if all_day else start.timetz() if zone is None else start.time()
+
+    def instance(day):
+        if all_day:
+            return day
+        if zone is not None:
+            return datetime.combine(day, clock).replace(tzinfo=zone)
+        return datetime.combine(day, clock)
+
+    skip_to = None
+    if count is None and window_start:
+        try:
+            lower = parse_value(window_start)
+            skip_to = lower.date() if isinstance(lower, datetime) else lower
+            skip_to -= timedelta(days=1)  # time zones can move an instance across midnight
+        except ValueError:
+            pass
+
+    found = []
+    try:
+        for n, day in enumerate(_candidates(first, rule, skip_to)):
+            if count is not None and n >= count:
+                break
+            value = instance(day)
+            if until is not None and _after(value, until):
+                break
+            text = format_value(value)
+            if window_end and text >= window_end:
+                break
+            if text in excluded or (window_start and text < window_start):
+                continue
+            found.append(text)
+            if len(found) >= limit:
+                break
+    except OverflowError:
+        pass  # ran past year 9999
+    return tuple(found)
+
+
+def _after(value, until):
+    """Whether an instance starts after a rule's UNTIL."""
+    if isinstance(value, datetime) and isinstance(until, datetime):
+        if (value.tzinfo is None) != (until.tzinfo is None):
+            value, until = value.replace(tzinfo=None), until.replace(tzinfo=None)
+        return value > until
+    as_date = value.date() if isinstance(value, datetime) else value
+    until_date = until.date() if isinstance(until, datetime) else until
+    return as_date > until_date
+
+
+def instance_end(dtstart, dtend, instance):
+    """End of an instance, keeping the master's duration. None without an end."""
+    if not dtend:
+        return None
+    try:
+        start, end, at = parse_value(dtstart), parse_value(dtend), parse_value(instance)
+        return format_value(at + (end - start))
+    except (TypeError, ValueError):
+        return None  # mixed date/time or naive/aware values
+
+
+def default_start():
+    """Window start used when a query has none."""
+    return (datetime.now(timezone.utc) - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+
+
+def default_end():
+    """Window end used when a query has none."""
+    return (datetime.now(timezone.utc) + timedelta(days=HORIZON_DAYS)).strftime("%Y-%m-%d")
+
+
+def split_recurrence(lines):
+    """(RRULE value, comma separated EXDATEs) of Google/iCalendar recurrence lines."""
+    rrule, exdates = None, []
+    for line in lines or ():
+        name, params, value = ics.parse_line(line)
+        if name == "RRULE" and rrule is None:
+            rrule = value
+        elif name == "EXDATE":
+            for part in value.split(","):
+                parsed = ics.parse_date(params, part)
+                if parsed:
+                    exdates.append(normalize(parsed))
+    return rrule, ",".join(e for e in exdates if e) or None
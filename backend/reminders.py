@@ -0,0 +1,363 @@
+"""Reminder dispatch engine.
+
+Each user gets up to two reminders per event, from `user_settings`:
+`reminder_before_hours` before the due date, and a second one
+`reminder_before_minutes` before it (0 turns the second one off).
+`calendar_events.reminder_sent` counts how many of them have gone out,
+skipped ones included, and syncs reset it to 0 when an event's due date
+moves. A stage whose time already passed when it's scheduled, because the
+event was added less than `reminder_before_hours` before its due date or
+the engine was stopped, is skipped rather than sent late.
+
+A recurring event's instances share their master's row (see
+`recurrence.py`), so they have no `reminder_sent` of their own. The engine
+expands each master and schedules the next stage still ahead of the clock
+for its next instance, skipping instances an override row replaces (the
+override is scheduled like any other event).
+
+Instead of scanning every event each minute, the engine keeps a heap of
+next fire times. The heap is built once from an indexed query over pending
+events. After that, users whose `user_data_versions` row changed are
+reloaded on the next tick, which covers new events, edits and settings
+changes. A tick only pops reminders that are due. Replaced heap entries are
+skipped when popped instead of being searched for and removed.
+
+Due reminders go to a pluggable delivery backend in one batch, and
+`reminder_sent` is updated with a single `executemany`. Set
+REMINDER_BACKEND to "module:Class" to use another backend. The default
+prints reminders. `StubBackend` keeps them in memory for tests.
+
+Run standalone with `python reminders.py`. The sync worker in `scheduler.py`
+also runs it.
+"""
+import heapq
+import importlib
+import os
+import signal
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import app as web
+import recurrence
+
+TICK = float(os.environ.get("REMINDER_TICK_SECONDS", 1))
+
+Reminder = namedtuple("Reminder", "event_id user_id title due_date stage email push")
+
+
+class PrintBackend:
+    """Delivery backend that writes reminders to stdout."""
+
+    def send(self, reminders):
+        for r in reminders:
+            print(f"Reminder {r.stage} for user {r.user_id}: {r.title} (due {r.due_date})")
+
+
+class StubBackend:
+    """Delivery backend that keeps every reminder in memory."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminders):
+        self.sent.extend(reminders)
+
+
+def load_backend(spec=None):
+    """Instantiate the backend named by `spec` ("module:Class")."""
+    spec = spec or os.environ.get("REMINDER_BACKEND")
+    if not spec:
+        return PrintBackend()
+    module_name, class_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def parse_due(value):
+    """Epoch seconds for a stored due date, None if it can't be parsed.
+
+    Date-only values are taken as midnight and naive times as UTC.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def notify_channels(row):
+    """(email, push) flags of an event's reminders, None when both are off."""
+    email, push = row["email_notifications"], row["push_notifications"]
+    if email is None and push is None:
+        email = push = 1  # no settings row yet, defaults apply
+    if not (email or push):
+        return None
+    return bool(email), bool(push)
+
+
+def reminder_leads(settings):
+    """Seconds-before-due of each reminder stage, earliest first."""
+    hours = settings["reminder_before_hours"]
+    minutes = settings["reminder_before_minutes"]
+    leads = [24 * 3600 if hours is None else hours * 3600]
+    if minutes is None or minutes > 0:
+        leads.append(60 * 60 if minutes is None else minutes * 60)
+    return sorted(leads, reverse=True)
+
+
+# most stages an event can have, the queries only load events with one to go.
+# It's inlined in them so idx_events_pending_reminders still matches.
+STAGES = len(reminder_leads({"reminder_before_hours": None, "reminder_before_minutes": None}))
+
+
+PENDING_COLUMNS = '''
+    e.id, e.user_id, e.title, e.due_date, e.reminder_sent,
+    s.reminder_before_hours, s.reminder_before_minutes,
+    s.email_notifications, s.push_notifications
+'''
+
+SERIES_COLUMNS = PENDING_COLUMNS + ', e.source, e.external_id, e.rrule, e.tzid, e.exdates'
+
+
+class ReminderEngine:
+    """Heap of next reminder fire times, kept in sync with the database."""
+
+    def __init__(self, backend=None, clock=time.time):
+        self.backend = backend or load_backend()
+        self.clock = clock
+        self._heap = []  # (fire_at, event_id, stage)
+        self._current = {}  # event_id -> (fire_at, stage, Reminder) for the live entry
+        self._by_user = {}  # user_id -> set of event ids with a live entry
+        self._series = {}  # master event id -> (row, replaced instances) for recurring events
+        self._versions = {}  # user_id -> data version already loaded
+        self._polled_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self._current)
+
+    def _schedule(self, row):
+        """Push the next unsent stage of an event, if any."""
+        channels = notify_channels(row)
+        if channels is None:
+            return
+        now = self.clock()
+        due = parse_due(row["due_date"])
+        if due is None or due < now:
+            return
+        leads = reminder_leads(row)
+        sent = int(row["reminder_sent"] or 0)
+        while sent < len(leads) and due - leads[sent] < now:
+            sent += 1
+        if sent >= len(leads):
+            return
+        self._push(row, row["due_date"], sent + 1, due - leads[sent], channels)
+
+    def _schedule_series(self, row, replaced):
+        """Push the next stage ahead of the clock of a recurring event's instances, if any."""
+        channels = notify_channels(row)
+        if channels is None:
+            return
+        now = self.clock()
+        leads = reminder_leads(row)
+        instances = recurrence.expand(row["due_date"], row["rrule"], row["tzid"], row["exdates"],
+                                      self._horizon(), self._window_end())
+        for instance in instances:
+            if (row["source"], row["external_id"], instance) in replaced:
+                continue
+            due = parse_due(instance)
+            if due is None or due <= now:
+                continue
+            for stage, lead in enumerate(leads, 1):
+                if due - lead > now:
+                    self._series[row["id"]] = (row, replaced)
+                    self._push(row, instance, stage, due - lead, channels)
+                    return
+
+    def _push(self, row, due_date, stage, fire_at, channels):
+        reminder = Reminder(row["id"], row["user_id"], row["title"], due_date, stage, *channels)
+        self._current[row["id"]] = (fire_at, stage, reminder)
+        self._by_user.setdefault(row["user_id"], set()).add(row["id"])
+        heapq.heappush(self._heap, (fire_at, row["id"], stage))
+
+    def _forget_user(self, user_id):
+        for event_id in self._by_user.pop(user_id, ()):
+            self._current.pop(event_id, None)
+            self._series.pop(event_id, None)
+
+    def _horizon(self):
+        # lenient lower bound for the string comparison on due_date,
+        # exact filtering happens in _schedule
+        return datetime.fromtimestamp(self.clock() - 86400, timezone.utc).strftime("%Y-%m-%d")
+
+    def _window_end(self):
+        # how far ahead recurring events are expanded
+        seconds = recurrence.HORIZON_DAYS * 86400
+        return datetime.fromtimestamp(self.clock() + seconds, timezone.utc).strftime("%Y-%m-%d")
+
+    def _load(self, db, user_id=None):
+        """Pending events, recurring masters and replaced instances, of one user or everyone."""
+        where, params = ('e.user_id = ? AND ', [user_id]) if user_id is not None else ('', [])
+        rows = db.execute(
+            f'''SELECT {PENDING_COLUMNS}
+                FROM calendar_events e
+                LEFT JOIN user_settings s ON s.user_id = e.user_id
+                WHERE {where}e.due_date >= ? AND e.completed = 0 AND e.reminder_sent < {STAGES}
+                  AND e.rrule IS NULL''',
+            params + [self._horizon()]
+        ).fetchall()
+        masters = db.execute(
+            f'''SELECT {SERIES_COLUMNS}
+                FROM calendar_events e
+                LEFT JOIN user_settings s ON s.user_id = e.user_id
+                WHERE {where}e.rrule IS NOT NULL AND e.due_date < ? AND e.completed = 0''',
+            params + [self._window_end()]
+        ).fetchall()
+        replaced = {}
+        for row in db.execute(
+            f'''SELECT e.user_id, e.source, e.master_id, e.recurrence_id FROM calendar_events e
+                WHERE {where}e.master_id IS NOT NULL''',
+            params
+        ):
+            replaced.setdefault(row["user_id"], set()).add(
+                (row["source"], row["master_id"], row["recurrence_id"]))
+        return rows, masters, replaced
+
+    def rebuild(self):
+        """Load every pending reminder from the database."""
+        db = web.get_db()
+        try:
+            rows, masters, replaced = self._load(db)
+            versions = db.execute('SELECT user_id, version FROM user_data_versions').fetchall()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._heap, self._current, self._by_user, self._series = [], {}, {}, {}
+            for row in rows:
+                self._schedule(row)
+            for row in masters:
+                self._schedule_series(row, replaced.get(row["user_id"], set()))
+            self._versions = {row["user_id"]: row["version"] for row in versions}
+            self._polled_at = time.time()
+
+    def reload_user(self, db, user_id):
+        """Replace a user's entries after their events or settings changed."""
+        rows, masters, replaced = self._load(db, user_id)
+        with self._lock:
+            self._forget_user(user_id)
+            for row in rows:
+                self._schedule(row)
+            for row in masters:
+                self._schedule_series(row, replaced.get(user_id, set()))
+
+    def poll_changes(self, db):
+        """Reload users whose data version moved since the last poll."""
+        # updated_at is wall-clock time, with some slack for clock skew
+        since = self._polled_at - 5 if self._polled_at else 0
+        self._polled_at = time.time()
+        rows = db.execute(
+            'SELECT user_id, version FROM user_data_versions WHERE updated_at >= ?',
+            (since,)
+        ).fetchall()
+        for row in rows:
+            if self._versions.get(row["user_id"]) != row["version"]:
+                self.reload_user(db, row["user_id"])
+                self._versions[row["user_id"]] = row["version"]
+
+    def pop_due(self, now):
+        """Take every reminder whose fire time has passed."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, event_id, stage = heapq.heappop(self._heap)
+                current = self._current.get(event_id)
+                if current is None or current[:2] != (fire_at, stage):
+                    continue  # replaced by a later reload
+                del self._current[event_id]
+                self._by_user.get(current[2].user_id, set()).discard(event_id)
+                due.append(current[2])
+
+            # drop replaced entries once they make up most of the heap
+            if len(self._heap) > 2 * len(self._current) + 1024:
+                self._heap = [(f, e, s) for e, (f, s, _) in self._current.items()]
+                heapq.heapify(self._heap)
+        return due
+
+    def tick(self):
+        """Deliver due reminders and record them, returns how many went out."""
+        db = web.get_db()
+        try:
+            self.poll_changes(db)
+            due = self.pop_due(self.clock())
+            if not due:
+                return 0
+
+            self.backend.send(due)
+
+            # recurring events go on to their next stage or instance, they
+            # have no reminder_sent of their own
+            with self._lock:
+                series = [self._series.pop(r.event_id) for r in due if r.event_id in self._series]
+                for row, replaced in series:
+                    self._schedule_series(row, replaced)
+            recurring = {row["id"] for row, _ in series}
+            once = [r for r in due if r.event_id not in recurring]
+
+            # only count a stage as sent if the event wasn't moved meanwhile,
+            # stages skipped before it count too
+            db.executemany(
+                '''UPDATE calendar_events SET reminder_sent = ?
+                   WHERE id = ? AND due_date = ? AND reminder_sent < ?''',
+                [(r.stage, r.event_id, r.due_date, r.stage) for r in once]
+            )
+            db.commit()
+
+            # queue the next stage of each event
+            ids = [r.event_id for r in once]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = db.execute(
+                    f'''SELECT {PENDING_COLUMNS}
+                        FROM calendar_events e
+                        LEFT JOIN user_settings s ON s.user_id = e.user_id
+                        WHERE e.id IN ({", ".join("?" * len(chunk))}) AND e.reminder_sent < {STAGES}''',
+                    chunk
+                ).fetchall()
+                with self._lock:
+                    for row in rows:
+                        self._schedule(row)
+            return len(due)
+        finally:
+            db.close()
+
+    def run_forever(self):
+        self.rebuild()
+        print(f"Reminder engine running, {len(self)} reminders pending")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Reminder engine error: {e}")
+            self._stop.wait(TICK)
+
+    def stop(self, *args):
+        self._stop.set()
+
+
+def main():
+    web.init_db()
+    engine = ReminderEngine()
+    signal.signal(signal.SIGINT, engine.stop)
+    signal.signal(signal.SIGTERM, engine.stop)
+    engine.run_forever()
+
+
+if __name__ == "__main__":
+    main()
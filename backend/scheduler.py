@@ -0,0 +1,274 @@
+"""Background sync worker for connected accounts.
+
+Keeps every account in `connected_accounts` fresh without a user having to
+run a link request. Run it next to the web server:
+
+    python scheduler.py
+
+Each (user, provider) pair has a row in `sync_jobs` holding its next run
+time, so a restarted worker picks up the existing schedule instead of
+syncing everyone at once. New accounts are spread over the first interval,
+and every run is rescheduled with random jitter so jobs stay spread out.
+
+- SYNC_INTERVAL_SECONDS  time between syncs of one account (default 900)
+- SYNC_JITTER_SECONDS    +/- random offset added to each run (default 60)
+- SYNC_MAX_CANVAS        max Canvas syncs in flight (default 4)
+- SYNC_MAX_GOOGLE        max Google syncs in flight (default 4)
+- SYNC_MAX_MICROSOFT     max Microsoft syncs in flight (default 4)
+- SYNC_TICK_SECONDS      how often due jobs are polled (default 5)
+
+A job is claimed by setting `locked_until` with an atomic UPDATE, so several
+workers can share one database and a crashed worker's jobs become claimable
+again once the lease runs out. A user never has two jobs in flight at once,
+and an account that was synced recently (e.g. by a link request) is
+rescheduled instead of synced again. Failing jobs back off exponentially.
+
+The worker only has the access token sent by the last link request, and no
+refresh token to renew it with. When a provider rejects it (HTTP 401), the
+stored token is cleared and the job dropped instead of retried, so the
+account reads as not linked until the user links it again, which schedules
+it anew.
+
+The worker also runs the reminder engine from `reminders.py`.
+"""
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import app as web
+import canvas_sync
+import google_sync
+import microsoft_sync
+import reminders
+
+INTERVAL = float(os.environ.get("SYNC_INTERVAL_SECONDS", 900))
+JITTER = float(os.environ.get("SYNC_JITTER_SECONDS", 60))
+TICK = float(os.environ.get("SYNC_TICK_SECONDS", 5))
+LEASE = float(os.environ.get("SYNC_LEASE_SECONDS", 600))
+MAX_BACKOFF = float(os.environ.get("SYNC_MAX_BACKOFF_SECONDS", 6 * 3600))
+
+# provider name in connected_accounts -> (sync function, max in flight)
+PROVIDERS = {
+    "Canvas": (canvas_sync.sync_canvas, int(os.environ.get("SYNC_MAX_CANVAS", 4))),
+    "Google": (google_sync.sync_google, int(os.environ.get("SYNC_MAX_GOOGLE", 4))),
+    "Microsoft": (microsoft_sync.sync_microsoft, int(os.environ.get("SYNC_MAX_MICROSOFT", 4))),
+}
+
+
+def unauthorized(error):
+    """Whether a sync failed because the provider rejected the stored token."""
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code == 401
+
+
+def synced_recently(last_synced_at, now):
+    """Whether an account was synced less than one interval ago."""
+    if not last_synced_at:
+        return False
+    try:
+        synced = datetime.fromisoformat(last_synced_at).timestamp()
+    except ValueError:
+        return False
+    return now - synced < INTERVAL
+
+
+class SyncScheduler:
+    """Polls `sync_jobs` and runs due syncs on per-provider thread pools."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = {provider: 0 for provider in PROVIDERS}
+        self._busy_users = set()
+        self._pools = {
+            provider: ThreadPoolExecutor(max_workers=cap, thread_name_prefix=f"sync-{provider}")
+            for provider, (_, cap) in PROVIDERS.items()
+        }
+
+    def next_run(self, failures=0):
+        """Next run time, backing off exponentially after failures."""
+        delay = INTERVAL * (2 ** failures) if failures else INTERVAL
+        return time.time() + min(delay, MAX_BACKOFF) + random.uniform(-JITTER, JITTER)
+
+    def ensure_jobs(self, db):
+        """Create jobs for newly connected accounts, spread over one interval."""
+        cursor = db.cursor()
+        cursor.execute(
+            '''SELECT a.user_id, a.account_type FROM connected_accounts a
+               LEFT JOIN sync_jobs j ON j.user_id = a.user_id AND j.provider = a.account_type
+               WHERE j.user_id IS NULL AND a.access_token IS NOT NULL'''
+        )
+        now = time.time()
+        new_jobs = [
+            (row["user_id"], row["account_type"], now + random.uniform(0, INTERVAL))
+            for row in cursor.fetchall() if row["account_type"] in PROVIDERS
+        ]
+        if new_jobs:
+            cursor.executemany(
+                'INSERT OR IGNORE INTO sync_jobs (user_id, provider, next_run_at) VALUES (?, ?, ?)',
+                new_jobs
+            )
+            db.commit()
+
+    def claim_due(self, db):
+        """Claim as many due jobs as the provider caps allow."""
+        now = time.time()
+        cursor = db.cursor()
+        claimed = []
+        for provider, (_, cap) in PROVIDERS.items():
+            with self._lock:
+                free = cap - self._in_flight[provider]
+            if free <= 0:
+                continue
+            cursor.execute(
+                '''SELECT user_id FROM sync_jobs
+                   WHERE provider = ? AND next_run_at <= ?
+                     AND (locked_until IS NULL OR locked_until < ?)
+                   ORDER BY next_run_at LIMIT ?''',
+                (provider, now, now, free * 2)
+            )
+            for row in cursor.fetchall():
+                user_id = row["user_id"]
+                with self._lock:
+                    if free <= 0 or user_id in self._busy_users:
+                        continue
+                cursor.execute(
+                    '''UPDATE sync_jobs SET locked_until = ?
+                       WHERE user_id = ? AND provider = ?
+                         AND (locked_until IS NULL OR locked_until < ?)''',
+                    (now + LEASE, user_id, provider, now)
+                )
+                db.commit()
+                if cursor.rowcount != 1:
+                    continue  # another worker got it first
+                with self._lock:
+                    self._busy_users.add(user_id)
+                    self._in_flight[provider] += 1
+                free -= 1
+                claimed.append((user_id, provider))
+        return claimed
+
+    def run_job(self, user_id, provider):
+        """Sync one account and reschedule its job."""
+        sync, _ = PROVIDERS[provider]
+        db = web.get_db()
+        error = None
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                '''SELECT access_token, last_synced_at FROM connected_accounts
+                   WHERE user_id = ? AND account_type = ?''',
+                (user_id, provider)
+            )
+            account = cursor.fetchone()
+            if account is None or not account["access_token"]:
+                cursor.execute('DELETE FROM sync_jobs WHERE user_id = ? AND provider = ?',
+                               (user_id, provider))
+                db.commit()
+                return
+            if not synced_recently(account["last_synced_at"], time.time()):
+                stats = sync(db, user_id, account["access_token"])
+                cursor.execute(
+                    'UPDATE connected_accounts SET last_synced_at = ? WHERE user_id = ? AND account_type = ?',
+                    (stats["syncedAt"], user_id, provider)
+                )
+                # the sync's writer bumped the data version for what it wrote
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            print(f"{provider} sync failed for user {user_id}: {error}")
+            if unauthorized(e):
+                self.unlink(db, user_id, provider)
+        finally:
+            self.finish(db, user_id, provider, error)
+            db.close()
+
+    def unlink(self, db, user_id, provider):
+        """Clear a rejected token and drop its job, until the account is linked again."""
+        cursor = db.cursor()
+        cursor.execute(
+            '''UPDATE connected_accounts SET access_token = NULL
+               WHERE user_id = ? AND account_type = ?''',
+            (user_id, provider)
+        )
+        cursor.execute('DELETE FROM sync_jobs WHERE user_id = ? AND provider = ?',
+                       (user_id, provider))
+        db.commit()
+        print(f"{provider} account of user {user_id} needs to be linked again")
+
+    def finish(self, db, user_id, provider, error):
+        """Release a job's lease and set its next run."""
+        try:
+            cursor = db.cursor()
+            if error:
+                cursor.execute(
+                    'SELECT failures FROM sync_jobs WHERE user_id = ? AND provider = ?',
+                    (user_id, provider)
+                )
+                row = cursor.fetchone()
+                failures = (row["failures"] if row else 0) + 1
+            else:
+                failures = 0
+            cursor.execute(
+                '''UPDATE sync_jobs SET next_run_at = ?, locked_until = NULL, last_run_at = ?,
+                       last_error = ?, failures = ?
+                   WHERE user_id = ? AND provider = ?''',
+                (self.next_run(failures), time.time(), error, failures, user_id, provider)
+            )
+            db.commit()
+        finally:
+            with self._lock:
+                self._busy_users.discard(user_id)
+                self._in_flight[provider] -= 1
+
+    def tick(self):
+        """Create new jobs and start every due job that fits under the caps."""
+        db = web.get_db()
+        try:
+            self.ensure_jobs(db)
+            claimed = self.claim_due(db)
+        finally:
+            db.close()
+        for user_id, provider in claimed:
+            self._pools[provider].submit(self.run_job, user_id, provider)
+        return claimed
+
+    def run_forever(self):
+        print(f"Sync worker running, interval {INTERVAL:.0f}s +/- {JITTER:.0f}s")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Sync scheduler error: {e}")
+            self._stop.wait(TICK)
+        for pool in self._pools.values():
+            pool.shutdown(wait=True)
+
+    def stop(self, *args):
+        self._stop.set()
+
+
+def main():
+    web.init_db()
+    scheduler = SyncScheduler()
+
+    # reminders are sent from the same worker process
+    engine = reminders.ReminderEngine()
+    threading.Thread(target=engine.run_forever, daemon=True).start()
+
+    def stop(*args):
+        engine.stop()
+        scheduler.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Full-text search over a user's events with SQLite FTS5.
+
+`calendar_events_fts` (migration 13) indexes the title, the description as
+plain text (Canvas sends HTML, see `ics.strip_html`) and the course or
+calendar name of every row in `calendar_events`. Triggers on
+`calendar_events` keep it current, so every write path, syncs included,
+updates the index in the same transaction. Upserts that don't change a
+row's content don't fire them.
+
+Each row also indexes its owner as a token in the `owner` column, e.g.
+"u42". A search matches that token as well as the user's terms, so FTS5
+narrows the matches to one user while it reads the index instead of
+filtering every user's matches afterwards. Ranking is bm25 with titles
+weighted above course names and course names above descriptions.
+
+User input is never passed to MATCH as is: `match_expression` turns it
+into quoted terms, so FTS5 operators and column filters typed in the
+search box are searched for like any other word.
+"""
+import os
+import re
+
+# most results one search returns
+MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", 100))
+
+# bm25 weights of the indexed columns: owner, title, description, course_name
+WEIGHTS = (0.0, 10.0, 1.0, 4.0)
+
+_TERMS = re.compile(r"\w+", re.UNICODE)
+
+
+def owner_token(user_id):
+    """Token the FTS `owner` column holds for a user's rows."""
+    return f"u{int(user_id)}"
+
+
+def match_expression(text, prefix=True):
+    """FTS5 MATCH expression finding events that contain every term of `text`.
+
+    With `prefix`, each term also matches words it starts, so "proj 3"
+    finds "Project 3". Returns None when `text` has no searchable terms.
+    """
+    terms = _TERMS.findall(text or "")
+    if not terms:
+        return None
+    star = "*" if prefix else ""
+    return " ".join(f'"{term}"{star}' for term in terms)
+
+
+def search_events(cursor, user_id, text, columns, sources=None, start=None, end=None,
+                  limit=MAX_LIMIT, prefix=True):
+    """A user's events matching `text`, best match first.
+
+    `sources` limits the results to those sources. `start` and `end`
+    keep events with start <= due_date < end, and recurring series that
+    begin before `end`.
+    """
+    expression = match_expression(text, prefix)
+    if expression is None:
+        return []
+    query = f'''
+        SELECT {", ".join(f"e.{c}" for c in columns)}
+        FROM calendar_events_fts f JOIN calendar_events e ON e.id = f.rowid
+        WHERE calendar_events_fts MATCH ? AND e.user_id = ?
+    '''
+    params = [f'owner:"{owner_token(user_id)}" AND {{title description course_name}}: ({expression})',
+              user_id]
+    if sources:
+        query += f' AND e.source IN ({", ".join("?" * len(sources))})'
+        params.extend(sources)
+    if start:
+        query += ' AND (e.due_date >= ? OR e.rrule IS NOT NULL)'
+        params.append(start)
+    if end:
+        query += ' AND e.due_date < ?'
+        params.append(end)
+    query += f' ORDER BY bm25(calendar_events_fts, {", ".join(map(str, WEIGHTS))}), e.due_date LIMIT ?'
+    params.append(max(1, min(limit, MAX_LIMIT)))
+    cursor.execute(query, params)
+    return cursor.fetchall()
@@ -0,0 +1,129 @@
+"""Production server for the VT Calendar backend.
+
+Running `app.py` directly starts Flask's development server: one process,
+debug mode and the reloader. This module serves the same app for real use:
+
+- `init_db()` and the migrations run once, in the launching process,
+  before any worker starts
+- on POSIX systems the app runs under gunicorn with WEB_WORKERS processes
+  of WEB_THREADS threads each. The app is loaded before forking, so every
+  worker starts in milliseconds
+- without gunicorn (e.g. on Windows) it falls back to Werkzeug's threaded
+  WSGI server in one process, still without debug mode or the reloader
+
+Every open change stream (`/api/changes/stream`, see `changes.py`) holds a
+worker thread while it waits. Each worker therefore accepts streams on at
+most three quarters of its threads, keeping the rest for requests. Clients
+over that limit get 503 and retry later.
+
+The workers are threads rather than gevent greenlets on purpose: sqlite3
+calls (busy timeout waits, chunked sync writes, search index triggers)
+block in C, where gevent can't switch, and one of them would stall every
+stream of the worker. A thread blocked in SQLite releases the GIL instead.
+
+Usage:
+    python serve.py [--host 127.0.0.1] [--port 3001] [--workers 4] [--threads 8]
+
+Defaults come from HOST, PORT, WEB_WORKERS, WEB_THREADS and WEB_TIMEOUT.
+
+Each worker has its own connection pool, caches and metrics, so
+`/api/metrics` reports the worker that answered the scrape.
+"""
+import argparse
+import os
+
+import app as web
+import changes
+import db as dbpool
+import sessions
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # not installed, or Windows, where gunicorn can't run
+    BaseApplication = None
+
+WORKERS = int(os.environ.get("WEB_WORKERS", min(4, os.cpu_count() or 1)))
+THREADS = int(os.environ.get("WEB_THREADS", 8))
+
+# seconds a request may run before its worker is restarted, long enough for a full sync
+TIMEOUT = int(os.environ.get("WEB_TIMEOUT", 120))
+
+
+def prepare():
+    """Create and migrate the database once, before any worker starts.
+
+    The connections `init_db` used are closed afterwards, so no SQLite
+    handle is inherited by forked workers.
+    """
+    web.init_db()
+    dbpool.get_pool(web.DATABASE).close_all()
+
+
+def post_fork(server, worker):
+    """Start the per-process background threads in a new worker."""
+    sessions.start_sweeper(web.get_db)
+
+
+if BaseApplication is not None:
+    class GunicornServer(BaseApplication):
+        """gunicorn application serving the already imported Flask app."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return web.app
+
+
+def stream_limit(threads):
+    """Most change streams one worker may hold open, a quarter of its threads stay free."""
+    return max(1, min(changes.MAX_STREAMS, threads - max(1, threads // 4)))
+
+
+def serve_gunicorn(host, port, workers, threads):
+    changes.hub.max_streams = stream_limit(threads)
+    GunicornServer({
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": TIMEOUT,
+        "post_fork": post_fork,
+    }).run()
+
+
+def serve_threaded(host, port):
+    from werkzeug.serving import make_server
+
+    sessions.start_sweeper(web.get_db)
+    make_server(host, port, web.app, threaded=True).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 3001)))
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    args = parser.parse_args()
+
+    prepare()
+
+    print(f"VT Calendar server running on http://{args.host}:{args.port}")
+    if BaseApplication is not None:
+        print(f"gunicorn: {args.workers} workers x {args.threads} threads, "
+              f"{stream_limit(args.threads)} change streams each")
+        serve_gunicorn(args.host, args.port, args.workers, args.threads)
+    else:
+        print("gunicorn not available, serving with Werkzeug's threaded server")
+        serve_threaded(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
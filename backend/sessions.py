@@ -0,0 +1,220 @@
+"""Login sessions backed by `login_sessions`, with an in-process cache.
+
+A login creates a row in `login_sessions` holding a random token and its
+expiry (SESSION_TTL_SECONDS after login). Requests authenticate by sending
+the token back, in the Flask session cookie or an `X-Session-Token` header.
+
+Looking a token up in SQLite on every request is wasted work for a hot
+client, so resolved tokens are kept in a bounded LRU cache
+(SESSION_CACHE_SIZE entries). An entry lives until the session expires or
+for SESSION_CACHE_TTL_SECONDS, whichever comes first.
+
+A logout deletes the row and appends the token to `session_revocations` in
+the same transaction. Every lookup first reads the log past the last id this
+process has seen, which is an empty primary key range on almost every
+request, and drops those tokens from the cache. A logout in one worker
+process is so honoured by all of them from their next request on. Tokens are
+cached on their first lookup, never on login, so a session whose transaction
+rolled back is never served from the cache.
+
+Expired rows are deleted in the background by `start_sweeper`, in batches of
+SESSION_SWEEP_BATCH so the sweep never holds the write lock for long. Log
+entries go once they're older than the cache TTL, no cache can hold their
+token by then.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+SESSION_TTL = int(os.environ.get("SESSION_TTL_SECONDS", 14 * 24 * 3600))
+CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 10000))
+CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", 60))
+SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_SECONDS", 600))
+SWEEP_BATCH = int(os.environ.get("SESSION_SWEEP_BATCH", 500))
+
+
+def format_time(epoch):
+    """UTC time in SQLite's CURRENT_TIMESTAMP format."""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_time(value):
+    """Epoch seconds of a stored UTC timestamp, 0 if it can't be parsed."""
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+
+class SessionCache:
+    """Thread-safe LRU of token -> (user_id, valid_until).
+
+    `revision` is the last `session_revocations` id applied to the entries.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.revision = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        """Cached user id of a token, None on a miss or once the entry expired."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[0]
+
+    def put(self, token, user_id, expires_at, revision=None):
+        """Cache a token looked up at `revision`.
+
+        Skipped if revocations were applied since, the token may be one of
+        them and the lookup raced with its logout.
+        """
+        with self._lock:
+            if revision is not None and revision != self.revision:
+                return
+            self._entries[token] = (user_id, min(expires_at, self.clock() + self.ttl))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def catch_up(self, db):
+        """Drop tokens revoked by any process since the last call, returns the revision."""
+        revoked = db.execute(
+            'SELECT id, session_token FROM session_revocations WHERE id > ? ORDER BY id',
+            (self.revision,)
+        ).fetchall()
+        with self._lock:
+            for row in revoked:
+                self._entries.pop(row[1], None)
+            if revoked:
+                self.revision = max(self.revision, revoked[-1][0])
+            return self.revision
+
+
+cache = SessionCache()
+
+
+def create(cursor, user_id, ip_address=None):
+    """Start a session for a user, as part of the caller's transaction.
+
+    The token isn't cached here, its first lookup finds it once committed.
+    """
+    token = secrets.token_urlsafe(32)
+    expires_at = time.time() + SESSION_TTL
+    cursor.execute(
+        '''INSERT INTO login_sessions (user_id, session_token, ip_address, expires_at)
+           VALUES (?, ?, ?, ?)''',
+        (user_id, token, ip_address, format_time(expires_at))
+    )
+    return token
+
+
+def resolve(connect, token):
+    """User id of a live session token, None if it's unknown or expired.
+
+    `connect` gives a connection that is closed afterwards. It reads the
+    revocation log, and the session row when the token isn't cached.
+    """
+    if not token:
+        return None
+    db = connect()
+    try:
+        revision = cache.catch_up(db)
+        user_id = cache.get(token)
+        if user_id is not None:
+            return user_id
+        row = db.execute(
+            'SELECT user_id, expires_at FROM login_sessions WHERE session_token = ?',
+            (token,)
+        ).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    expires_at = parse_time(row["expires_at"])
+    if expires_at <= time.time():
+        return None
+    cache.put(token, row["user_id"], expires_at, revision)
+    return row["user_id"]
+
+
+def revoke(cursor, token):
+    """End a session in every process, as part of the caller's transaction."""
+    cache.invalidate(token)
+    cursor.execute('DELETE FROM login_sessions WHERE session_token = ?', (token,))
+    if cursor.rowcount == 0:
+        return False
+    cursor.execute(
+        'INSERT INTO session_revocations (session_token, revoked_at) VALUES (?, ?)',
+        (token, time.time())
+    )
+    return True
+
+
+def sweep(db, batch=SWEEP_BATCH):
+    """Delete expired sessions a batch at a time, returns how many went.
+
+    Revocations older than the cache TTL go too.
+    """
+    db.execute('DELETE FROM session_revocations WHERE revoked_at < ?', (time.time() - CACHE_TTL,))
+    db.commit()
+    now = format_time(time.time())
+    deleted = 0
+    while True:
+        cursor = db.execute(
+            '''DELETE FROM login_sessions WHERE id IN (
+                   SELECT id FROM login_sessions WHERE expires_at <= ? LIMIT ?)''',
+            (now, batch)
+        )
+        db.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch:
+            return deleted
+
+
+_sweeper = None
+
+
+def start_sweeper(get_db, interval=SWEEP_INTERVAL):
+    """Sweep expired sessions on a daemon thread, once per process."""
+    global _sweeper
+    if _sweeper is not None:
+        return _sweeper
+
+    def run():
+        while True:
+            db = get_db()
+            try:
+                sweep(db)
+            except Exception as e:
+                print(f"Session sweep error: {e}")
+            finally:
+                db.close()
+            time.sleep(interval)
+
+    _sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+    _sweeper.start()
+    return _sweeper
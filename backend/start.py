@@ -1,11 +1,32 @@
 """
 VT Calendar Startup Script
+
+    python start.py               development server (app.py, debug mode)
+    python start.py --production  multi-worker server (serve.py)
+
+Dependencies are only installed when requirements.txt changed since the
+last successful install, which is tracked by its hash inside the venv.
 """
+import hashlib
 import subprocess
 import sys
 import os
 
+def requirements_hash(requirements_path):
+    """SHA-256 of requirements.txt"""
+    with open(requirements_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def installed_hash(stamp_path):
+    """Hash of the requirements last installed into the venv, None if unknown"""
+    try:
+        with open(stamp_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
 def main():
+    production = '--production' in sys.argv[1:]
     print("🚀 Starting VT Calendar Application...")
     print()
     
@@ -14,6 +35,8 @@ def main():
     venv_path = os.path.join(script_dir, 'venv')
     requirements_path = os.path.join(script_dir, 'requirements.txt')
     app_path = os.path.join(script_dir, 'app.py')
+    serve_path = os.path.join(script_dir, 'serve.py')
+    stamp_path = os.path.join(venv_path, '.requirements.sha256')
 
     # Check if virtual environment exists
     if not os.path.exists(venv_path):
@@ -28,8 +51,16 @@ def main():
         pip = os.path.join(venv_path, 'bin', 'pip')
         python = os.path.join(venv_path, 'bin', 'python')
     
-    print("📦 Installing dependencies...")
-    subprocess.run([pip, 'install', '-r', requirements_path])
+    # Skip pip entirely when nothing changed since the last install
+    digest = requirements_hash(requirements_path)
+    if installed_hash(stamp_path) == digest:
+        print("📦 Dependencies up to date")
+    else:
+        print("📦 Installing dependencies...")
+        result = subprocess.run([pip, 'install', '-r', requirements_path])
+        if result.returncode == 0:
+            with open(stamp_path, 'w') as f:
+                f.write(digest)
     
     print()
     print("🌐 Starting server on http://127.0.0.1:3001")
@@ -40,7 +71,7 @@ def main():
     # Strat
     os.environ['HOST'] = '127.0.0.1'
     os.environ['PORT'] = '3001'
-    subprocess.run([python, app_path])
+    subprocess.run([python, serve_path if production else app_path])
 
 if __name__ == '__main__':
     main()
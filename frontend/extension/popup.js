@@ -1,4 +1,6 @@
 // Chrome Extension Popup Script
+const API_URL = 'http://127.0.0.1:3001/api';
+
 document.addEventListener('DOMContentLoaded', async () => {
     const eventsContainer = document.getElementById('eventsContainer');
     const openFullBtn = document.getElementById('openFullCalendarBtn');
@@ -15,25 +17,58 @@ document.addEventListener('DOMContentLoaded', async () => {
             return;
         }
         
-        const response = await fetch('http://127.0.0.1:3001/api/calendar/events?userId=' + userId);
-        const data = await response.json();
-        
-        if (data.events && data.events.length > 0) {
-            eventsContainer.innerHTML = data.events.slice(0, 5).map(event => `
-                <div class="event-item">
-                    <div class="event-title">${escapeHtml(event.title)}</div>
-                    <div class="event-date">${formatDate(event.due_date)}</div>
-                    <div class="event-source ${event.source.toLowerCase()}">${event.source}</div>
-                </div>
-            `).join('');
-        } else {
-            eventsContainer.innerHTML = '<div class="empty">No upcoming events</div>';
+        // Show the events from the last time the popup was open right away
+        const cached = await getFromStorage('popupEvents');
+        if (cached) {
+            renderEvents(eventsContainer, cached);
         }
+        await loadEvents(eventsContainer, userId);
+        
+        // While the popup stays open, refresh only when the server reports a change
+        const stream = new EventSource(`${API_URL}/changes/stream?` + new URLSearchParams({ userId }));
+        const refresh = () => loadEvents(eventsContainer, userId).catch(() => {});
+        ['event.added', 'event.updated', 'event.deleted', 'changed', 'reset'].forEach(type => {
+            stream.addEventListener(type, refresh);
+        });
+        stream.addEventListener('sync.finished', (e) => {
+            if (JSON.parse(e.data).changed) refresh();
+        });
     } catch (error) {
-        eventsContainer.innerHTML = '<div class="empty">Unable to load events</div>';
+        // Keep showing the cached events if there are any
+        if (!eventsContainer.querySelector('.event-item')) {
+            eventsContainer.innerHTML = '<div class="empty">Unable to load events</div>';
+        }
     }
 });
 
+// Fetch the next few events, only the fields the popup shows
+async function loadEvents(eventsContainer, userId) {
+    const params = new URLSearchParams({
+        userId,
+        start: new Date().toISOString(),
+        limit: 5,
+        fields: 'id,title,due_date,source'
+    });
+    const response = await fetch(`${API_URL}/calendar/events?` + params);
+    const data = await response.json();
+    renderEvents(eventsContainer, data.events || []);
+    await setInStorage('popupEvents', data.events || []);
+}
+
+function renderEvents(eventsContainer, events) {
+    if (events.length > 0) {
+        eventsContainer.innerHTML = events.map(event => `
+            <div class="event-item">
+                <div class="event-title">${escapeHtml(event.title)}</div>
+                <div class="event-date">${formatDate(event.due_date)}</div>
+                <div class="event-source ${event.source.toLowerCase()}">${event.source}</div>
+            </div>
+        `).join('');
+    } else {
+        eventsContainer.innerHTML = '<div class="empty">No upcoming events</div>';
+    }
+}
+
 function formatDate(dateString) {
     const date = new Date(dateString);
     return date.toLocaleDateString('en-US', {
@@ -56,4 +91,10 @@ function getFromStorage(key) {
     });
 }
 
+function setInStorage(key, value) {
+    return new Promise(resolve => {
+        chrome.storage.local.set({ [key]: value }, resolve);
+    });
+}
+
 
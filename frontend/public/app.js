@@ -1,7 +1,15 @@
 // VT Calendar Application JavaScript
 const API_URL = 'http://127.0.0.1:3001/api';
 
+// Days of upcoming events the list shows
+const LIST_DAYS = 30;
+
+// Columns the list shows
+const EVENT_FIELDS = 'id,title,description,due_date,source';
+
 let currentUserId = null;
+let changeStream = null;
+let refreshTimer = null;
 let authTokens = {
     canvas: null,
     google: null,
@@ -21,6 +29,7 @@ function checkAuthState() {
         currentUserId = storedUserId;
         showDashboard();
         loadCalendarEvents();
+        subscribeToChanges();
     }
 }
 
@@ -71,6 +80,7 @@ async function handleLogin(e) {
             showNotification('Successfully logged in!', 'success');
             showDashboard();
             loadCalendarEvents();
+            subscribeToChanges();
             
             // Enable additional account buttons
             document.getElementById('connectGoogleBtn').disabled = false;
@@ -107,20 +117,71 @@ function updateAccountStatus() {
     }
 }
 
-// Load calendar events
+// Load the events of the next LIST_DAYS days
 async function loadCalendarEvents() {
     if (!currentUserId) return;
 
+    const start = new Date();
+    start.setHours(0, 0, 0, 0);
+    const end = new Date(start);
+    end.setDate(end.getDate() + LIST_DAYS);
+
     try {
-        const response = await fetch(`${API_URL}/calendar/events?userId=${currentUserId}`);
+        const response = await fetch(`${API_URL}/calendar/events?${eventsQuery(start, end)}`);
         const data = await response.json();
         
-        displayEvents(data.events);
+        displayEvents(data.events.filter(event => {
+            const eventDate = new Date(event.due_date);
+            return eventDate >= start && eventDate < end;
+        }));
     } catch (error) {
         console.error('Error loading events:', error);
     }
 }
 
+// Query for the events between two local times. The server compares UTC
+// dates, so the window is a day wider on each side and filtered afterwards
+function eventsQuery(start, end) {
+    const from = new Date(start);
+    from.setDate(from.getDate() - 1);
+    const to = new Date(end);
+    to.setDate(to.getDate() + 1);
+    return new URLSearchParams({
+        userId: currentUserId,
+        start: from.toISOString().slice(0, 10),
+        end: to.toISOString().slice(0, 10),
+        fields: EVENT_FIELDS
+    });
+}
+
+// Listen for changes pushed by the server, so events are only refetched
+// when something changed (including syncs that ran in the background)
+function subscribeToChanges() {
+    if (!currentUserId || changeStream || !window.EventSource) return;
+
+    changeStream = new EventSource(`${API_URL}/changes/stream?userId=${currentUserId}`);
+    ['event.added', 'event.updated', 'event.deleted', 'changed', 'reset'].forEach(type => {
+        changeStream.addEventListener(type, scheduleRefresh);
+    });
+    changeStream.addEventListener('sync.finished', (e) => {
+        if (JSON.parse(e.data).changed) scheduleRefresh();
+    });
+    changeStream.onerror = () => {
+        // EventSource reconnects by itself, unless the server turned it away
+        if (changeStream.readyState === EventSource.CLOSED) {
+            changeStream = null;
+            scheduleRefresh();
+            setTimeout(subscribeToChanges, 30000);
+        }
+    };
+}
+
+// Refetch once for a burst of notifications
+function scheduleRefresh() {
+    clearTimeout(refreshTimer);
+    refreshTimer = setTimeout(loadCalendarEvents, 250);
+}
+
 // Display events
 function displayEvents(events) {
     const eventsList = document.getElementById('eventsList');
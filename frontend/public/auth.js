@@ -1,6 +1,12 @@
 // VT Calendar Authentication JavaScript
 const API_URL = 'http://127.0.0.1:3001/api';
 
+// Columns the week and month grids show
+const EVENT_FIELDS = 'id,title,due_date,source';
+
+// Columns the list and day views show, with each event's details
+const EVENT_DETAIL_FIELDS = `${EVENT_FIELDS},description,course_name`;
+
 let currentUserId = null;
 let requires2FA = false;
 let authTokens = {
@@ -232,6 +238,7 @@ async function handleLogin(e) {
                 // Direct login
                 currentUserId = data.userId;
                 localStorage.setItem('userId', currentUserId);
+                localStorage.setItem('sessionToken', data.sessionToken);
                 showNotification('Successfully logged in!', 'success');
                 showDashboard();
             }
@@ -266,6 +273,7 @@ async function handle2FAVerify(e) {
         
         if (data.success) {
             localStorage.setItem('userId', currentUserId);
+            localStorage.setItem('sessionToken', data.sessionToken);
             showNotification('2FA verified successfully!', 'success');
             showDashboard();
         } else {
@@ -433,28 +441,41 @@ function connectMicrosoftAccount() {
     }, 2000);
 }
 
-// Load calendar events
+// Load the events of the range the active view shows (see visibleRange)
 async function loadCalendarEvents() {
     if (!currentUserId) return;
 
+    const range = visibleRange();
     try {
-        const response = await fetch(`${API_URL}/calendar/events?userId=${currentUserId}`);
+        const response = await fetch(`${API_URL}/calendar/events?${eventsQuery(range)}`);
         const data = await response.json();
         
-        displayEvents(data.events);
+        displayEvents(data.events.filter(event => {
+            const eventDate = new Date(event.due_date);
+            return eventDate >= range.start && eventDate < range.end;
+        }));
     } catch (error) {
         console.error('Error loading events:', error);
     }
 }
 
+// Query for the events of a range of local times. The server compares UTC
+// dates, so the range is a day wider on each side and filtered afterwards
+function eventsQuery(range) {
+    const from = new Date(range.start);
+    from.setDate(from.getDate() - 1);
+    const to = new Date(range.end);
+    to.setDate(to.getDate() + 1);
+    return new URLSearchParams({
+        userId: currentUserId,
+        start: from.toISOString().slice(0, 10),
+        end: to.toISOString().slice(0, 10),
+        fields: range.details ? EVENT_DETAIL_FIELDS : EVENT_FIELDS
+    });
+}
+
 // Display events
 function displayEvents(events) {
-    if (!events || events.length === 0) {
-        document.getElementById('eventsList').innerHTML = '<div class="event-item empty">No events found. Link your Canvas account to get started!</div>';
-        document.getElementById('dayEvents').innerHTML = '<div class="event-item empty">No events today</div>';
-        return;
-    }
-
     // Store events globally for calendar views
     if (typeof setAllEvents === 'function') {
         setAllEvents(events);
@@ -462,17 +483,21 @@ function displayEvents(events) {
 
     // List view
     const eventsList = document.getElementById('eventsList');
-    eventsList.innerHTML = events.map(event => `
-        <div class="event-item">
-            <div class="event-header">
-                <div class="event-title">${escapeHtml(event.title)}</div>
-                <div class="event-date">${formatDate(event.due_date)}</div>
+    if (events.length === 0) {
+        eventsList.innerHTML = '<div class="event-item empty">No upcoming events. Link your Canvas account to get started!</div>';
+    } else {
+        eventsList.innerHTML = events.map(event => `
+            <div class="event-item">
+                <div class="event-header">
+                    <div class="event-title">${escapeHtml(event.title)}</div>
+                    <div class="event-date">${formatDate(event.due_date)}</div>
+                </div>
+                <div class="event-description">${escapeHtml(event.description || 'No description')}</div>
+                ${event.course_name ? `<div class="event-course">${escapeHtml(event.course_name)}</div>` : ''}
+                <div class="event-source ${event.source.toLowerCase()}">${event.source}</div>
             </div>
-            <div class="event-description">${escapeHtml(event.description || 'No description')}</div>
-            ${event.course_name ? `<div class="event-course">${escapeHtml(event.course_name)}</div>` : ''}
-            <div class="event-source ${event.source.toLowerCase()}">${event.source}</div>
-        </div>
-    `).join('');
+        `).join('');
+    }
     
     // Update calendar views if they exist
     if (document.getElementById('dayView').classList.contains('active')) {
@@ -546,7 +571,16 @@ async function handleSync() {
 
 // Handle logout
 function handleLogout() {
+    // End the session on the server too, don't wait for the answer
+    const sessionToken = localStorage.getItem('sessionToken');
+    fetch(`${API_URL}/auth/logout`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: sessionToken ? { 'X-Session-Token': sessionToken } : {}
+    }).catch(() => {});
+    
     localStorage.removeItem('userId');
+    localStorage.removeItem('sessionToken');
     localStorage.removeItem('canvasToken');
     currentUserId = null;
     authTokens = { canvas: null, google: null, microsoft: null };
@@ -1,4 +1,8 @@
 // Calendar Views JavaScript
+
+// Days of upcoming events the list view shows
+const LIST_DAYS = 30;
+
 function setupCalendarView() {
     const viewBtns = document.querySelectorAll('.view-btn');
     const prevWeek = document.getElementById('prevWeek');
@@ -20,36 +24,61 @@ function setupCalendarView() {
             views.forEach(v => v.classList.remove('active'));
             document.getElementById(view + 'View').classList.add('active');
             
-            // Load view data
-            if (view === 'day') renderDayView();
-            else if (view === 'week') renderWeekView();
-            else if (view === 'month') renderMonthView();
+            // Load the events of the range the view shows, it renders once they arrive
+            loadCalendarEvents();
         });
     });
 
     // Week navigation
     prevWeek?.addEventListener('click', () => {
         currentDate.setDate(currentDate.getDate() - 7);
-        renderWeekView();
+        loadCalendarEvents();
     });
 
     nextWeek?.addEventListener('click', () => {
         currentDate.setDate(currentDate.getDate() + 7);
-        renderWeekView();
+        loadCalendarEvents();
     });
 
     // Month navigation
     prevMonth?.addEventListener('click', () => {
         currentDate.setMonth(currentDate.getMonth() - 1);
-        renderMonthView();
+        loadCalendarEvents();
     });
 
     nextMonth?.addEventListener('click', () => {
         currentDate.setMonth(currentDate.getMonth() + 1);
-        renderMonthView();
+        loadCalendarEvents();
     });
 }
 
+// Range of local times the active view shows, as { start, end, details }.
+// details is set for the views that show descriptions and course names
+function visibleRange() {
+    const active = document.querySelector('.events-view.active');
+    let start;
+    let days;
+    if (active?.id === 'dayView') {
+        start = new Date(currentDate);
+        days = 1;
+    } else if (active?.id === 'weekView') {
+        start = getStartOfWeek(currentDate);
+        days = 7;
+    } else if (active?.id === 'monthView') {
+        // the grid starts on the week of the 1st and has 42 days
+        start = getStartOfWeek(new Date(currentDate.getFullYear(), currentDate.getMonth(), 1));
+        days = 42;
+    } else {
+        start = new Date();
+        days = LIST_DAYS;
+    }
+    start.setHours(0, 0, 0, 0);
+    const end = new Date(start);
+    end.setDate(end.getDate() + days);
+    const details = active?.id !== 'weekView' && active?.id !== 'monthView';
+    return { start, end, details };
+}
+
 // Render day view
 function renderDayView() {
     const dayDate = document.getElementById('dayDate');
@@ -76,6 +105,11 @@ function renderDayView() {
         return eventDate >= dayStart && eventDate <= dayEnd;
     });
     
+    if (dayEventsList.length === 0) {
+        dayEvents.innerHTML = '<div class="event-item empty">No events today</div>';
+        return;
+    }
+    
     dayEvents.innerHTML = dayEventsList.map(event => `
         <div class="calendar-event">
             <div class="calendar-event-time">${formatTime(event.due_date)}</div>
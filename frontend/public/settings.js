@@ -225,15 +225,20 @@ async function clearAllData() {
     }
 
     try {
-        const response = await fetch(`${API_URL}/calendar/events?userId=${currentUserId}`);
-        const data = await response.json();
+        // One request and one transaction for every event
+        const response = await fetch(`${API_URL}/calendar/events/batch`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                userId: currentUserId,
+                deleteAll: true
+            })
+        });
         
-        if (data.events) {
-            for (const event of data.events) {
-                await fetch(`${API_URL}/calendar/events/${event.id}`, {
-                    method: 'DELETE'
-                });
-            }
+        if (!response.ok) {
+            throw new Error(`Batch delete failed with status ${response.status}`);
         }
         
         showNotification('All calendar data cleared.', 'info');
@@ -0,0 +1,117 @@
+"""iCalendar subscription feed (GET /api/calendar/<token>.ics)."""
+import io
+
+import pytest
+
+import ics
+
+USER_ID = 1
+
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+
+def feed_path(client, method="get"):
+    response = getattr(client, method)("/api/calendar/feed", query_string={"userId": USER_ID},
+                                       json={"userId": USER_ID} if method == "post" else None)
+    return response.get_json()["url"].split("localhost", 1)[1]
+
+
+def add_events(web, *events):
+    db = web.get_db()
+    try:
+        for columns in events:
+            columns = dict(user_id=USER_ID, **columns)
+            cursor = db.execute(
+                f'INSERT INTO calendar_events ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                tuple(columns.values())
+            )
+        web.bump_data_version(cursor, USER_ID)
+        db.commit()
+    finally:
+        db.close()
+
+
+def parse(body):
+    return [event for _, event in ics.iter_events(io.StringIO(body.decode("utf-8"), newline=""))]
+
+
+def test_feed_url_is_stable_until_rotated(client):
+    path = feed_path(client)
+    assert feed_path(client) == path
+    assert client.get(path).status_code == 200
+
+    rotated = feed_path(client, "post")
+
+    assert rotated != path
+    assert client.get(path).status_code == 404
+    assert client.get(rotated).status_code == 200
+
+
+def test_feed_escapes_and_folds_events(web, client):
+    description = "<p>Submit on Canvas; late work, <b>10%</b> off per day.</p>" + " More text." * 20
+    add_events(web, dict(title="Lab 3, part 1; draft", description=description,
+                         due_date="2030-03-01T04:59:00Z", source="Canvas", course_name="CS 3214"))
+
+    response = client.get(feed_path(client))
+
+    assert response.mimetype == "text/calendar"
+    body = response.get_data()
+    assert all(len(line) <= 75 for line in body.split(b"\r\n"))
+    [event] = parse(body)
+    assert ics.unescape(event["SUMMARY"][1]) == "Lab 3, part 1; draft"
+    assert ics.unescape(event["DESCRIPTION"][1]).startswith(
+        "Submit on Canvas; late work, 10% off per day. More text.")
+    assert event["DTSTART"] == ({}, "20300301T045900Z")
+    assert event["CATEGORIES"][1] == "Canvas,CS 3214"
+
+
+def test_feed_sends_masters_with_their_overrides(web, client):
+    add_events(
+        web,
+        dict(title="Standup", due_date="2030-01-07T15:00:00Z", source="Google",
+             external_id="standup", rrule="FREQ=WEEKLY;COUNT=10", tzid="America/New_York",
+             exdates="2030-01-21T15:00:00Z"),
+        dict(title="Standup (moved)", due_date="2030-01-15T15:00:00Z", source="Google",
+             external_id="standup_0114", master_id="standup", recurrence_id="2030-01-14T15:00:00Z"),
+        dict(source="Google", external_id="standup_0128", master_id="standup",
+             recurrence_id="2030-01-28T15:00:00Z"),
+    )
+
+    events = parse(client.get(feed_path(client)).get_data())
+
+    [master] = [e for e in events if "RRULE" in e]
+    [moved] = [e for e in events if "RECURRENCE-ID" in e and "STATUS" not in e]
+    [cancelled] = [e for e in events if "STATUS" in e]
+
+    assert master["DTSTART"] == ({"TZID": "America/New_York"}, "20300107T100000")
+    assert master["RRULE"][1] == "FREQ=WEEKLY;COUNT=10"
+    assert master["EXDATE"] == ({"TZID": "America/New_York"}, "20300121T100000")
+    assert moved["UID"] == master["UID"] == cancelled["UID"]
+    assert moved["RECURRENCE-ID"][1] == "20300114T150000Z"
+    assert cancelled["STATUS"][1] == "CANCELLED"
+
+
+def test_unchanged_feed_is_not_modified(web, client):
+    add_events(web, dict(title="Quiz", due_date="2030-01-07T15:00:00Z", source="Canvas"))
+    path = feed_path(client)
+    etag = client.get(path).headers["ETag"]
+
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    add_events(web, dict(title="Exam", due_date="2030-02-07T15:00:00Z", source="Canvas"))
+    response = client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert [e["SUMMARY"][1] for e in parse(response.get_data())] == ["Quiz", "Exam"]
+
+
+def test_feed_window(web, client):
+    add_events(web, *[dict(title=f"Week {n}", due_date=f"2030-01-{7 * n:02d}", source="Canvas")
+                      for n in range(1, 5)])
+
+    body = client.get(feed_path(client), query_string={"start": "2030-01-10", "end": "2030-01-25"}).get_data()
+
+    assert [e["SUMMARY"][1] for e in parse(body)] == ["Week 2", "Week 3"]
@@ -0,0 +1,182 @@
+""".ics parsing (backend/ics.py) and imports (backend/ics_import.py)."""
+import io
+
+import ics
+import ics_import
+
+USER_ID = 1
+
+CALENDAR = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+X-WR-CALNAME:CS 3214\r
+BEGIN:VTIMEZONE\r
+TZID:America/New_York\r
+END:VTIMEZONE\r
+BEGIN:VEVENT\r
+UID:lecture\r
+DTSTART;TZID=America/New_York:20261019T100000\r
+DTEND;TZID=America/New_York:20261019T111500\r
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261211T045959Z\r
+EXDATE;TZID=America/New_York:20261021T100000,20261026T100000\r
+SUMMARY:Lecture\\, Computer Systems\r
+DESCRIPTION:Room 160\\nBring a laptop and the lab handout for the week\\; it \r
+ is graded.\r
+BEGIN:VALARM\r
+ACTION:DISPLAY\r
+SUMMARY:Alarm summary\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:lecture\r
+RECURRENCE-ID;TZID=America/New_York:20261028T100000\r
+DTSTART;TZID=America/New_York:20261028T130000\r
+SUMMARY:Lecture (afternoon)\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:lecture\r
+RECURRENCE-ID;TZID=America/New_York:20261102T100000\r
+STATUS:CANCELLED\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:exam\r
+DTSTART;VALUE=DATE:20261210\r
+SUMMARY:Final exam\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:no-start\r
+SUMMARY:No date\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:No UID\r
+DTSTART:20261101T120000Z\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+def run_import(web, text, chunk_size=500):
+    db = web.get_db()
+    try:
+        return ics_import.import_ics(db, USER_ID, io.StringIO(text, newline=""),
+                                     chunk_size=chunk_size)
+    finally:
+        db.close()
+
+
+def events(query):
+    return {row["external_id"]: row for row in query(
+        "SELECT * FROM calendar_events WHERE user_id = ? AND source = 'Import'", USER_ID)}
+
+
+def test_unfolds_lines_and_parses_params():
+    lines = list(ics.iter_lines(io.StringIO(
+        'DESCRIPTION:one \r\n two\r\n\tthree\r\nATTENDEE;CN="Doe: Jane";ROLE=CHAIR:mailto:j@vt.edu\r\n',
+        newline="")))
+
+    assert lines[0] == "DESCRIPTION:one twothree"
+    assert ics.parse_line(lines[1]) == ("ATTENDEE", {"CN": "Doe: Jane", "ROLE": "CHAIR"},
+                                        "mailto:j@vt.edu")
+
+
+def test_iter_events_skips_nested_components():
+    calendar, event = next(ics.iter_events(io.StringIO(CALENDAR, newline="")))
+
+    assert calendar["X-WR-CALNAME"][1] == "CS 3214"
+    assert event["SUMMARY"][1] == "Lecture\\, Computer Systems"
+    assert ics.unescape(event["DESCRIPTION"][1]) == (
+        "Room 160\nBring a laptop and the lab handout for the week; it is graded.")
+    assert event["RECURRENCE"] == [
+        "RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261211T045959Z",
+        "EXDATE;TZID=America/New_York:20261021T100000,20261026T100000",
+    ]
+
+
+def test_parse_date_forms():
+    assert ics.parse_date({"VALUE": "DATE"}, "20261210") == "2026-12-10"
+    assert ics.parse_date({}, "20261101T120000Z") == "2026-11-01T12:00:00Z"
+    # daylight saving time, then standard time
+    assert ics.parse_date({"TZID": "America/New_York"}, "20261019T100000") == "2026-10-19T14:00:00Z"
+    assert ics.parse_date({"TZID": "America/New_York"}, "20261102T100000") == "2026-11-02T15:00:00Z"
+    # floating, and an unknown zone is treated as floating
+    assert ics.parse_date({}, "20261019T100000") == "2026-10-19T10:00:00"
+    assert ics.parse_date({"TZID": "Nowhere/Else"}, "20261019T100000") == "2026-10-19T10:00:00"
+    assert ics.parse_date({}, "tomorrow") is None
+
+
+def test_fold_round_trips():
+    line = "DESCRIPTION:" + "é" * 100
+    folded = ics.fold(line)
+
+    assert all(len(part.encode("utf-8")) <= 75 for part in folded.split("\r\n"))
+    assert list(ics.iter_lines(io.StringIO(folded, newline=""))) == [line]
+
+
+def test_import_stores_events_recurrences_and_overrides(web, query):
+    stats = run_import(web, CALENDAR)
+
+    assert stats == {"imported": 3, "changed": 4, "deleted": 0, "skipped": 2}
+    stored = events(query)
+    lecture = stored["lecture"]
+    assert lecture["title"] == "Lecture, Computer Systems"
+    assert lecture["course_name"] == "CS 3214"
+    assert lecture["due_date"] == "2026-10-19T14:00:00Z"
+    assert lecture["end_date"] == "2026-10-19T15:15:00Z"
+    assert lecture["rrule"] == "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261211T045959Z"
+    assert lecture["exdates"] == "2026-10-21T14:00:00Z,2026-10-26T14:00:00Z"
+    assert lecture["tzid"] == "America/New_York"
+
+    moved = stored["lecture:20261028T100000"]
+    assert moved["master_id"] == "lecture"
+    assert moved["recurrence_id"] == "2026-10-28T14:00:00Z"
+    assert moved["due_date"] == "2026-10-28T17:00:00Z"
+    cancelled = stored["lecture:20261102T100000"]
+    assert cancelled["due_date"] is None
+    assert cancelled["recurrence_id"] == "2026-11-02T15:00:00Z"
+
+    assert stored["exam"]["due_date"] == "2026-12-10"
+    assert "no-start" not in stored
+
+
+def test_reimport_writes_only_what_changed(web, query):
+    run_import(web, CALENDAR)
+    version = query("SELECT version FROM user_data_versions WHERE user_id = ?", USER_ID)[0]["version"]
+
+    assert run_import(web, CALENDAR)["changed"] == 0
+    assert query("SELECT version FROM user_data_versions WHERE user_id = ?", USER_ID)[0]["version"] == version
+
+    stats = run_import(web, CALENDAR.replace("SUMMARY:Final exam", "SUMMARY:Final exam (room 100)"))
+
+    assert stats["changed"] == 1
+    assert events(query)["exam"]["title"] == "Final exam (room 100)"
+
+
+def test_cancelled_event_is_removed(web, query):
+    run_import(web, CALENDAR)
+
+    stats = run_import(web, CALENDAR.replace(
+        "UID:exam\r\n", "UID:exam\r\nSTATUS:CANCELLED\r\n"))
+
+    assert stats["deleted"] == 1
+    assert "exam" not in events(query)
+
+
+def test_every_committed_chunk_bumps_the_version(web, query):
+    stats = run_import(web, CALENDAR, chunk_size=1)
+
+    # four events written, one chunk each
+    assert stats["changed"] == 4
+    assert query("SELECT version FROM user_data_versions WHERE user_id = ?", USER_ID)[0]["version"] == 4
+
+
+def test_import_endpoint_takes_an_upload(web, query):
+    client = web.app.test_client()
+
+    response = client.post(
+        f"/api/calendar/import?userId={USER_ID}",
+        data={"file": (io.BytesIO(CALENDAR.encode("utf-8")), "cs3214.ics")},
+        content_type="multipart/form-data",
+    )
+
+    assert response.get_json() == {"success": True, "imported": 3, "changed": 4,
+                                   "deleted": 0, "skipped": 2}
+    assert len(events(query)) == 4
@@ -0,0 +1,118 @@
+"""Adaptive Canvas request limits (backend/canvas_limiter.py)."""
+import threading
+import time
+
+import pytest
+
+import canvas_limiter
+import http_client
+from canvas_limiter import CanvasLimiter
+
+TOKEN = "Bearer student"
+
+
+class Response:
+    """What the limiter reads of a Canvas response."""
+
+    def __init__(self, status_code=200, remaining=700, cost=1, text=""):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {"X-Rate-Limit-Remaining": str(remaining), "X-Request-Cost": str(cost)}
+
+    def close(self):
+        pass
+
+
+THROTTLED = dict(status_code=403, remaining=0, text="403 Forbidden (Rate Limit Exceeded)")
+
+
+def request(limiter, key, resp):
+    limiter.acquire(key)
+    limiter.release(key, resp)
+
+
+def test_healthy_responses_grow_the_limit_by_about_one_per_round():
+    limiter = CanvasLimiter(max_in_flight=32, token_max=8, token_initial=4)
+
+    for _ in range(4):
+        request(limiter, TOKEN, Response())
+
+    assert limiter._tokens[TOKEN].limit == pytest.approx(5, abs=0.1)
+
+
+def test_low_quota_halves_the_token_limit_once_per_interval():
+    limiter = CanvasLimiter(max_in_flight=32, token_max=8, token_initial=8)
+
+    # 2 requests of cost 40 still in flight leave 180 - 80 = 100, under LOW_WATER
+    limiter.acquire(TOKEN)
+    limiter.acquire(TOKEN)
+    request(limiter, TOKEN, Response(remaining=180, cost=40))
+    request(limiter, TOKEN, Response(remaining=170, cost=40))
+
+    assert limiter._tokens[TOKEN].limit == 4
+    assert limiter.total.limit == 32
+
+
+def test_throttling_halves_the_token_and_global_limits():
+    limiter = CanvasLimiter(max_in_flight=32, token_max=8, token_initial=8)
+
+    request(limiter, TOKEN, Response(**THROTTLED))
+
+    assert limiter._tokens[TOKEN].limit == 4
+    assert limiter.total.limit == 16
+
+
+def test_free_slots_go_to_waiting_tokens_round_robin():
+    limiter = CanvasLimiter(max_in_flight=1, token_max=1, token_initial=1)
+    started = []
+
+    def run(key, name):
+        limiter.acquire(key)
+        started.append(name)
+
+    limiter.acquire("busy")
+    threads = []
+    for key, name in (("busy", "busy 2"), ("busy", "busy 3"), ("quiet", "quiet 1")):
+        thread = threading.Thread(target=run, args=(key, name))
+        thread.start()
+        threads.append(thread)
+        while sum(len(w.waiters) for w in limiter._tokens.values()) < len(threads):
+            time.sleep(0.001)
+
+    for key in ("busy", "busy", "quiet"):
+        count = len(started)
+        limiter.release(key, Response())
+        while len(started) == count:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    # "quiet" doesn't wait behind every queued request of "busy"
+    assert started == ["busy 2", "quiet 1", "busy 3"]
+
+
+def test_get_retries_throttled_requests(monkeypatch):
+    responses = [Response(**THROTTLED), Response(**THROTTLED), Response()]
+    monkeypatch.setattr(http_client, "get", lambda url, headers=None, **kwargs: responses.pop(0))
+    monkeypatch.setattr(http_client, "_backoff_delay", lambda attempt: 0)
+    limiter = CanvasLimiter(max_in_flight=32, token_max=8, token_initial=8)
+
+    resp = limiter.get("https://canvas.test/api/v1/courses", headers={"Authorization": TOKEN})
+
+    assert resp.status_code == 200
+    assert not responses
+    # the two throttles came within DECREASE_INTERVAL, so the limit halved once
+    assert limiter._tokens[TOKEN].limit < 8
+
+
+def test_get_gives_up_after_throttle_retries(monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client, "get",
+                        lambda url, headers=None, **kwargs: calls.append(url) or Response(**THROTTLED))
+    monkeypatch.setattr(http_client, "_backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(canvas_limiter, "THROTTLE_RETRIES", 2)
+
+    resp = CanvasLimiter().get("https://canvas.test/api/v1/courses", headers={"Authorization": TOKEN})
+
+    assert resp.status_code == 403
+    assert len(calls) == 3
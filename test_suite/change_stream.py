@@ -0,0 +1,143 @@
+"""Change notifications (backend/changes.py) over a real threaded server.
+
+The server is Werkzeug's threaded one, the same thread per connection
+model as the gthread workers `serve.py` runs under gunicorn.
+"""
+import http.client
+import json
+import queue
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+import changes
+
+USER_ID = 1
+
+# seconds the sync below keeps the database write lock
+SYNC_SECONDS = 3
+
+
+@pytest.fixture
+def server(web, monkeypatch):
+    # the poller is per process and would outlive the test database
+    monkeypatch.setattr(changes, "start_poller", lambda get_db: None)
+    httpd = make_server("127.0.0.1", 0, web.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_port
+    httpd.shutdown()
+
+
+def open_stream(port):
+    """Read a change stream on a thread, returns a queue of (seconds, kind, data)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", f"/api/changes/stream?userId={USER_ID}")
+    response = conn.getresponse()
+    assert response.status == 200
+    received = queue.Queue()
+
+    def read():
+        kind = None
+        try:
+            for line in iter(response.readline, b""):
+                line = line.decode().rstrip("\n")
+                if line.startswith("event: "):
+                    kind = line[len("event: "):]
+                elif line.startswith("data: ") and kind:
+                    received.put((time.monotonic(), kind, json.loads(line[len("data: "):])))
+                    kind = None
+        except OSError:
+            pass  # closed by the test
+
+    threading.Thread(target=read, daemon=True).start()
+    return conn, received
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request(method, path, body=body and json.dumps(body),
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def hold_write_lock(web, started, seconds):
+    """A sync writing events in one long transaction."""
+    db = web.get_db()
+    try:
+        cursor = db.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.executemany(
+            "INSERT INTO calendar_events (user_id, title, due_date, source) VALUES (?, ?, ?, 'Canvas')",
+            [(USER_ID, f"Assignment {n}", f"2030-01-01T{n % 24:02d}:00:00Z") for n in range(500)]
+        )
+        started.set()
+        time.sleep(seconds)  # the next page is still being fetched
+        web.bump_data_version(cursor, USER_ID)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_stream_stays_responsive_while_a_sync_holds_the_database(web, server):
+    conn, received = open_stream(server)
+    time.sleep(0.2)  # subscribed
+
+    started = threading.Event()
+    sync = threading.Thread(target=hold_write_lock, args=(web, started, SYNC_SECONDS))
+    sync.start()
+    assert started.wait(5)
+    began = time.monotonic()
+
+    # a write request waits on SQLite's busy timeout until the sync commits
+    added = []
+    writer = threading.Thread(target=lambda: added.append(request(
+        server, "POST", "/api/calendar/events",
+        {"userId": USER_ID, "title": "Study group", "dueDate": "2030-01-02T18:00:00Z"})))
+    writer.start()
+    time.sleep(0.2)
+
+    # meanwhile other requests are answered and notifications delivered
+    assert request(server, "GET", "/api/health")[0] == 200
+    published = time.monotonic()
+    changes.hub.publish(USER_ID, "settings.updated")
+    at, kind, _ = received.get(timeout=SYNC_SECONDS)
+    assert kind == "settings.updated"
+    assert at - published < 1
+    assert at - began < SYNC_SECONDS
+
+    # once the sync commits, the blocked write goes through and is announced
+    sync.join()
+    writer.join()
+    assert added[0][0] == 200
+    at, kind, data = received.get(timeout=5)
+    assert kind == "event.added"
+    assert data["ids"] == [added[0][1]["id"]]
+    assert data["version"] == 2
+    conn.close()
+
+
+def test_reconnect_replays_missed_notifications():
+    hub = changes.Hub()
+    first = hub.publish(USER_ID, "event.added", 1, ids=[1])
+    hub.publish(USER_ID, "event.deleted", 2, ids=[1])
+    hub.publish(USER_ID + 1, "event.added", 1, ids=[7])
+
+    assert hub.subscribe(USER_ID)
+    stream = hub.stream(USER_ID, hub.event_id(first), heartbeat=0.01, lifetime=0.05)
+    messages = list(stream)
+    hub.unsubscribe(USER_ID)
+
+    assert messages[0].startswith("retry:")
+    assert messages[1] == changes.format_event(hub.event_id(2), "event.deleted",
+                                               {"ids": [1], "version": 2})
+    assert all(m == ": ping\n\n" for m in messages[2:])
+
+    # an id from another process can't be replayed
+    assert hub.resume_point("0.0-1") is None
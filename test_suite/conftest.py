@@ -0,0 +1,38 @@
+"""Shared fixtures for the test suite.
+
+The tests import the backend modules directly, the way scripts in backend/
+do, and each one runs against its own freshly migrated database.
+
+    python -m pytest test_suite/*.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import app  # noqa: E402
+import db as dbpool  # noqa: E402
+
+
+@pytest.fixture
+def web(tmp_path, monkeypatch):
+    """The backend app module, pointed at an empty database."""
+    path = str(tmp_path / "calendar.db")
+    monkeypatch.setattr(app, "DATABASE", path)
+    app.init_db()
+    yield app
+    dbpool.get_pool(path).close_all()
+
+
+@pytest.fixture
+def query(web):
+    """Run a query on the test database, returns its rows as dicts."""
+    def run(sql, *params):
+        db = web.get_db()
+        try:
+            return [dict(row) for row in db.execute(sql, params).fetchall()]
+        finally:
+            db.close()
+    return run
@@ -0,0 +1,97 @@
+"""Full-text event search (backend/search.py, GET /api/calendar/search)."""
+import pytest
+
+USER_ID = 1
+OTHER_USER_ID = 2
+
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+
+def add_event(web, user_id=USER_ID, **columns):
+    columns = dict({"user_id": user_id, "source": "Canvas"}, **columns)
+    db = web.get_db()
+    try:
+        cursor = db.execute(
+            f'INSERT INTO calendar_events ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+            tuple(columns.values())
+        )
+        web.bump_data_version(cursor, user_id)
+        db.commit()
+        return cursor.lastrowid
+    finally:
+        db.close()
+
+
+def search(client, q, **params):
+    response = client.get("/api/calendar/search",
+                          query_string=dict(userId=USER_ID, q=q, fields="title", **params))
+    return [event["title"] for event in response.get_json()["events"]]
+
+
+def test_finds_only_the_users_events(web, client):
+    add_event(web, title="Project 3 due", due_date="2030-01-10")
+    add_event(web, OTHER_USER_ID, title="Project 3 due", due_date="2030-01-10")
+
+    assert search(client, "project") == ["Project 3 due"]
+
+
+def test_prefix_matching(web, client):
+    add_event(web, title="Project 3 due", due_date="2030-01-10")
+
+    assert search(client, "proj 3") == ["Project 3 due"]
+    assert search(client, "proj 3", prefix="0") == []
+
+
+def test_title_matches_rank_above_descriptions(web, client):
+    add_event(web, title="Reading response", description="Chapter on the midterm topics",
+              due_date="2030-01-10")
+    add_event(web, title="Midterm", description="Room 160", due_date="2030-01-20")
+
+    assert search(client, "midterm") == ["Midterm", "Reading response"]
+
+
+def test_descriptions_are_indexed_as_text(web, client):
+    add_event(web, title="Lab 2", description="<p>Submit the <strong>lab report</strong></p>",
+              due_date="2030-01-10")
+
+    assert search(client, "lab report") == ["Lab 2"]
+    assert search(client, "strong") == []
+
+
+def test_operators_are_searched_as_words(web, client):
+    add_event(web, title="Exam review OR office hours", due_date="2030-01-10")
+
+    assert search(client, 'exam OR "office*') == ["Exam review OR office hours"]
+    # a column filter and NOT would exclude the event, as words they don't match
+    assert search(client, "NOT title:review") == []
+    response = client.get("/api/calendar/search", query_string={"userId": USER_ID, "q": '"*:'})
+    assert response.status_code == 400
+
+
+def test_index_follows_updates_and_deletes(web, client):
+    event_id = add_event(web, title="Quiz 1", due_date="2030-01-10")
+    db = web.get_db()
+    db.execute("UPDATE calendar_events SET title = 'Homework 1' WHERE id = ?", (event_id,))
+    db.commit()
+    db.close()
+    assert search(client, "quiz") == []
+    assert search(client, "homework") == ["Homework 1"]
+
+    db = web.get_db()
+    db.execute("DELETE FROM calendar_events WHERE id = ?", (event_id,))
+    web.bump_data_version(db.cursor(), USER_ID)
+    db.commit()
+    db.close()
+    assert search(client, "homework") == []
+
+
+def test_source_and_window_filters(web, client):
+    add_event(web, title="Lab 1", due_date="2030-01-10")
+    add_event(web, title="Lab 2", due_date="2030-02-10")
+    add_event(web, title="Lab meeting", due_date="2030-01-12", source="Google")
+
+    assert sorted(search(client, "lab", source="Canvas")) == ["Lab 1", "Lab 2"]
+    assert sorted(search(client, "lab", start="2030-01-01", end="2030-02-01")) == ["Lab 1", "Lab meeting"]
@@ -0,0 +1,95 @@
+"""Free/busy time and conflicts (backend/freebusy.py, GET /api/calendar/freebusy)."""
+import pytest
+
+import freebusy
+
+USER_ID = 1
+
+
+@pytest.fixture
+def client(web, monkeypatch):
+    # every test's database starts at data version 1, so indexes can't be shared
+    monkeypatch.setattr(freebusy, "cache", freebusy.IndexCache())
+    return web.app.test_client()
+
+
+def add_events(web, *events):
+    db = web.get_db()
+    try:
+        for columns in events:
+            columns = dict({"user_id": USER_ID, "source": "Manual"}, **columns)
+            cursor = db.execute(
+                f'INSERT INTO calendar_events ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                tuple(columns.values())
+            )
+        web.bump_data_version(cursor, USER_ID)
+        db.commit()
+    finally:
+        db.close()
+
+
+def free_busy(client, **params):
+    return client.get("/api/calendar/freebusy", query_string=dict(userId=USER_ID, **params))
+
+
+def test_index_merges_busy_blocks_and_finds_conflicts():
+    rows = [
+        dict(id=1, due_date="2030-01-10T09:00:00Z", end_date="2030-01-10T10:00:00Z"),
+        dict(id=2, due_date="2030-01-10T09:30:00Z", end_date="2030-01-10T11:00:00Z"),
+        dict(id=3, due_date="2030-01-10T13:00:00Z", end_date=None),
+        dict(id=4, due_date="2030-01-10", end_date=None),  # all day, left out
+    ]
+    index = freebusy.FreeBusyIndex(rows)
+    day = freebusy.to_epoch("2030-01-10", dates=True)
+    hour = 3600
+
+    assert len(index) == 3
+    assert index.busy(day, day + 24 * hour) == [(day + 9 * hour, day + 11 * hour),
+                                                (day + 13 * hour, day + 14 * hour)]
+    assert [(a["id"], b["id"]) for a, b, _, _ in index.conflicts()] == [(1, 2)]
+    assert index.first_free(2 * hour, day + 9 * hour, day + 24 * hour) == (day + 11 * hour,
+                                                                         day + 13 * hour)
+    assert index.first_free(3 * hour, day + 9 * hour, day + 16 * hour) is None
+
+
+def test_date_only_window_is_midnight_utc(web, client):
+    add_events(web, dict(title="Lab", due_date="2030-01-10T09:00:00Z", end_date="2030-01-10T10:00:00Z"))
+
+    response = free_busy(client, start="2030-01-10", end="2030-01-11", hours=1, before="2030-01-10T10:30:00Z")
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["busy"] == [{"start": "2030-01-10T09:00:00Z", "end": "2030-01-10T10:00:00Z"}]
+    assert result["free"][0] == {"start": "2030-01-10T00:00:00Z", "end": "2030-01-10T09:00:00Z"}
+    assert result["firstFree"] == {"start": "2030-01-10T00:00:00Z", "end": "2030-01-10T01:00:00Z"}
+
+
+def test_event_without_end_that_started_before_the_window(web, client):
+    # takes the default hour, so it runs until 09:30
+    add_events(web, dict(title="Office hours", due_date="2030-01-10T08:30:00Z"))
+
+    result = free_busy(client, start="2030-01-10T09:00:00Z", end="2030-01-10T12:00:00Z").get_json()
+
+    assert result["busy"] == [{"start": "2030-01-10T09:00:00Z", "end": "2030-01-10T09:30:00Z"}]
+
+
+def test_conflicts_across_sources(web, client):
+    add_events(
+        web,
+        dict(title="Exam", due_date="2030-01-10T14:00:00Z", end_date="2030-01-10T16:00:00Z",
+             source="Canvas"),
+        dict(title="Dentist", due_date="2030-01-10T15:00:00Z", end_date="2030-01-10T15:30:00Z",
+             source="Google"),
+    )
+
+    result = free_busy(client, start="2030-01-10", end="2030-01-11").get_json()
+
+    [conflict] = result["conflicts"]
+    assert [e["title"] for e in conflict["events"]] == ["Exam", "Dentist"]
+    assert (conflict["start"], conflict["end"]) == ("2030-01-10T15:00:00Z", "2030-01-10T15:30:00Z")
+    assert result["moreConflicts"] is False
+
+
+def test_bad_window_is_rejected(client):
+    assert free_busy(client, start="soon", end="2030-01-11").status_code == 400
+    assert free_busy(client, start="2030-01-11", end="2030-01-10").status_code == 400
@@ -0,0 +1,147 @@
+"""Google Calendar sync against the local fake API (backend/fake_google.py)."""
+import pytest
+
+import google_calendar
+import google_sync
+from fake_google import FakeGoogleCalendar
+
+USER_ID = 1
+
+
+@pytest.fixture
+def google(monkeypatch):
+    # small pages, so every listing is paginated
+    fake = FakeGoogleCalendar(page_size=2).start()
+    monkeypatch.setattr(google_calendar, "BASE_URL", fake.url)
+    yield fake
+    fake.stop()
+
+
+def timed(event_id, summary, start, **extra):
+    return dict({"id": event_id, "summary": summary, "start": {"dateTime": start}}, **extra)
+
+
+def seed(google):
+    google.add_calendar("primary", "Personal")
+    google.add_calendar("club@group.calendar.google.com", "Club")
+    for n in range(5):
+        google.put_event("primary", timed(f"p{n}", f"Meeting {n}", f"2030-01-0{n + 1}T15:00:00Z"))
+    google.put_event("club@group.calendar.google.com", timed(
+        "weekly", "Club night", "2030-01-07T23:00:00Z",
+        recurrence=["RRULE:FREQ=WEEKLY;COUNT=10"]))
+
+
+def sync(web, full=False):
+    db = web.get_db()
+    try:
+        stats = google_sync.sync_google(db, USER_ID, "token", full)
+        db.commit()
+        return stats
+    finally:
+        db.close()
+
+
+def events(query):
+    return {row["external_id"]: row for row in query(
+        "SELECT * FROM calendar_events WHERE user_id = ? AND source = 'Google'", USER_ID)}
+
+
+def test_full_sync_imports_every_calendar(web, query, google):
+    seed(google)
+
+    stats = sync(web)
+
+    assert stats["calendars"] == 2
+    assert stats["fullSyncs"] == 2
+    assert stats["eventsChanged"] == 6
+    stored = events(query)
+    assert sorted(stored) == sorted(
+        [f"primary:p{n}" for n in range(5)] + ["club@group.calendar.google.com:weekly"])
+    assert stored["primary:p0"]["title"] == "Meeting 0"
+    assert stored["primary:p0"]["course_name"] == "Personal"
+    assert stored["primary:p0"]["due_date"] == "2030-01-01T15:00:00Z"
+    assert stored["club@group.calendar.google.com:weekly"]["rrule"] == "FREQ=WEEKLY;COUNT=10"
+    tokens = query("SELECT calendar_id, sync_token FROM google_sync_state WHERE user_id = ?", USER_ID)
+    assert len(tokens) == 2 and all(t["sync_token"] for t in tokens)
+
+
+def test_unchanged_resync_writes_nothing(web, google):
+    seed(google)
+    sync(web)
+
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 0
+    assert stats["eventsChanged"] == 0
+
+
+def test_delta_sync_applies_changes_and_cancellations(web, query, google):
+    seed(google)
+    sync(web)
+    requests = google.requests
+
+    google.put_event("primary", timed("p1", "Meeting 1 (moved)", "2030-01-02T18:00:00Z"))
+    google.put_event("primary", timed("p9", "New meeting", "2030-02-01T15:00:00Z"))
+    google.cancel_event("primary", "p2")
+    # one instance of the weekly series cancelled
+    google.put_event("club@group.calendar.google.com", {
+        "id": "weekly_20300114T230000Z", "status": "cancelled", "recurringEventId": "weekly",
+        "originalStartTime": {"dateTime": "2030-01-14T23:00:00Z"},
+    })
+
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 0
+    assert stats["eventsChanged"] == 4
+    # the calendar list, two delta pages for primary's three changes and
+    # one for the club calendar
+    assert google.requests - requests == 4
+    stored = events(query)
+    assert "primary:p2" not in stored
+    assert stored["primary:p1"]["title"] == "Meeting 1 (moved)"
+    assert stored["primary:p1"]["due_date"] == "2030-01-02T18:00:00Z"
+    assert stored["primary:p9"]["title"] == "New meeting"
+    override = stored["club@group.calendar.google.com:weekly_20300114T230000Z"]
+    assert override["due_date"] is None
+    assert override["master_id"] == "club@group.calendar.google.com:weekly"
+    assert override["recurrence_id"] == "2030-01-14T23:00:00Z"
+
+
+def test_cancelled_series_removes_its_overrides(web, query, google):
+    seed(google)
+    google.put_event("club@group.calendar.google.com", timed(
+        "weekly_20300114T230000Z", "Club night (late)", "2030-01-15T01:00:00Z",
+        recurringEventId="weekly", originalStartTime={"dateTime": "2030-01-14T23:00:00Z"}))
+    sync(web)
+    assert "club@group.calendar.google.com:weekly_20300114T230000Z" in events(query)
+
+    google.cancel_event("club@group.calendar.google.com", "weekly")
+    sync(web)
+
+    assert not [key for key in events(query) if key.startswith("club@")]
+
+
+def test_expired_token_falls_back_to_full_sync(web, query, google):
+    seed(google)
+    sync(web)
+    tokens = {t["calendar_id"]: t["sync_token"] for t in query(
+        "SELECT calendar_id, sync_token FROM google_sync_state WHERE user_id = ?", USER_ID)}
+
+    # deleted while the tokens were expired, so no delta will ever report it
+    del google.calendars["primary"]["events"]["p3"]
+    google.put_event("primary", timed("p4", "Meeting 4 (renamed)", "2030-01-05T15:00:00Z"))
+    google.expire_tokens()
+
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 2
+    stored = events(query)
+    assert "primary:p3" not in stored
+    assert stored["primary:p4"]["title"] == "Meeting 4 (renamed)"
+    assert len(stored) == 5
+    renewed = {t["calendar_id"]: t["sync_token"] for t in query(
+        "SELECT calendar_id, sync_token FROM google_sync_state WHERE user_id = ?", USER_ID)}
+    assert all(renewed[c] != tokens[c] for c in tokens)
+
+    # the new tokens work for deltas again
+    assert sync(web)["fullSyncs"] == 0
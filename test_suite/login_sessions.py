@@ -0,0 +1,103 @@
+"""Login sessions and their per-process cache (backend/sessions.py)."""
+import time
+
+import pytest
+
+import sessions
+
+USER_ID = 1
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two session caches, as two worker processes would have, the first in use."""
+    caches = [sessions.SessionCache(), sessions.SessionCache()]
+    monkeypatch.setattr(sessions, "cache", caches[0])
+    return caches
+
+
+def login(web, commit=True):
+    db = web.get_db()
+    try:
+        token = sessions.create(db.cursor(), USER_ID)
+        if commit:
+            db.commit()
+        return token
+    finally:
+        db.close()
+
+
+def logout(web, token):
+    db = web.get_db()
+    try:
+        revoked = sessions.revoke(db.cursor(), token)
+        db.commit()
+        return revoked
+    finally:
+        db.close()
+
+
+def resolve(web, token):
+    return sessions.resolve(web.get_db, token)
+
+
+def test_login_is_cached_on_first_lookup(web, workers):
+    token = login(web)
+    assert len(workers[0]) == 0
+
+    assert resolve(web, token) == USER_ID
+    assert workers[0].get(token) == USER_ID
+
+
+def test_rolled_back_login_is_never_resolved(web, workers):
+    token = login(web, commit=False)
+
+    assert resolve(web, token) is None
+    assert len(workers[0]) == 0
+
+
+def test_logout_in_another_worker_ends_the_cached_session(web, workers, monkeypatch):
+    token = login(web)
+    assert resolve(web, token) == USER_ID
+
+    # the logout request lands on the other worker
+    monkeypatch.setattr(sessions, "cache", workers[1])
+    assert logout(web, token)
+    monkeypatch.setattr(sessions, "cache", workers[0])
+
+    assert resolve(web, token) is None
+    assert workers[0].get(token) is None
+
+
+def test_lookup_racing_a_logout_is_not_cached(web, workers):
+    token = login(web)
+    revision = workers[0].revision
+    logout(web, token)
+    db = web.get_db()
+    try:
+        workers[0].catch_up(db)
+    finally:
+        db.close()
+
+    # the row was read before the logout committed
+    workers[0].put(token, USER_ID, time.time() + 60, revision)
+
+    assert workers[0].get(token) is None
+
+
+def test_sweep_drops_expired_sessions_and_old_revocations(web, workers, query, monkeypatch):
+    expired, live, revoked = login(web), login(web), login(web)
+    logout(web, revoked)
+    db = web.get_db()
+    db.execute("UPDATE login_sessions SET expires_at = '2000-01-01 00:00:00' WHERE session_token = ?",
+               (expired,))
+    db.commit()
+    monkeypatch.setattr(sessions, "CACHE_TTL", -1)
+
+    try:
+        assert sessions.sweep(db, batch=1) == 1
+    finally:
+        db.close()
+
+    assert [row["session_token"] for row in query("SELECT session_token FROM login_sessions")] == [live]
+    assert query("SELECT * FROM session_revocations") == []
@@ -0,0 +1,154 @@
+"""Microsoft 365 calendar sync against the local fake Graph API (backend/fake_microsoft.py)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import microsoft_sync
+from fake_microsoft import FakeMicrosoftGraph
+
+USER_ID = 1
+
+TODAY = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    # small pages, so every listing follows nextLinks
+    fake = FakeMicrosoftGraph(page_size=2).start()
+    monkeypatch.setattr(microsoft_sync, "BASE_URL", fake.url)
+    yield fake
+    fake.stop()
+
+
+def graph_event(event_id, subject, days):
+    start = TODAY + timedelta(days=days)
+    return {
+        "id": event_id,
+        "subject": subject,
+        "isAllDay": False,
+        "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+        "end": {"dateTime": (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.0000000"),
+                "timeZone": "UTC"},
+    }
+
+
+def seed(graph):
+    graph.add_calendar("AAMkWork", "Work")
+    graph.add_calendar("AAMkHome", "Home")
+    for n in range(5):
+        graph.put_event("AAMkWork", graph_event(f"w{n}", f"Standup {n}", n + 1))
+    graph.put_event("AAMkHome", graph_event("h0", "Dentist", 3))
+
+
+def sync(web, full=False):
+    db = web.get_db()
+    try:
+        stats = microsoft_sync.sync_microsoft(db, USER_ID, "token", full)
+        db.commit()
+        return stats
+    finally:
+        db.close()
+
+
+def events(query):
+    return {row["external_id"]: row for row in query(
+        "SELECT * FROM calendar_events WHERE user_id = ? AND source = 'Microsoft'", USER_ID)}
+
+
+def delta_links(query):
+    return {row["calendar_id"]: row for row in query(
+        "SELECT * FROM microsoft_sync_state WHERE user_id = ?", USER_ID)}
+
+
+def test_first_sync_lists_the_window(web, query, graph):
+    seed(graph)
+    graph.put_event("AAMkWork", graph_event("late", "Too far ahead", microsoft_sync.WINDOW_DAYS + 5))
+
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 2
+    assert stats["eventsChanged"] == 6
+    stored = events(query)
+    assert "AAMkWork:late" not in stored
+    assert stored["AAMkWork:w0"]["title"] == "Standup 0"
+    assert stored["AAMkWork:w0"]["course_name"] == "Work"
+    assert stored["AAMkHome:h0"]["due_date"].endswith("Z")
+    links = delta_links(query)
+    assert sorted(links) == ["AAMkHome", "AAMkWork"]
+    assert all("$deltatoken=" in s["delta_link"] and s["window_end"] for s in links.values())
+
+
+def test_delta_link_is_reused(web, query, graph):
+    seed(graph)
+    sync(web)
+    links = delta_links(query)
+    requests = graph.requests
+
+    graph.put_event("AAMkWork", graph_event("w1", "Standup 1 (moved)", 8))
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 0
+    assert stats["eventsChanged"] == 1
+    # the calendar list and one delta page per calendar
+    assert graph.requests - requests == 3
+    assert events(query)["AAMkWork:w1"]["title"] == "Standup 1 (moved)"
+    # the window end stays the one the link was created for
+    renewed = delta_links(query)
+    assert renewed["AAMkWork"]["window_end"] == links["AAMkWork"]["window_end"]
+    assert renewed["AAMkWork"]["delta_link"] != links["AAMkWork"]["delta_link"]
+
+
+def test_removed_events_are_deleted(web, query, graph):
+    seed(graph)
+    sync(web)
+
+    graph.delete_event("AAMkWork", "w2")
+    graph.delete_event("AAMkHome", "h0")
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 0
+    assert stats["eventsChanged"] == 2
+    stored = events(query)
+    assert "AAMkWork:w2" not in stored
+    assert "AAMkHome:h0" not in stored
+    assert len(stored) == 4
+
+
+def test_expired_delta_link_falls_back_to_full_sync(web, query, graph):
+    seed(graph)
+    sync(web)
+
+    # deleted while the links were expired, so no delta will ever report it
+    del graph.calendars["AAMkWork"]["events"]["w3"]
+    graph.put_event("AAMkHome", graph_event("h1", "Plumber", 4))
+    graph.expire_links()
+
+    stats = sync(web)
+
+    assert stats["fullSyncs"] == 2
+    stored = events(query)
+    assert "AAMkWork:w3" not in stored
+    assert stored["AAMkHome:h1"]["title"] == "Plumber"
+
+    # the new links work for deltas again
+    assert sync(web)["fullSyncs"] == 0
+
+
+def test_expiring_window_is_listed_again(web, query, graph):
+    seed(graph)
+    sync(web)
+    soon = (TODAY + timedelta(days=microsoft_sync.WINDOW_DAYS / 2 - 1)).isoformat()
+    db = web.get_db()
+    db.execute("UPDATE microsoft_sync_state SET window_end = ? WHERE calendar_id = 'AAMkWork'", (soon,))
+    db.commit()
+    db.close()
+    requests = graph.requests
+
+    stats = sync(web)
+
+    # only the calendar whose window is running out starts over
+    assert stats["fullSyncs"] == 1
+    assert stats["eventsChanged"] == 0
+    # the calendar list, three pages listing Work's five events, one Home delta
+    assert graph.requests - requests == 1 + 3 + 1
+    assert delta_links(query)["AAMkWork"]["window_end"] > soon
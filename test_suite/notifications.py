@@ -0,0 +1,188 @@
+"""Reminder dispatch (backend/reminders.py) with a stub backend and a controlled clock."""
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import reminders
+
+USER_ID = 1
+HOUR = 3600
+
+
+class Clock:
+    """Engine clock that only moves when told to, starting at the real time.
+
+    Change polling compares `user_data_versions.updated_at`, which is wall
+    clock time, so the clock starts at it.
+    """
+
+    def __init__(self):
+        self.start = self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+    def at(self, hours):
+        self.now = self.start + hours * HOUR
+
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def engine(web, clock):
+    return reminders.ReminderEngine(backend=reminders.StubBackend(), clock=clock)
+
+
+def add_event(web, clock, title, due_in_hours, **columns):
+    """Insert an event due `due_in_hours` after the clock's start, returns its id."""
+    columns = dict(user_id=USER_ID, title=title, due_date=iso(clock.start + due_in_hours * HOUR),
+                   source="Custom", **columns)
+    db = web.get_db()
+    try:
+        cursor = db.execute(
+            f'INSERT INTO calendar_events ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+            tuple(columns.values())
+        )
+        web.bump_data_version(cursor, USER_ID)
+        db.commit()
+        return cursor.lastrowid
+    finally:
+        db.close()
+
+
+def reminder_sent(query, event_id):
+    return query("SELECT reminder_sent FROM calendar_events WHERE id = ?", event_id)[0]["reminder_sent"]
+
+
+def sent(engine):
+    return [(r.title, r.stage) for r in engine.backend.sent]
+
+
+def test_reminders_fire_in_order_of_their_fire_time(web, clock, engine, query):
+    # first reminders are 24 hours before the due date by default
+    add_event(web, clock, "Essay", 30)
+    add_event(web, clock, "Quiz", 26)
+    later = add_event(web, clock, "Exam", 48)
+    engine.rebuild()
+    assert len(engine) == 3
+
+    clock.at(1)
+    assert engine.tick() == 0
+
+    clock.at(7)
+    assert engine.tick() == 2
+    assert sent(engine) == [("Quiz", 1), ("Essay", 1)]
+    assert reminder_sent(query, later) == 0
+    assert len(engine) == 3  # both are queued again for their second reminder
+
+
+def test_reminder_sent_counts_the_stages_delivered(web, clock, engine, query):
+    event_id = add_event(web, clock, "Lab report", 30)
+    engine.rebuild()
+
+    clock.at(6)
+    assert engine.tick() == 1
+    assert reminder_sent(query, event_id) == 1
+
+    # the second one goes out an hour before the due date
+    clock.at(28.9)
+    assert engine.tick() == 0
+    clock.at(29)
+    assert engine.tick() == 1
+    assert sent(engine) == [("Lab report", 1), ("Lab report", 2)]
+    assert reminder_sent(query, event_id) == 2
+    assert len(engine) == 0
+
+    clock.at(31)
+    assert engine.tick() == 0
+    engine.rebuild()
+    assert len(engine) == 0
+
+
+def test_stages_already_past_are_skipped(web, clock, engine, query):
+    # added two hours before it's due, the 24 hour reminder's time has passed
+    event_id = add_event(web, clock, "Lab report", 2)
+    engine.rebuild()
+
+    assert engine.tick() == 0
+    clock.at(1)
+    assert engine.tick() == 1
+    assert sent(engine) == [("Lab report", 2)]
+    assert reminder_sent(query, event_id) == 2
+
+    # both reminders' times have passed
+    add_event(web, clock, "Quiz", 1.5)
+    assert engine.tick() == 0
+    assert len(engine) == 0
+
+
+def test_moved_event_is_reminded_again(web, clock, engine, query):
+    event_id = add_event(web, clock, "Project", 30)
+    engine.rebuild()
+    clock.at(6)
+    assert engine.tick() == 1
+
+    # syncs reset reminder_sent when a due date moves
+    db = web.get_db()
+    db.execute("UPDATE calendar_events SET due_date = ?, reminder_sent = 0 WHERE id = ?",
+               (iso(clock.start + 50 * HOUR), event_id))
+    web.bump_data_version(db.cursor(), USER_ID)
+    db.commit()
+    db.close()
+
+    clock.at(8)
+    assert engine.tick() == 0
+    clock.at(26)
+    assert engine.tick() == 1
+    assert sent(engine) == [("Project", 1), ("Project", 1)]
+    assert reminder_sent(query, event_id) == 1
+
+
+def test_settings_change_reloads_the_user(web, clock, engine):
+    add_event(web, clock, "Essay", 30)
+    engine.rebuild()
+    client = web.app.test_client()
+
+    client.put("/api/settings", json={"userId": USER_ID, "email_notifications": 1,
+                                      "push_notifications": 0, "reminder_before_hours": 2,
+                                      "reminder_before_minutes": 0})
+    clock.at(7)  # when the default 24 hour reminder would have gone out
+    assert engine.tick() == 0
+
+    clock.at(28)
+    assert engine.tick() == 1
+    reminder = engine.backend.sent[0]
+    assert (reminder.stage, reminder.email, reminder.push) == (1, True, False)
+    assert len(engine) == 0  # minutes = 0 turns the second reminder off
+
+    add_event(web, clock, "Quiz", 40)
+    client.put("/api/settings", json={"userId": USER_ID, "email_notifications": 0,
+                                      "push_notifications": 0, "reminder_before_hours": 2,
+                                      "reminder_before_minutes": 0})
+    engine.tick()
+    assert len(engine) == 0
+
+
+def test_recurring_events_are_reminded_per_instance(web, clock, engine, query):
+    # a daily series that started ten days ago, its master row is never marked
+    master = add_event(web, clock, "Standup", -240 + 12, rrule="FREQ=DAILY", external_id="daily")
+    engine.rebuild()
+
+    for hour in range(0, 60):
+        clock.at(hour)
+        engine.tick()
+
+    # today's 24 hour reminder is past, so its instance gets the second one
+    assert sent(engine) == [("Standup", 2), ("Standup", 1), ("Standup", 2), ("Standup", 1),
+                            ("Standup", 2)]
+    due_dates = [r.due_date for r in engine.backend.sent]
+    assert due_dates == sorted(due_dates)
+    assert reminder_sent(query, master) == 0
@@ -0,0 +1,117 @@
+"""Expansion of recurring events (backend/recurrence.py) and their overrides."""
+import recurrence
+
+USER_ID = 1
+
+
+def expand(dtstart, rrule, tzid=None, exdates=None, start=None, end=None):
+    return list(recurrence.expand(dtstart, rrule, tzid, exdates, start, end))
+
+
+def test_instances_keep_local_time_across_dst():
+    # 10:00 in New York, daylight saving time ends on Nov 1 2026
+    starts = expand("2026-10-19T14:00:00Z", "FREQ=WEEKLY;BYDAY=MO;COUNT=4", "America/New_York")
+
+    assert starts == ["2026-10-19T14:00:00Z", "2026-10-26T14:00:00Z",
+                      "2026-11-02T15:00:00Z", "2026-11-09T15:00:00Z"]
+
+
+def test_without_tzid_instances_keep_utc_time():
+    starts = expand("2026-10-26T14:00:00Z", "FREQ=WEEKLY;COUNT=2")
+
+    assert starts == ["2026-10-26T14:00:00Z", "2026-11-02T14:00:00Z"]
+
+
+def test_count_and_until():
+    assert expand("2026-01-01", "FREQ=DAILY;INTERVAL=2;COUNT=3") == [
+        "2026-01-01", "2026-01-03", "2026-01-05"]
+    # UNTIL is inclusive
+    assert expand("2026-01-05T09:00:00Z", "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20260114T090000Z") == [
+        "2026-01-05T09:00:00Z", "2026-01-07T09:00:00Z",
+        "2026-01-12T09:00:00Z", "2026-01-14T09:00:00Z"]
+
+
+def test_count_is_taken_before_the_window():
+    starts = expand("2026-01-01", "FREQ=DAILY;COUNT=5", start="2026-01-04", end="2026-02-01")
+
+    assert starts == ["2026-01-04", "2026-01-05"]
+
+
+def test_exdates_remove_instances():
+    starts = expand("2026-01-05T09:00:00Z", "FREQ=DAILY;COUNT=4",
+                    exdates="2026-01-06T09:00:00Z,2026-01-08T09:00:00Z")
+
+    assert starts == ["2026-01-05T09:00:00Z", "2026-01-07T09:00:00Z"]
+
+
+def test_negative_bymonthday_counts_from_the_end_of_the_month():
+    starts = expand("2026-01-31", "FREQ=MONTHLY;BYMONTHDAY=-1;COUNT=4")
+
+    assert starts == ["2026-01-31", "2026-02-28", "2026-03-31", "2026-04-30"]
+
+
+def test_ordinal_byday():
+    assert expand("2026-01-01", "FREQ=MONTHLY;BYDAY=2TU;COUNT=3") == [
+        "2026-01-13", "2026-02-10", "2026-03-10"]
+    # last Friday of May and November
+    assert expand("2026-01-01", "FREQ=YEARLY;BYMONTH=5,11;BYDAY=-1FR;COUNT=3") == [
+        "2026-05-29", "2026-11-27", "2027-05-28"]
+
+
+def test_unsupported_rules_give_the_first_instance_alone():
+    # DAILY limited by BYDAY, and parts that aren't implemented at all
+    for rule in ("FREQ=DAILY;BYDAY=MO,WE", "FREQ=MONTHLY;BYDAY=TU;BYSETPOS=2",
+                 "FREQ=YEARLY;BYWEEKNO=20", "FREQ=YEARLY;BYYEARDAY=100",
+                 "FREQ=DAILY;BYHOUR=9,17", "FREQ=HOURLY", "FREQ=WEEKLY;BYDAY=1MO"):
+        assert expand("2026-01-05T09:00:00Z", rule) == ["2026-01-05T09:00:00Z"], rule
+
+    # outside the window it isn't listed either
+    assert expand("2026-01-05", "FREQ=DAILY;BYDAY=MO", start="2026-02-01") == []
+
+
+def test_rule_that_never_matches_ends():
+    assert expand("2024-02-01", "FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=30") == []
+    assert expand("2024-02-01", "FREQ=MONTHLY;INTERVAL=12;BYMONTHDAY=30") == []
+
+
+def test_leap_day_skips_years_without_one():
+    starts = expand("2096-02-29", "FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=29;COUNT=3")
+
+    assert starts == ["2096-02-29", "2104-02-29", "2108-02-29"]
+
+
+def add_events(web, *events):
+    db = web.get_db()
+    try:
+        for columns in events:
+            columns = dict(user_id=USER_ID, source="Google", **columns)
+            db.execute(
+                f'INSERT INTO calendar_events ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                tuple(columns.values())
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_events_api_applies_overrides_in_the_window(web):
+    add_events(
+        web,
+        dict(external_id="standup", title="Standup", due_date="2030-01-07T15:00:00Z",
+             rrule="FREQ=WEEKLY;COUNT=10"),
+        # moved from the week before the window into it
+        dict(external_id="standup_0114", title="Standup (moved)", due_date="2030-01-22T15:00:00Z",
+             master_id="standup", recurrence_id="2030-01-14T15:00:00Z"),
+        # cancelled inside the window
+        dict(external_id="standup_0128", master_id="standup", recurrence_id="2030-01-28T15:00:00Z"),
+    )
+    client = web.app.test_client()
+
+    response = client.get(f"/api/calendar/events?userId={USER_ID}&start=2030-01-20&end=2030-02-10"
+                          "&fields=title,due_date")
+
+    assert response.get_json()["events"] == [
+        {"title": "Standup", "due_date": "2030-01-21T15:00:00Z"},
+        {"title": "Standup (moved)", "due_date": "2030-01-22T15:00:00Z"},
+        {"title": "Standup", "due_date": "2030-02-04T15:00:00Z"},
+    ]
@@ -0,0 +1,34 @@
+"""Metrics endpoint (backend/metrics.py, GET /api/metrics)."""
+import pytest
+
+import metrics
+
+REMOTE = {"REMOTE_ADDR": "203.0.113.7"}
+
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+
+def test_local_requests_read_the_metrics(client):
+    client.get("/api/health")
+
+    response = client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert 'route="/api/health"' in response.get_data(as_text=True)
+
+
+def test_remote_requests_are_refused_without_a_token(client):
+    assert client.get("/api/metrics", environ_base=REMOTE).status_code == 403
+
+
+def test_token_is_required_once_configured(client, monkeypatch):
+    monkeypatch.setattr(metrics, "TOKEN", "scrape-secret")
+
+    assert client.get("/api/metrics").status_code == 403
+    assert client.get("/api/metrics", environ_base=REMOTE,
+                      headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.get("/api/metrics", environ_base=REMOTE,
+                      headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
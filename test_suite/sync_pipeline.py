@@ -0,0 +1,137 @@
+"""Fetch-to-database pipeline shared by the syncs (backend/pipeline.py)."""
+import threading
+
+import pytest
+
+import pipeline
+
+USER_ID = 1
+
+INSERT = "INSERT INTO calendar_events (user_id, title, source, external_id) VALUES (?, ?, 'Canvas', ?)"
+DELETE = "DELETE FROM calendar_events WHERE user_id = ? AND external_id = ?"
+
+
+def test_fan_in_yields_every_item_of_every_source():
+    items = pipeline.fan_in(range(5), lambda n: ((n, page) for page in range(3)), workers=3)
+
+    assert sorted(items) == [(n, page) for n in range(5) for page in range(3)]
+
+
+def test_fan_in_raises_a_producer_error():
+    def produce(n):
+        yield n
+        if n == 2:
+            raise ValueError("page 2 failed")
+
+    with pytest.raises(ValueError, match="page 2 failed"):
+        list(pipeline.fan_in(range(5), produce, workers=2))
+
+
+def test_fan_in_applies_backpressure_and_stops_when_closed():
+    produced = []
+    lock = threading.Lock()
+
+    def produce(n):
+        for page in range(100):
+            with lock:
+                produced.append(page)
+            yield page
+
+    items = pipeline.fan_in([0], produce, workers=1, queue_size=2)
+    consumed = [next(items) for _ in range(10)]
+    items.close()
+
+    assert consumed == list(range(10))
+    # the worker is at most the queue and the item it's putting ahead
+    assert len(produced) <= 10 + 3
+
+
+def commit_count(web):
+    """Rows another connection can see, so only committed ones."""
+    db = web.get_db()
+    try:
+        return db.execute("SELECT COUNT(*) FROM calendar_events").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_chunk_writer_commits_full_chunks_in_order(web):
+    db = web.get_db()
+    commits = []
+    writer = pipeline.ChunkWriter(db, chunk_size=3, on_commit=lambda cursor: commits.append(
+        cursor.execute("SELECT COUNT(*) FROM calendar_events").fetchone()[0]))
+    try:
+        writer.add(INSERT, (USER_ID, "A", "a"), "written")
+        writer.add(INSERT, (USER_ID, "B", "b"), "written")
+        # runs after the inserts before it, in the same chunk
+        writer.add(DELETE, (USER_ID, "a"), "deleted")
+        assert commit_count(web) == 1
+        assert commits == [1]
+
+        writer.add(INSERT, (USER_ID, "C", "c"), "written")
+        writer.add(INSERT, (USER_ID, "D", "d"), "written")
+        # the partial chunk waits for the caller
+        assert commit_count(web) == 1
+
+        writer.flush()
+        assert commit_count(web) == 1
+        db.commit()
+        assert commit_count(web) == 3
+    finally:
+        db.close()
+
+    assert writer.count("written") == 4
+    assert writer.count("deleted") == 1
+
+
+def test_chunk_writer_skips_the_hook_when_nothing_changed(web):
+    db = web.get_db()
+    hooks = []
+    writer = pipeline.ChunkWriter(db, chunk_size=2, on_commit=hooks.append)
+    try:
+        # deletes of rows that don't exist change nothing
+        writer.add(DELETE, (USER_ID, "missing 1"), "deleted")
+        writer.add(DELETE, (USER_ID, "missing 2"), "deleted")
+        writer.add(INSERT, (USER_ID, "A", "a"), "written")
+        writer.add(INSERT, (USER_ID, "B", "b"), "written")
+    finally:
+        db.close()
+
+    assert len(hooks) == 1
+    assert writer.count("deleted") == 0
+
+
+def test_failed_sync_keeps_committed_chunks_announced(web, query):
+    db = web.get_db()
+    writer = pipeline.ChunkWriter(db, chunk_size=2,
+                                  on_commit=lambda cursor: web.bump_data_version(cursor, USER_ID))
+
+    def pages():
+        yield [(USER_ID, "A", "a"), (USER_ID, "B", "b")]
+        yield [(USER_ID, "C", "c")]
+        raise ConnectionError("Canvas went away")
+
+    try:
+        with pytest.raises(ConnectionError):
+            for page in pipeline.fan_in([0], lambda _: pages(), workers=1):
+                for params in page:
+                    writer.add(INSERT, params, "written")
+    finally:
+        db.close()  # rolls back the partial chunk
+
+    assert [row["title"] for row in query("SELECT title FROM calendar_events ORDER BY title")] == ["A", "B"]
+    assert query("SELECT version FROM user_data_versions WHERE user_id = ?", USER_ID)[0]["version"] == 1
+
+
+def test_last_chunk_runs_the_hook_for_the_caller_to_commit(web, query):
+    db = web.get_db()
+    writer = pipeline.ChunkWriter(db, chunk_size=10,
+                                  on_commit=lambda cursor: web.bump_data_version(cursor, USER_ID))
+    try:
+        writer.add(INSERT, (USER_ID, "A", "a"), "written")
+        writer.flush()
+        db.commit()
+    finally:
+        db.close()
+
+    assert query("SELECT version FROM user_data_versions WHERE user_id = ?", USER_ID)[0]["version"] == 1
@@ -0,0 +1,85 @@
+"""Background sync jobs (backend/scheduler.py) with stand-in provider syncs."""
+import pytest
+import requests
+
+import pipeline
+import scheduler
+
+USER_ID = 1
+
+
+@pytest.fixture
+def worker(web):
+    worker = scheduler.SyncScheduler()
+    yield worker
+    for pool in worker._pools.values():
+        pool.shutdown(wait=True)
+
+
+def link(web, provider):
+    db = web.get_db()
+    try:
+        web.save_connected_account(db.cursor(), USER_ID, provider, "stored token", None)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_due(web, worker, monkeypatch, provider, sync):
+    """Make the account's job due and run it on this thread."""
+    monkeypatch.setitem(scheduler.PROVIDERS, provider, (sync, 1))
+    db = web.get_db()
+    try:
+        worker.ensure_jobs(db)
+        db.execute("UPDATE sync_jobs SET next_run_at = 0")
+        db.commit()
+        claimed = worker.claim_due(db)
+    finally:
+        db.close()
+    assert claimed == [(USER_ID, provider)]
+    worker.run_job(USER_ID, provider)
+
+
+def test_rejected_token_unlinks_the_account(web, worker, query, monkeypatch):
+    link(web, "Google")
+
+    def sync(db, user_id, access_token):
+        response = requests.Response()
+        response.status_code = 401
+        raise requests.HTTPError("401 Unauthorized", response=response)
+
+    run_due(web, worker, monkeypatch, "Google", sync)
+
+    assert query("SELECT access_token FROM connected_accounts")[0]["access_token"] is None
+    assert query("SELECT * FROM sync_jobs") == []
+    assert worker._in_flight["Google"] == 0
+
+
+def test_other_failures_back_off(web, worker, query, monkeypatch):
+    link(web, "Microsoft")
+
+    def sync(db, user_id, access_token):
+        raise requests.ConnectionError("Graph went away")
+
+    run_due(web, worker, monkeypatch, "Microsoft", sync)
+
+    [job] = query("SELECT failures, last_error FROM sync_jobs")
+    assert job["failures"] == 1
+    assert "ConnectionError" in job["last_error"]
+    assert query("SELECT access_token FROM connected_accounts")[0]["access_token"] == "stored token"
+
+
+def test_sync_bumps_the_data_version_once_per_commit(web, worker, query, monkeypatch):
+    link(web, "Google")
+
+    def sync(db, user_id, access_token):
+        writer = pipeline.ChunkWriter(db, on_commit=lambda cursor: web.bump_data_version(cursor, user_id))
+        writer.add("INSERT INTO calendar_events (user_id, title, source) VALUES (?, 'Exam', 'Google')",
+                   (user_id,), "events")
+        writer.flush()
+        return {"eventsChanged": writer.count("events"), "syncedAt": "2030-01-01T00:00:00+00:00"}
+
+    run_due(web, worker, monkeypatch, "Google", sync)
+
+    assert query("SELECT version FROM user_data_versions")[0]["version"] == 1
+    assert query("SELECT title FROM calendar_events") == [{"title": "Exam"}]